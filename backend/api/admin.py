@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserFavorite
+from .models import UserFavorite, UserStats
 
 @admin.register(UserFavorite)
 class UserFavoriteAdmin(admin.ModelAdmin):
@@ -34,3 +34,14 @@ class UserFavoriteAdmin(admin.ModelAdmin):
         extra_context = extra_context or {}
         extra_context['total_count'] = UserFavorite.objects.count()
         return super().changelist_view(request, extra_context)
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'favorites_count', 'reviews_count', 'average_rating', 'updated_at']
+    search_fields = ['user__username']
+    list_select_related = ['user']
+    # Поддерживается автоматически (api.user_stats), исправляется командой recalculate_user_stats
+    readonly_fields = ['user', 'favorites_count', 'favorite_genres', 'favorite_authors', 'reviews_count',
+                       'rating_sum', 'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count',
+                       'rating_5_count', 'updated_at']
@@ -0,0 +1,150 @@
+"""
+Избранное: массовое добавление и удаление одним SQL-запросом и признак is_favorited в списках книг.
+
+Добавление - INSERT ... ON CONFLICT DO NOTHING (bulk_create(ignore_conflicts=True)), удаление -
+QuerySet.delete() (выборка и один DELETE): одновременные запросы одного пользователя не приводят
+к ошибкам уникальности и дублям. Кеш ответов, маркер избранного и статистика пользователя
+(api.user_stats) обновляются один раз на весь набор книг, а не обработчиками сигналов по каждой записи.
+
+is_favorited добавляется к готовому (в том числе взятому из кеша) списку книг одним запросом
+на страницу (список книг с признаком - api.views.BookListCreateAPIView). Маркер избранного - случайное значение в кеше, меняющееся при любом изменении
+избранного; он входит в ETag запросов с учётными данными, чтобы 304 не вернул устаревший признак.
+"""
+import contextvars
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from library import response_cache
+from library.models import Book
+from . import user_stats
+from .models import UserFavorite
+
+# Максимум книг в одном массовом запросе
+BULK_LIMIT = 500
+MARKER_KEY = 'favorites:marker'
+# Удаление внутри remove_favorites: обработчики post_delete (api.signals) пропускают такие записи
+_bulk_removal = contextvars.ContextVar('favorites_bulk_removal', default=False)
+
+
+def in_bulk_removal():
+    return _bulk_removal.get()
+
+
+def get_marker():
+    cache = response_cache.get_cache()
+    marker = cache.get(MARKER_KEY)
+    if marker is None:
+        cache.add(MARKER_KEY, uuid.uuid4().hex, None)
+        marker = cache.get(MARKER_KEY)
+    return marker
+
+
+def favorites_changed(using=None):
+    """Сбрасывает кеш ответов с избранным и маркер ETag после фиксации транзакции"""
+    response_cache.invalidate(UserFavorite, using=using)
+    transaction.on_commit(
+        lambda: response_cache.get_cache().set(MARKER_KEY, uuid.uuid4().hex, None), using=using
+    )
+
+
+def add_favorites(user, book_ids):
+    """
+    Добавляет книги в избранное (уже добавленные пропускаются).
+    Возвращает (id книг в избранном, id несуществующих книг).
+    """
+    requested = set(book_ids)
+    with transaction.atomic():
+        books = {
+            pk: (genre_id, author_id)
+            for pk, genre_id, author_id in Book.objects.filter(pk__in=requested).values_list('pk', 'genre_id', 'author_id')
+        }
+        if books:
+            # Строка статистики заблокирована: набор уже добавленных книг не изменится до конца транзакции
+            stats = user_stats.lock_stats(user.pk)
+            already = set(
+                UserFavorite.objects.filter(user=user, book_id__in=books).order_by().values_list('book_id', flat=True)
+            )
+            UserFavorite.objects.bulk_create(
+                [UserFavorite(user=user, book_id=book_id) for book_id in books], ignore_conflicts=True,
+            )
+            added = [books[book_id] for book_id in books if book_id not in already]
+            if added:
+                user_stats.favorite_delta(added, 1)(stats)
+                user_stats.save_stats(stats)
+                favorites_changed()
+    return sorted(books), sorted(requested - books.keys())
+
+
+def remove_favorites(user, book_ids):
+    """Удаляет книги из избранного; возвращает число удалённых записей"""
+    queryset = UserFavorite.objects.filter(user=user, book_id__in=set(book_ids))
+    with transaction.atomic(using=queryset.db):
+        stats = user_stats.lock_stats(user.pk, using=queryset.db)
+        books = list(queryset.values_list('book__genre_id', 'book__author_id'))
+        if not books:
+            return 0
+        # Сигналы post_delete отправляются, но статистику и кеш обновляем ниже одним изменением
+        token = _bulk_removal.set(True)
+        try:
+            removed, _ = queryset.delete()
+        finally:
+            _bulk_removal.reset(token)
+        user_stats.favorite_delta(books, -1)(stats)
+        user_stats.save_stats(stats, using=queryset.db)
+        favorites_changed(using=queryset.db)
+    return removed
+
+
+def favorited_ids(user, book_ids):
+    """Какие из книг есть в избранном пользователя (один запрос)"""
+    if not user.is_authenticated or not book_ids:
+        return set()
+    # Порядок не нужен: без order_by() SQLite сортирует результат по added_at (USE TEMP B-TREE)
+    favorites = UserFavorite.objects.filter(user=user, book_id__in=book_ids).order_by()
+    return set(favorites.values_list('book_id', flat=True))
+
+
+def _has_credentials(request):
+    return 'HTTP_AUTHORIZATION' in request.META or settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+class FavoritedFlagMixin:
+    """
+    Примесь для списков книг: признак is_favorited у каждой книги страницы (для анонимных
+    пользователей - False без запроса). Признак выбирается параметрами ?fields= / ?omit=
+    как обычное поле (library.fieldsets). Должна стоять в MRO перед CatalogConditionalMixin
+    (дополняет ETag) и CachedResponseMixin (кешируется общий для всех список).
+    """
+    # Для признака нужен id книги, даже если он не запрошен
+    extra_fields = {'is_favorited': ['id']}
+
+    def get_etag_variant(self, request):
+        variant = super().get_etag_variant(request)
+        if _has_credentials(request):
+            variant += get_marker()
+        return variant
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not self.wants_field('is_favorited'):
+            return response
+        data = response.data
+        rows = data.get('results') if isinstance(data, dict) else data
+        if not rows:
+            return response
+        favorited = favorited_ids(request.user, [row['id'] for row in rows])
+        # Новые словари: данные ответа могут быть взяты из общего кеша
+        if 'id' in self.get_requested_fields():
+            rows = [{**row, 'is_favorited': row['id'] in favorited} for row in rows]
+        else:
+            rows = [
+                {**{name: value for name, value in row.items() if name != 'id'}, 'is_favorited': row['id'] in favorited}
+                for row in rows
+            ]
+        if isinstance(data, dict):
+            data['results'] = rows
+        else:
+            response.data = rows
+        return response
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from library.management.drift import check_drift
+from api.models import UserStats
+from api.user_stats import STATS_FIELDS, compute_user_stats, empty_stats, recalculate_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику пользователей по избранному и отзывам и проверяет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить расхождения, ничего не изменяя')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='ID пользователя (можно указать несколько раз)')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['check']:
+            computed = compute_user_stats(user_ids)
+            rows = UserStats.objects.all()
+            if user_ids:
+                rows = rows.filter(pk__in=user_ids)
+            # Отсутствующие строки не ошибка: они рассчитываются по таблицам при первом обращении
+            check_drift(
+                self, rows.iterator(), lambda stats: computed.get(stats.pk) or empty_stats(), STATS_FIELDS,
+                label=lambda stats: f'[{stats.pk}]',
+                error='Расхождения найдены у пользователей',
+                success='Статистика пользователей совпадает с таблицами',
+            )
+            return
+
+        changed, created = recalculate_user_stats(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Статистика пользователей пересчитана, исправлено: {len(changed)}, создано: {len(created)}'
+        ))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_auto_20251024_1406'),
+        ('library', '0006_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfavorite',
+            index=models.Index(fields=['user', '-added_at', '-id'], name='favorite_user_added_id_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_keyset_pagination_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('favorites_count', models.PositiveIntegerField(default=0, verbose_name='Книг в избранном')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='Отзывов')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('rating_1_count', models.PositiveIntegerField(default=0, verbose_name='Оценок 1')),
+                ('rating_2_count', models.PositiveIntegerField(default=0, verbose_name='Оценок 2')),
+                ('rating_3_count', models.PositiveIntegerField(default=0, verbose_name='Оценок 3')),
+                ('rating_4_count', models.PositiveIntegerField(default=0, verbose_name='Оценок 4')),
+                ('rating_5_count', models.PositiveIntegerField(default=0, verbose_name='Оценок 5')),
+                ('favorite_genres', models.JSONField(blank=True, default=dict, verbose_name='Жанры избранного')),
+                ('favorite_authors', models.JSONField(blank=True, default=dict, verbose_name='Авторы избранного')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-from library.models import Book
+from library.models import Book, RATING_CHOICES
 
 
 # Модель избранных книг
@@ -12,10 +12,44 @@ class UserFavorite(models.Model):
     class Meta:
         unique_together = ['user', 'book']
         ordering = ['-added_at']
+        indexes = [
+            # Курсорная пагинация избранного пользователя: WHERE user_id = ? ORDER BY added_at DESC, id DESC
+            models.Index(fields=['user', '-added_at', '-id'], name='favorite_user_added_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"
 
 
+# Статистика пользователя: поддерживается при изменении избранного и отзывов (см. api.user_stats)
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    favorites_count = models.PositiveIntegerField(default=0, verbose_name="Книг в избранном")
+    reviews_count = models.PositiveIntegerField(default=0, verbose_name="Отзывов")
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="Сумма оценок")
+    rating_1_count = models.PositiveIntegerField(default=0, verbose_name="Оценок 1")
+    rating_2_count = models.PositiveIntegerField(default=0, verbose_name="Оценок 2")
+    rating_3_count = models.PositiveIntegerField(default=0, verbose_name="Оценок 3")
+    rating_4_count = models.PositiveIntegerField(default=0, verbose_name="Оценок 4")
+    rating_5_count = models.PositiveIntegerField(default=0, verbose_name="Оценок 5")
+    # id жанра/автора (строкой) -> количество книг в избранном
+    favorite_genres = models.JSONField(default=dict, blank=True, verbose_name="Жанры избранного")
+    favorite_authors = models.JSONField(default=dict, blank=True, verbose_name="Авторы избранного")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
 
+    class Meta:
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+    def __str__(self):
+        return f"{self.user_id}: избранное {self.favorites_count}, отзывы {self.reviews_count}"
+
+    @property
+    def average_rating(self):
+        if not self.reviews_count:
+            return None
+        return round(self.rating_sum / self.reviews_count, 2)
 
+    @property
+    def rating_histogram(self):
+        return {str(i): getattr(self, f'rating_{i}_count') for i, _ in RATING_CHOICES}
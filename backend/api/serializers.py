@@ -1,11 +1,21 @@
+from django.conf import settings
+from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from library import covers
+from library.expansion import ExpandableListSerializer, ExpandableSerializerMixin, ExpandedField
+from library.fast_serializers import FastBookRows
+from library.fieldsets import SparseFieldsetSerializerMixin
 from library.models import Author, Genre, Book, Review
+from library.serializers import BOOK_FIELD_REQUIREMENTS
+from .favorites import BULK_LIMIT
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для авторов"""
     books_count = serializers.SerializerMethodField()
+    # Количество книг - аннотация запроса, колонок не требует (см. AuthorViewSet.get_queryset)
+    sparse_requirements = {'books_count': []}
     
     class Meta:
         model = Author
@@ -13,12 +23,16 @@ class AuthorSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
     
     def get_books_count(self, obj):
+        # Во вьюсетах значение приходит из аннотации Count, отдельный запрос нужен только без неё
+        if hasattr(obj, 'books_count'):
+            return obj.books_count
         return obj.books.count()
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для жанров"""
     books_count = serializers.SerializerMethodField()
+    sparse_requirements = {'books_count': []}
     
     class Meta:
         model = Genre
@@ -26,37 +40,36 @@ class GenreSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
     
     def get_books_count(self, obj):
+        # Во вьюсетах значение приходит из аннотации Count, отдельный запрос нужен только без неё
+        if hasattr(obj, 'books_count'):
+            return obj.books_count
         return obj.books.count()
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для книг"""
     author_name = serializers.CharField(source='author.name', read_only=True)
     genre_name = serializers.CharField(source='genre.name', read_only=True)
-    average_rating = serializers.SerializerMethodField()
-    reviews_count = serializers.SerializerMethodField()
+    # Агрегаты рейтинга хранятся в самой книге и не требуют дополнительных запросов
+    average_rating = serializers.FloatField(read_only=True)
+    reviews_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    total_pages = serializers.IntegerField(source='text_pages', read_only=True)
     cover_image_url = serializers.SerializerMethodField()
+    cover_images = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
+    sparse_requirements = BOOK_FIELD_REQUIREMENTS
     
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'author', 'author_name', 'genre', 'genre_name',
             'publication_year', 'isbn', 'description', 'cover_image', 'file',
-            'cover_image_url', 'file_url',
-            'average_rating', 'reviews_count'
+            'cover_image_url', 'cover_images', 'file_url',
+            'average_rating', 'reviews_count', 'rating_histogram', 'total_pages'
         ]
         read_only_fields = ['id']
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
-        return None
-    
-    def get_reviews_count(self, obj):
-        return obj.reviews.count()
-
     def get_cover_image_url(self, obj):
         if not obj.cover_image:
             return None
@@ -64,6 +77,11 @@ class BookSerializer(serializers.ModelSerializer):
         url = obj.cover_image.url
         return request.build_absolute_uri(url) if request else url
 
+    def get_cover_images(self, obj):
+        # Копии обложки разных размеров и форматов (для <picture> и srcset)
+        request = self.context.get('request')
+        return covers.cover_images(obj, request.build_absolute_uri if request else str)
+
     def get_file_url(self, obj):
         if not obj.file:
             return None
@@ -72,19 +90,40 @@ class BookSerializer(serializers.ModelSerializer):
         return request.build_absolute_uri(url) if request else url
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+def load_books(ids, field):
+    """Книги для ?expand=book одним запросом (агрегаты рейтинга хранятся в самой книге)"""
+    queryset = Book.objects.filter(pk__in=ids)
+    request = field.context.get('request')
+    if settings.BOOKS_FAST_SERIALIZER:
+        rows = FastBookRows(BookSerializer, request)
+        return {row['id']: row for row in rows.to_representation(rows.values(queryset))}
+    serializer = BookSerializer(many=True, context=field.context)
+    # Привязка к отзыву: вложенная книга не подчиняется ?fields= списка отзывов
+    serializer.bind(field.field_name, field.parent)
+    return {book['id']: book for book in serializer.to_representation(queryset.select_related('author', 'genre'))}
+
+
+def load_users(ids, field):
+    """Публичные данные авторов отзывов для ?expand=user"""
+    return {user['id']: user for user in User.objects.filter(pk__in=ids).values('id', 'username')}
+
+
+class ReviewSerializer(ExpandableSerializerMixin, SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для отзывов"""
     book_title = serializers.CharField(source='book.title', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
-    book_detail = BookSerializer(source='book', read_only=True)  # Полная информация о книге только для чтения
+    # Книга и пользователь целиком - только по ?expand=book,user (см. library/expansion.py)
+    book_detail = ExpandedField('book', 'book_id', load_books)
+    user_detail = ExpandedField('user', 'user_id', load_users)
     
     class Meta:
         model = Review
         fields = [
-            'id', 'book', 'book_detail', 'book_title', 'user', 'user_name',
+            'id', 'book', 'book_detail', 'book_title', 'user', 'user_detail', 'user_name',
             'rating', 'comment', 'created_at'
         ]
         read_only_fields = ['id', 'user', 'created_at']
+        list_serializer_class = ExpandableListSerializer
     
     def create(self, validated_data):
         # Автоматически устанавливаем текущего пользователя
@@ -114,7 +153,6 @@ class BookDetailSerializer(BookSerializer):
 
 
 # Новые сериализаторы для профиля пользователя
-from django.contrib.auth.models import User
 from .models import (
     UserFavorite
 )
@@ -135,10 +173,27 @@ class UserFavoriteSerializer(serializers.ModelSerializer):
         read_only_fields = ['added_at']
 
 
+class FavoriteBooksSerializer(serializers.Serializer):
+    """Список книг для массового добавления/удаления из избранного"""
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=BULK_LIMIT,
+    )
+
+
 
 
 
 # Статистика пользователя
+class UserStatsTopItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+
+
 class UserStatsSerializer(serializers.Serializer):
     books_favorited = serializers.IntegerField()
-    reviews_written = serializers.IntegerField()
\ No newline at end of file
+    reviews_written = serializers.IntegerField()
+    average_rating = serializers.FloatField(allow_null=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField())
+    favorite_genres = UserStatsTopItemSerializer(many=True)
+    favorite_authors = UserStatsTopItemSerializer(many=True)
\ No newline at end of file
@@ -0,0 +1,82 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from library.models import Book, Review, reviews_bulk_changed
+from . import user_stats
+from .favorites import favorites_changed, in_bulk_removal
+from .models import UserFavorite
+
+
+# Изменение избранного сбрасывает кешированные ответы, зависящие от него, и маркер ETag списков книг
+@receiver(post_save, sender=UserFavorite)
+@receiver(post_delete, sender=UserFavorite)
+def invalidate_favorites_cache(sender, using, **kwargs):
+    # Массовое удаление (api.favorites.remove_favorites) сбрасывает кеш само, один раз
+    if not in_bulk_removal():
+        favorites_changed(using=using)
+
+
+# Поддержка статистики пользователя (см. api.user_stats); массовые операции обновляют её сами
+@receiver(post_save, sender=UserFavorite)
+def update_stats_on_favorite_save(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    if not created:
+        # Изменение записи избранного (например, в админке) - редкий случай, пересчитываем целиком
+        user_stats.recalculate_user_stats([instance.user_id], using=using)
+        return
+    book = Book.objects.using(using).filter(pk=instance.book_id).values_list('genre_id', 'author_id').first()
+    if book is not None:
+        user_stats.apply_change(instance.user_id, user_stats.favorite_delta([book], 1), using=using)
+
+
+@receiver(post_delete, sender=UserFavorite)
+def update_stats_on_favorite_delete(sender, instance, using, **kwargs):
+    if in_bulk_removal():
+        return
+    # При каскадном удалении книги избранное удаляется раньше самой книги
+    book = Book.objects.using(using).filter(pk=instance.book_id).values_list('genre_id', 'author_id').first()
+    if book is None:
+        user_stats.recalculate_user_stats([instance.user_id], using=using)
+        return
+    user_stats.apply_change(instance.user_id, user_stats.favorite_delta([book], -1), using=using)
+
+
+@receiver(post_save, sender=Review)
+def update_stats_on_review_save(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    if created:
+        user_stats.apply_change(instance.user_id, user_stats.review_delta(instance.rating, 1), using=using)
+        return
+    previous = getattr(instance, '_previous_rating_state', None)
+    if previous is None:
+        user_stats.recalculate_user_stats([instance.user_id], using=using)
+        return
+    _, old_rating, old_user_id = previous
+    if old_user_id != instance.user_id:
+        # Отзыв передан другому пользователю (админка, update()): оценка уходит у прежнего и
+        # появляется у нового; строки блокируются по возрастанию id, чтобы не было взаимоблокировок
+        changes = {
+            old_user_id: user_stats.review_delta(old_rating, -1),
+            instance.user_id: user_stats.review_delta(instance.rating, 1),
+        }
+        for user_id in sorted(changes):
+            user_stats.apply_change(user_id, changes[user_id], using=using)
+    elif old_rating != instance.rating:
+        def change(stats):
+            user_stats.review_delta(old_rating, -1)(stats)
+            user_stats.review_delta(instance.rating, 1)(stats)
+        user_stats.apply_change(instance.user_id, change, using=using)
+
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_review_delete(sender, instance, using, **kwargs):
+    previous = getattr(instance, '_previous_rating_state', None)
+    _, rating, user_id = previous or (None, instance.rating, instance.user_id)
+    user_stats.apply_change(user_id, user_stats.review_delta(rating, -1), using=using)
+
+
+@receiver(reviews_bulk_changed, sender=Review)
+def recalculate_stats_on_reviews_bulk_change(sender, user_ids, using, **kwargs):
+    # Массовые операции с отзывами (library.models.ReviewQuerySet): пересчёт затронутых пользователей
+    user_stats.recalculate_user_stats(user_ids, using=using)
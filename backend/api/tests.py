@@ -1,3 +1,175 @@
-from django.test import TestCase
+import io
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from library.models import Review, reviews_bulk_changed
+from library.tests import CatalogTestCase
+
+from . import favorites, user_stats
+from .models import UserFavorite, UserStats
+
+
+class FavoritesTests(CatalogTestCase):
+    """Массовые операции с избранным и признак is_favorited"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [cls.make_book(f'Книга {i}') for i in range(4)]
+        cls.user = cls.make_user()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def post(self, action, book_ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/user-favorites/{action}/', {'book_ids': book_ids},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def list_books(self, query=''):
+        return self.client.get(f'/api/books/{query}').json()['results']
+
+    def stored_stats(self):
+        return UserStats.objects.get(user=self.user).favorites_count
+
+    def test_bulk_add_and_remove(self):
+        ids = [book.pk for book in self.books]
+        self.assertEqual(self.post('bulk_add', ids[:3] + [999999]), {'favorited': ids[:3], 'not_found': [999999]})
+        self.assertEqual(self.post('bulk_add', ids[:3]), {'favorited': ids[:3], 'not_found': []})
+        self.assertEqual(self.stored_stats(), 3)
+
+        self.assertEqual(self.post('bulk_remove', ids[1:]), {'removed': 2})
+        self.assertEqual(list(UserFavorite.objects.values_list('book_id', flat=True)), ids[:1])
+        # Статистика обновлена один раз на набор, без повторного учёта обработчиками post_delete
+        self.assertEqual(self.stored_stats(), 1)
+        self.assertEqual(user_stats.compute_user_stats([self.user.pk])[self.user.pk]['favorites_count'], 1)
+        self.assertEqual(self.post('bulk_remove', ids[1:]), {'removed': 0})
+
+        # Обычное удаление по-прежнему обрабатывается сигналами
+        with self.captureOnCommitCallbacks(execute=True):
+            UserFavorite.objects.get().delete()
+        self.assertEqual(self.stored_stats(), 0)
+
+    def test_is_favorited_flag(self):
+        self.post('bulk_add', [self.books[1].pk])
+        flags = {book['id']: book['is_favorited'] for book in self.list_books()}
+        self.assertEqual(flags, {book.pk: book == self.books[1] for book in self.books})
+
+        # Признак выбирается через ?fields= как обычное поле, id для него не обязателен
+        rows = self.list_books('?fields=id,is_favorited')
+        self.assertEqual(set(rows[0]), {'id', 'is_favorited'})
+        rows = self.list_books('?fields=title,is_favorited')
+        self.assertEqual(set(rows[0]), {'title', 'is_favorited'})
+        self.assertEqual([row['is_favorited'] for row in rows], [book == self.books[1] for book in self.books])
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.list_books('?omit=is_favorited')
+        self.assertNotIn('is_favorited', rows[0])
+        self.assertFalse([query for query in queries if 'api_userfavorite' in query['sql']])
+        self.assertEqual(self.client.get('/api/books/?fields=secret').status_code, 400)
+
+    def test_flag_and_etag_follow_changes(self):
+        response = self.client.get('/api/books/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.post('bulk_add', [self.books[0].pk])
+        response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['is_favorited'])
+
+        self.client.logout()
+        self.assertFalse(any(book['is_favorited'] for book in self.list_books()))
+
+    def test_remove_favorites_restores_signal_handling(self):
+        favorites.add_favorites(self.user, [self.books[0].pk])
+        favorites.remove_favorites(self.user, [self.books[0].pk])
+        self.assertFalse(favorites.in_bulk_removal())
+
+
+class UserStatsTests(CatalogTestCase):
+    """Статистика пользователя и команда recalculate_user_stats"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [cls.make_book(f'Книга {i}') for i in range(3)]
+        cls.user = cls.make_user()
+
+    def stats(self):
+        return UserStats.objects.get(pk=self.user.pk)
+
+    def test_review_signals_and_bulk_operations(self):
+        user_stats.get_user_stats(self.user)
+        review = Review.objects.create(book=self.books[0], user=self.user, rating=4, comment='')
+        self.assertEqual((self.stats().reviews_count, self.stats().rating_4_count), (1, 1))
+
+        # Массовые операции не отправляют post_save: статистику пересчитывает получатель reviews_bulk_changed
+        Review.objects.bulk_create([
+            Review(book=book, user=self.user, rating=5, comment='') for book in self.books[1:]
+        ])
+        stats = self.stats()
+        self.assertEqual((stats.reviews_count, stats.rating_sum, stats.rating_5_count), (3, 14, 2))
+        Review.objects.filter(pk=review.pk).update(rating=1)
+        stats = self.stats()
+        self.assertEqual((stats.rating_sum, stats.rating_4_count, stats.rating_1_count), (11, 0, 1))
+
+        received = []
+        def receiver(sender, user_ids, using, **kwargs):
+            received.append((sender, set(user_ids), using))
+        reviews_bulk_changed.connect(receiver)
+        self.addCleanup(reviews_bulk_changed.disconnect, receiver)
+        Review.objects.filter(user=self.user).update(rating=3)
+        self.assertEqual(received, [(Review, {self.user.pk}, 'default')])
+
+    def test_review_moved_to_another_user(self):
+        other = self.make_user('other')
+        review = Review.objects.create(book=self.books[0], user=self.user, rating=4, comment='')
+        for user in (self.user, other):
+            user_stats.get_user_stats(user)
+
+        # Отзыв, переданный другому пользователю (например, в админке), вместе с новой оценкой
+        review.user = other
+        review.rating = 2
+        review.save()
+        stats = {user.pk: UserStats.objects.get(pk=user.pk) for user in (self.user, other)}
+        self.assertEqual((stats[self.user.pk].reviews_count, stats[self.user.pk].rating_4_count), (0, 0))
+        self.assertEqual((stats[other.pk].reviews_count, stats[other.pk].rating_sum), (1, 2))
+
+        # Удаление уже переданного отзыва с ещё не сохранённой сменой автора учитывается у автора в БД
+        review.user = self.user
+        review.delete()
+        self.assertEqual(UserStats.objects.get(pk=other.pk).reviews_count, 0)
+        self.assertEqual(self.stats().reviews_count, 0)
+        output = io.StringIO()
+        call_command('recalculate_user_stats', '--check', stdout=output)
+        self.assertIn('совпадает', output.getvalue())
+
+    def test_review_create_api_initializes_stats(self):
+        # Строки статистики ещё нет: создание отзыва через API создаёт её до вставки и учитывает отзыв
+        self.client.force_login(self.user)
+        data = {'book': self.books[0].pk, 'rating': 5, 'comment': 'x'}
+        self.assertEqual(self.client.post('/api/reviews/', data, content_type='application/json').status_code, 201)
+        stats = self.stats()
+        self.assertEqual((stats.reviews_count, stats.rating_5_count), (1, 1))
+        self.assertEqual(self.client.post('/api/reviews/', data, content_type='application/json').status_code, 400)
+        self.assertEqual(self.stats().reviews_count, 1)
+
+    def test_recalculate_user_stats_command(self):
+        Review.objects.create(book=self.books[0], user=self.user, rating=5, comment='')
+        user_stats.get_user_stats(self.user)
+        UserStats.objects.filter(pk=self.user.pk).update(reviews_count=7, favorites_count=2)
+
+        output = io.StringIO()
+        with self.assertRaisesMessage(CommandError, 'Расхождения найдены у пользователей: 1'):
+            call_command('recalculate_user_stats', '--check', stdout=output)
+        self.assertIn(f'[{self.user.pk}]: favorites_count: 2 != 0, reviews_count: 7 != 1', output.getvalue())
+
+        call_command('recalculate_user_stats', '--user', str(self.user.pk), stdout=io.StringIO())
+        self.assertEqual((self.stats().reviews_count, self.stats().favorites_count), (1, 0))
+        output = io.StringIO()
+        call_command('recalculate_user_stats', '--check', stdout=output)
+        self.assertIn('Статистика пользователей совпадает с таблицами', output.getvalue())
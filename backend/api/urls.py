@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
-    AuthorViewSet, GenreViewSet, ReviewViewSet,
+    AuthorViewSet, GenreViewSet, ReviewViewSet, BookListCreateAPIView,
     UserFavoriteViewSet, UserStatsViewSet
 )
 from library.views import RegisterView, ProfileView, LoginView, find_openlibrary_books
@@ -30,6 +30,9 @@ urlpatterns = [
     path('auth/profile/', ProfileView.as_view(), name='profile'),
     # Поиск книг через OpenLibrary API
     path('find_openlibrary_books/', find_openlibrary_books, name='find_openlibrary_books'),
+
+    # Список книг с признаком is_favorited (маршрут подключён раньше library.urls и заменяет его список)
+    path('books/', BookListCreateAPIView.as_view(), name='book-list-create'),
     
     # API маршруты через роутер
     path('', include(router.urls)),
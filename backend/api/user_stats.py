@@ -0,0 +1,147 @@
+"""
+Статистика пользователя (UserStats): избранное, отзывы, средняя оценка, гистограмма оценок,
+любимые жанры и авторы.
+
+Запись поддерживается приращениями при каждом изменении избранного и отзывов (сигналы
+api.signals и массовые операции api.favorites): строка статистики блокируется
+(SELECT ... FOR UPDATE), поэтому одновременные изменения одного пользователя не теряются.
+Чтение - одна строка по первичному ключу, без агрегирующих запросов.
+
+Строка создаётся расчётом по таблицам при первом изменении или чтении. Массовые операции
+с отзывами (ReviewQuerySet, сигнал library.models.reviews_bulk_changed) пересчитывают
+затронутых пользователей заново; прочие расхождения (например, после смены жанра книги)
+исправляет команда recalculate_user_stats.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from library.models import RATING_CHOICES, Review
+from .models import UserFavorite, UserStats
+
+RATING_FIELDS = ['reviews_count', 'rating_sum'] + [f'rating_{i}_count' for i, _ in RATING_CHOICES]
+FAVORITE_FIELDS = ['favorites_count', 'favorite_genres', 'favorite_authors']
+STATS_FIELDS = FAVORITE_FIELDS + RATING_FIELDS
+
+
+def empty_stats():
+    return {'favorites_count': 0, 'favorite_genres': {}, 'favorite_authors': {}, **dict.fromkeys(RATING_FIELDS, 0)}
+
+
+def _add_count(counts, key, delta):
+    key = str(key)
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def compute_user_stats(user_ids=None, using='default'):
+    """Статистика по таблицам: по одному сгруппированному запросу на отзывы и на избранное"""
+    result = defaultdict(empty_stats)
+    reviews = Review.objects.using(using).order_by()
+    favorites = UserFavorite.objects.using(using).order_by()
+    if user_ids is not None:
+        reviews = reviews.filter(user_id__in=user_ids)
+        favorites = favorites.filter(user_id__in=user_ids)
+
+    for row in reviews.values('user_id').annotate(
+        reviews_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{i}_count': Count('id', filter=Q(rating=i)) for i, _ in RATING_CHOICES},
+    ):
+        result[row.pop('user_id')].update(row)
+
+    # Группировка по (пользователь, жанр, автор) даёт и число книг, и оба распределения
+    for row in favorites.values('user_id', 'book__genre_id', 'book__author_id').annotate(books=Count('id')):
+        stats = result[row['user_id']]
+        stats['favorites_count'] += row['books']
+        _add_count(stats['favorite_genres'], row['book__genre_id'], row['books'])
+        _add_count(stats['favorite_authors'], row['book__author_id'], row['books'])
+    return dict(result)
+
+
+def lock_stats(user_id, using='default'):
+    """
+    Блокирует строку статистики до конца транзакции (создаёт её, если нет).
+    Вызывается внутри transaction.atomic до изменения избранного или отзывов.
+    """
+    stats = UserStats.objects.using(using).select_for_update().filter(pk=user_id).first()
+    if stats is None:
+        UserStats.objects.using(using).get_or_create(
+            pk=user_id, defaults=compute_user_stats([user_id], using=using).get(user_id, {}),
+        )
+        stats = UserStats.objects.using(using).select_for_update().get(pk=user_id)
+    return stats
+
+
+def save_stats(stats, using='default'):
+    stats.save(using=using, update_fields=[*STATS_FIELDS, 'updated_at'])
+
+
+def apply_change(user_id, change, using='default'):
+    """
+    Применяет change(stats) к статистике после уже выполненного изменения таблиц.
+    Если строки ещё нет, ничего не делается: она будет рассчитана по таблицам при создании
+    (в том числе не появится строка пользователя, который сейчас удаляется).
+    """
+    with transaction.atomic(using=using):
+        stats = UserStats.objects.using(using).select_for_update().filter(pk=user_id).first()
+        if stats is not None:
+            change(stats)
+            save_stats(stats, using=using)
+
+
+def favorite_delta(books, sign):
+    """Изменение для избранного; books - список (genre_id, author_id) добавленных или удалённых книг"""
+    def change(stats):
+        stats.favorites_count = max(stats.favorites_count + sign * len(books), 0)
+        for genre_id, author_id in books:
+            _add_count(stats.favorite_genres, genre_id, sign)
+            _add_count(stats.favorite_authors, author_id, sign)
+    return change
+
+
+def review_delta(rating, sign):
+    """Изменение для одной оценки (sign=1 - добавлена, -1 - удалена)"""
+    def change(stats):
+        field = f'rating_{rating}_count'
+        stats.reviews_count = max(stats.reviews_count + sign, 0)
+        stats.rating_sum = max(stats.rating_sum + sign * rating, 0)
+        setattr(stats, field, max(getattr(stats, field) + sign, 0))
+    return change
+
+
+def recalculate_user_stats(user_ids=None, using='default'):
+    """
+    Пересчитывает статистику указанных пользователей (или всех) по таблицам.
+    Возвращает (исправленные строки, созданные строки).
+    """
+    computed = compute_user_stats(user_ids, using=using)
+    rows = UserStats.objects.using(using)
+    if user_ids is not None:
+        rows = rows.filter(pk__in=user_ids)
+    changed, seen = [], set()
+    for stats in rows.iterator():
+        seen.add(stats.pk)
+        values = computed.get(stats.pk) or empty_stats()
+        if any(getattr(stats, field) != values[field] for field in STATS_FIELDS):
+            for field in STATS_FIELDS:
+                setattr(stats, field, values[field])
+            changed.append(stats)
+    UserStats.objects.using(using).bulk_update(changed, STATS_FIELDS, batch_size=500)
+    # Строки для пользователей с отзывами или избранным, у которых статистики ещё нет
+    created = [UserStats(pk=user_id, **values) for user_id, values in computed.items() if user_id not in seen]
+    UserStats.objects.using(using).bulk_create(created, batch_size=500, ignore_conflicts=True)
+    return changed, created
+
+
+def get_user_stats(user):
+    """Статистика для чтения: одна строка по первичному ключу"""
+    stats = UserStats.objects.filter(pk=user.pk).first()
+    if stats is None:
+        with transaction.atomic():
+            stats = lock_stats(user.pk)
+    return stats
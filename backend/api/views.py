@@ -4,22 +4,30 @@ from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, AllowAny, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
 from django.db.models import Q, Avg, Count
 from django.utils import timezone
 from library.models import Author, Genre, Review, Book
+from library.conditional import CatalogConditionalMixin
+from library.fieldsets import SparseFieldsetViewMixin
+from library.pagination import CatalogPagination
+from library.response_cache import CachedResponseMixin
+from library.views import BookListCreateAPIView as LibraryBookListCreateAPIView
 from .serializers import (
     AuthorSerializer, GenreSerializer, ReviewSerializer,
-    UserFavoriteSerializer, UserStatsSerializer
+    UserFavoriteSerializer, UserStatsSerializer, FavoriteBooksSerializer
 )
+from . import favorites, user_stats
 from .models import (
     UserFavorite
 )
 
 
-class AuthorViewSet(viewsets.ModelViewSet):
+class AuthorViewSet(CatalogConditionalMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """ViewSet для авторов"""
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
+    cache_dependencies = (Author, Book)
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['nationality']
@@ -27,32 +35,50 @@ class AuthorViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'birth_year']
     ordering = ['name']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Количество книг считаем только если поле запрошено (?fields= / ?omit=)
+        if self.wants_field('books_count'):
+            queryset = queryset.annotate(books_count=Count('books'))
+        return queryset
+    
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [AllowAny()]
         return [IsAdminUser()]
 
 
-class GenreViewSet(viewsets.ModelViewSet):
+class GenreViewSet(CatalogConditionalMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """ViewSet для жанров"""
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
+    cache_dependencies = (Genre, Book)
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name']
     ordering = ['name']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Количество книг считаем только если поле запрошено (?fields= / ?omit=)
+        if self.wants_field('books_count'):
+            queryset = queryset.annotate(books_count=Count('books'))
+        return queryset
+    
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [AllowAny()]
         return [IsAdminUser()]
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(CatalogConditionalMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """ViewSet для отзывов"""
+    # Название книги и имя пользователя - из соединения; книга целиком - по ?expand=book отдельным запросом
     queryset = Review.objects.select_related('book', 'user')
     serializer_class = ReviewSerializer
+    cache_dependencies = (Review, Book, Author, Genre)
+    pagination_class = CatalogPagination
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['book', 'rating']
@@ -60,14 +86,16 @@ class ReviewViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     
     def perform_create(self, serializer):
-        # Проверяем, не существует ли уже отзыв от этого пользователя на эту книгу
         book = serializer.validated_data.get('book')
         user = self.request.user
-        
-        if Review.objects.filter(book=book, user=user).exists():
-            raise ValidationError({'book': 'Вы уже оставили отзыв на эту книгу'})
-        
-        serializer.save(user=user)
+        # Строка статистики блокируется до вставки, как и для избранного (см. api.user_stats):
+        # иначе статистика, рассчитанная параллельно без нового отзыва, не получила бы приращения
+        with transaction.atomic():
+            user_stats.lock_stats(user.pk)
+            # Проверяем, не существует ли уже отзыв от этого пользователя на эту книгу
+            if Review.objects.filter(book=book, user=user).exists():
+                raise ValidationError({'book': 'Вы уже оставили отзыв на эту книгу'})
+            serializer.save(user=user)
     
     @action(detail=False, methods=['get'])
     def my_reviews(self, request):
@@ -81,17 +109,26 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
 
 
+class BookListCreateAPIView(favorites.FavoritedFlagMixin, LibraryBookListCreateAPIView):
+    """Список книг приложения library с признаком is_favorited (избранное хранится в приложении api)"""
 
-class UserFavoriteViewSet(viewsets.ModelViewSet):
+
+class UserFavoriteViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """ViewSet для избранных книг"""
     serializer_class = UserFavoriteSerializer
+    # Ответы кешируются отдельно для каждого пользователя (см. CachedResponseMixin.get_cache_variant)
+    cache_dependencies = (UserFavorite, Book, Author, Genre, Review)
     permission_classes = [IsAuthenticated]
+    pagination_class = CatalogPagination
     
     def get_queryset(self):
-        return UserFavorite.objects.filter(user=self.request.user)
+        return UserFavorite.objects.filter(user=self.request.user).select_related('book__author', 'book__genre')
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Строка статистики блокируется до вставки, как и в массовых операциях (см. api.user_stats)
+        with transaction.atomic():
+            user_stats.lock_stats(self.request.user.pk)
+            serializer.save(user=self.request.user)
     
     @action(detail=False, methods=['post'])
     def toggle(self, request):
@@ -99,30 +136,34 @@ class UserFavoriteViewSet(viewsets.ModelViewSet):
         book_id = request.data.get('book_id')
         if not book_id:
             return Response({'error': 'book_id required'}, status=status.HTTP_400_BAD_REQUEST)
-        
         try:
-            book = Book.objects.get(id=book_id)
-        except Book.DoesNotExist:
-            return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-        favorite, created = UserFavorite.objects.get_or_create(
-            user=request.user,
-            book=book
-        )
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'book_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not created:
-            favorite.delete()
+        # Сначала удаление одним DELETE: повторный или одновременный клик не создаёт дублей
+        if favorites.remove_favorites(request.user, [book_id]):
             return Response({'message': 'Removed from favorites'})
-        else:
-            return Response({'message': 'Added to favorites'})
-
-
-
-
-
-
-
-
+        _, not_found = favorites.add_favorites(request.user, [book_id])
+        if not_found:
+            return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': 'Added to favorites'})
+    
+    @action(detail=False, methods=['post'])
+    def bulk_add(self, request):
+        """Добавить в избранное список книг (уже добавленные пропускаются)"""
+        serializer = FavoriteBooksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        favorited, not_found = favorites.add_favorites(request.user, serializer.validated_data['book_ids'])
+        return Response({'favorited': favorited, 'not_found': not_found})
+    
+    @action(detail=False, methods=['post'])
+    def bulk_remove(self, request):
+        """Удалить из избранного список книг"""
+        serializer = FavoriteBooksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        removed = favorites.remove_favorites(request.user, serializer.validated_data['book_ids'])
+        return Response({'removed': removed})
 
 
 class UserStatsViewSet(viewsets.ViewSet):
@@ -130,19 +171,27 @@ class UserStatsViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     queryset = None  # ViewSet не требует queryset
     
+    # Сколько любимых жанров и авторов показывать
+    top_limit = 5
+    
     @action(detail=False, methods=['get'])
     def my_stats(self, request):
-        """Статистика текущего пользователя"""
-        user = request.user
-        
-        # Получаем статистику
-        books_favorited = UserFavorite.objects.filter(user=user).count()
-        reviews_written = Review.objects.filter(user=user).count()
-        
+        """Статистика текущего пользователя (хранится готовой, см. api.user_stats)"""
+        stats = user_stats.get_user_stats(request.user)
         stats_data = {
-            'books_favorited': books_favorited,
-            'reviews_written': reviews_written
+            'books_favorited': stats.favorites_count,
+            'reviews_written': stats.reviews_count,
+            'average_rating': stats.average_rating,
+            'rating_histogram': stats.rating_histogram,
+            'favorite_genres': self.top_items(Genre, stats.favorite_genres),
+            'favorite_authors': self.top_items(Author, stats.favorite_authors),
         }
-        
         serializer = UserStatsSerializer(stats_data)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+    
+    def top_items(self, model, counts):
+        """Самые частые жанры или авторы избранного с названиями (один запрос по первичным ключам)"""
+        top = sorted(((int(pk), count) for pk, count in counts.items()), key=lambda item: (-item[1], item[0]))
+        top = top[:self.top_limit]
+        names = model.objects.only('name').in_bulk([pk for pk, _ in top]) if top else {}
+        return [{'id': pk, 'name': names[pk].name, 'count': count} for pk, count in top if pk in names]
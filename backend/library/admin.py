@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Author, Genre, Book, Review
+from . import jobs
+from .models import Author, Genre, Book, Review, Job
 
 
 # Регистрация модели автор в админке с настройками отображения
@@ -20,11 +21,23 @@ class GenreAdmin(admin.ModelAdmin):
 # Регистрация модели Book в админке с настройками отображения
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'genre', 'publication_year', 'isbn']
+    list_display = ['title', 'author', 'genre', 'publication_year', 'isbn', 'average_rating', 'reviews_count']
     list_filter = ['genre', 'publication_year', 'author']
     search_fields = ['title', 'author__name', 'isbn']
     ordering = ['title']
-    readonly_fields = ['description']
+    readonly_fields = [
+        'description', 'rating_sum', 'reviews_count', 'rating_histogram',
+        'text_file', 'text_encoding', 'text_size', 'text_lines', 'text_sha256', 'text_pages',
+        'cover_derivatives',
+    ]
+    actions = ['reprocess_files']
+
+    @admin.action(description="Пересоздать текст и копии обложек (в фоне)")
+    def reprocess_files(self, request, queryset):
+        for book_id in queryset.values_list('pk', flat=True):
+            jobs.enqueue('library.normalize_book_text', {'book_id': book_id, 'force': True})
+            jobs.enqueue('library.update_cover_derivatives', {'book_id': book_id, 'force': True})
+        self.message_user(request, f"Поставлено в очередь книг: {queryset.count()}")
 
 # Регистрация модели отзывы в админке с настройками отображения
 @admin.register(Review)
@@ -33,3 +46,17 @@ class ReviewAdmin(admin.ModelAdmin):
     list_filter = ['rating', 'created_at']
     search_fields = ['book__title', 'user__username']
     ordering = ['-created_at']
+
+# Регистрация фоновых задач в админке (просмотр очереди и повтор неудачных задач)
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'priority', 'attempts', 'run_at', 'started_at', 'finished_at', 'locked_by']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'locked_by', 'attempts', 'last_error']
+    actions = ['retry_jobs']
+
+    @admin.action(description="Повторить выбранные задачи")
+    def retry_jobs(self, request, queryset):
+        self.message_user(request, f"Поставлено в очередь задач: {jobs.retry(queryset)}")
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        # Подключаем обработчики сигналов (агрегаты рейтинга и т.п.)
+        from . import signals  # noqa: F401
+        # Регистрируем фоновые задачи (library.jobs)
+        from . import tasks  # noqa: F401
@@ -0,0 +1,207 @@
+"""
+Сжатие ответов с выбором кодирования по Accept-Encoding (zstd, br, gzip).
+
+CompressionMiddleware сжимает JSON и текстовые ответы больше COMPRESSION_MIN_SIZE байт;
+потоковые ответы (StreamingHttpResponse, в том числе асинхронные) сжимаются по частям,
+без чтения всего содержимого в память. Не сжимаются ответы, у которых уже есть
+Content-Encoding (например, заранее сжатые тексты книг из download_txt), частичные
+ответы (206) и HTML-страницы (защита от BREACH для страниц с CSRF-токеном).
+
+brotli и zstandard - необязательные зависимости: без них остаются доступные кодирования.
+Те же кодеки используются для заранее сжатых копий текстов книг (library/textfiles.py).
+"""
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/(plain|css|csv|javascript|xml)|application/([\w.+-]*\+)?(json|javascript|xml)|image/svg\+xml)\b'
+)
+_CODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+# Кодирование -> (потоковый кодер, уровень для ответов, уровень для заранее сжатых файлов, расширение файла)
+CODECS = {'gzip': (_GzipEncoder, 6, 9, '.gz')}
+if brotli is not None:
+    CODECS['br'] = (_BrotliEncoder, 4, 11, '.br')
+if zstandard is not None:
+    CODECS['zstd'] = (_ZstdEncoder, 3, 19, '.zst')
+
+
+def available_encodings():
+    """Доступные кодирования в порядке предпочтения сервера"""
+    return [name for name in settings.COMPRESSION_ENCODINGS if name in CODECS]
+
+
+def get_encoder(encoding, precompressed=False):
+    encoder_class, level, precompressed_level, _ = CODECS[encoding]
+    return encoder_class(precompressed_level if precompressed else level)
+
+
+def file_suffix(encoding):
+    return CODECS[encoding][3]
+
+
+def compress(data, encoding):
+    encoder = get_encoder(encoding)
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_chunks(chunks, encoding, precompressed=False):
+    """Сжимает последовательность блоков байтов, не собирая её целиком"""
+    encoder = get_encoder(encoding, precompressed)
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def acompress_chunks(chunks, encoding):
+    encoder = get_encoder(encoding)
+    async for chunk in chunks:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def negotiate(accept_encoding, encodings=None):
+    """
+    Выбирает кодирование по Accept-Encoding (с учётом q-значений и «*»).
+    При равных q решает порядок encodings; None - сжимать не нужно.
+    """
+    encodings = available_encodings() if encodings is None else encodings
+    if not accept_encoding or not encodings:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        match = _CODING_RE.match(item)
+        if not match:
+            continue
+        try:
+            weights[match[1].lower()] = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _make_weak(etag):
+    # Сжатые байты отличаются от исходных, поэтому строгий ETag становится слабым (как в GZipMiddleware)
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов по Accept-Encoding (см. описание модуля). Работает и в синхронной,
+    и в асинхронной цепочке middleware: под ASGI ответ обрабатывается в цикле событий,
+    без переключения в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if not settings.COMPRESSION_ENABLED:
+            return response
+        if response.has_header('Content-Encoding') or response.status_code == 206 \
+                or response.has_header('Content-Range') or request.method == 'HEAD':
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_chunks(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_chunks(response.streaming_content, encoding)
+            # Длина сжатого потока заранее неизвестна
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Диапазоны поддерживаются только для несжатого представления
+        if response.get('Accept-Ranges') == 'bytes':
+            response.headers['Accept-Ranges'] = 'none'
+        if response.has_header('ETag'):
+            response.headers['ETag'] = _make_weak(response['ETag'])
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,86 @@
+"""
+Условные GET-запросы для каталога.
+
+Версия каталога (CatalogVersion) увеличивается после фиксации любой транзакции, изменившей
+книги, авторов, жанры или отзывы. ETag ответа строится из версии и варианта запроса
+(путь с параметрами, Accept и учётные данные). При совпадении If-None-Match ответ 304
+возвращается до аутентификации, выборки и сериализации: стоимость проверки - один запрос
+по первичному ключу. Last-Modified не отдаётся: у него секундная точность, и изменение
+в ту же секунду, что и предыдущий ответ, давало бы клиенту устаревшие данные с 304.
+"""
+import hashlib
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import CatalogVersion
+
+CATALOG_VERSION_PK = 1
+# Заголовки, от которых зависит содержимое ответа
+VARIANT_HEADERS = ('HTTP_ACCEPT', 'HTTP_ACCEPT_LANGUAGE', 'HTTP_AUTHORIZATION')
+
+
+def get_catalog_version():
+    version = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list('version', flat=True).first()
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK)[0].version
+    return version
+
+
+def bump_catalog_version(using=None):
+    """Увеличивает версию каталога после фиксации текущей транзакции"""
+    def bump():
+        updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK, defaults={'version': 1})
+    transaction.on_commit(bump, using=using)
+
+
+def _request_version(request):
+    # Версия читается один раз на запрос
+    if not hasattr(request, '_catalog_version'):
+        request._catalog_version = get_catalog_version()
+    return request._catalog_version
+
+
+def catalog_etag(request, *args, **kwargs):
+    version = _request_version(request)
+    variant = hashlib.sha1()
+    variant.update(request.get_full_path().encode())
+    for header in VARIANT_HEADERS:
+        variant.update(b'\0' + request.META.get(header, '').encode())
+    variant.update(b'\0' + request.COOKIES.get('sessionid', '').encode())
+    return f'{version}-{variant.hexdigest()[:16]}'
+
+
+catalog_condition = condition(etag_func=catalog_etag)
+
+
+class CatalogConditionalMixin:
+    """Примесь для представлений каталога: ETag и 304 для GET/HEAD"""
+
+    def get_etag_variant(self, request):
+        """Дополнительная часть ETag для ответов, зависящих не только от каталога"""
+        return ''
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        variant = self.get_etag_variant(request)
+        if variant:
+            check = condition(etag_func=lambda request, *args, **kwargs: f'{catalog_etag(request)}-{variant}')
+        else:
+            check = catalog_condition
+        response = check(super().dispatch)(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            # Ошибки (например, 503 читалки, пока строится индекс) не должны давать валидатор:
+            # иначе клиент получил бы 304 на содержимое, которого не видел
+            del response['ETag']
+            del response['Last-Modified']
+        patch_vary_headers(response, ('Accept', 'Accept-Language', 'Authorization', 'Cookie'))
+        return response
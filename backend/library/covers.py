@@ -0,0 +1,148 @@
+"""
+Производные изображения обложек книг.
+
+После загрузки обложки один раз создаются уменьшенные копии нескольких размеров
+(thumbnail, card, full) в форматах AVIF и WebP (если их поддерживает Pillow) и JPEG
+для старых браузеров. Копии лежат рядом с оригиналом: covers/<имя оригинала с расширением>.
+<размер>.<расширение>. Занятое имя хранилище заменяет свободным, поэтому чужие файлы (копии
+другой книги, оригинал с похожим именем) не перезаписываются, а удаляются только копии,
+перечисленные в прежних сведениях самой книги. Сведения о копиях хранятся в Book.cover_derivatives,
+поэтому сериализатор строит карту изображений и srcset без обращений к файловой системе.
+"""
+import io
+
+from PIL import Image, ImageOps, features
+
+# Размер -> максимальные ширина и высота (пропорции сохраняются, увеличение не выполняется)
+DERIVATIVE_SIZES = {
+    'thumbnail': (160, 240),
+    'card': (320, 480),
+    'full': (800, 1200),
+}
+# Формат -> (формат Pillow, расширение, параметры сохранения); порядок - от предпочтительного
+_FORMAT_OPTIONS = {
+    'avif': ('AVIF', 'avif', {'quality': 60, 'speed': 8}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+FORMATS = tuple(fmt for fmt in ('avif', 'webp') if features.check(fmt)) + ('jpeg',)
+
+
+def derivative_name(source_name, size, fmt):
+    # Полное имя оригинала: у covers/a.png и covers/a.jpg копии не совпадают
+    return f'{source_name}.{size}.{_FORMAT_OPTIONS[fmt][1]}'
+
+
+def _flatten(image):
+    # JPEG не поддерживает прозрачность - подкладываем белый фон
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    pil_format, _, options = _FORMAT_OPTIONS[fmt]
+    if fmt == 'jpeg':
+        image = _flatten(image)
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_derivatives(source_name, storage):
+    """
+    Создаёт все производные копии обложки в хранилище.
+    Возвращает сведения для Book.cover_derivatives.
+    """
+    from django.core.files.base import ContentFile
+
+    largest = max(DERIVATIVE_SIZES.values())
+    with storage.open(source_name, 'rb') as f:
+        image = Image.open(f)
+        # Для JPEG декодируем сразу с уменьшением - заметно быстрее для больших фото
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    sizes = {}
+    # От большего размера к меньшему: каждая копия уменьшается из предыдущей
+    for size, box in sorted(DERIVATIVE_SIZES.items(), key=lambda item: item[1], reverse=True):
+        image = image.copy()
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+        files = {}
+        for fmt in FORMATS:
+            # Если имя занято, save выбирает свободное; прежние копии книги удаляет apply_derivatives
+            name = derivative_name(source_name, size, fmt)
+            files[fmt] = storage.save(name, ContentFile(_encode(image, fmt)))
+        sizes[size] = {'width': image.width, 'height': image.height, 'files': files}
+    return {'source': source_name, 'sizes': sizes}
+
+
+def derivative_names(derivatives):
+    return {
+        name for info in (derivatives or {}).get('sizes', {}).values() for name in info['files'].values()
+    }
+
+
+def apply_derivatives(book, derivatives, save=True):
+    """Сохраняет сведения о копиях и удаляет файлы предыдущих копий"""
+    from .models import Book
+
+    storage = book.cover_image.storage
+    for name in derivative_names(book.cover_derivatives) - derivative_names(derivatives):
+        storage.delete(name)
+    book.cover_derivatives = derivatives
+    if save:
+        # update() не вызывает сигналы post_save и не перезаписывает остальные поля книги
+        Book.objects.filter(pk=book.pk).update(cover_derivatives=derivatives)
+
+
+def update_cover_derivatives(book, save=True):
+    """Создаёт копии обложки книги (или удаляет их, если обложки больше нет)"""
+    if book.cover_image:
+        derivatives = render_derivatives(book.cover_image.name, book.cover_image.storage)
+    else:
+        derivatives = {}
+    apply_derivatives(book, derivatives, save=save)
+    return derivatives
+
+
+def needs_update(book):
+    return (book.cover_image.name or '') != (book.cover_derivatives or {}).get('source', '')
+
+
+def cover_images(book, build_url):
+    """Карта копий обложки для API: {размер: {width, height, формат: url}, srcset: {формат: srcset}}"""
+    storage = book.cover_image.storage
+    return build_cover_images(book.cover_derivatives, lambda name: build_url(storage.url(name)))
+
+
+def build_cover_images(derivatives, url_for):
+    """Карта копий по сведениям Book.cover_derivatives; url_for(имя файла) возвращает URL"""
+    sizes = (derivatives or {}).get('sizes')
+    if not sizes:
+        return None
+    result = {}
+    srcset = {}
+    widths = set()
+    for size in DERIVATIVE_SIZES:
+        info = sizes.get(size)
+        if info is None:
+            continue
+        entry = {'width': info['width'], 'height': info['height']}
+        # Маленький оригинал даёт одинаковые копии - в srcset каждая ширина указывается один раз
+        unique_width = info['width'] not in widths
+        widths.add(info['width'])
+        for fmt, name in info['files'].items():
+            url = url_for(name)
+            entry[fmt] = url
+            if unique_width:
+                srcset.setdefault(fmt, []).append(f'{url} {info["width"]}w')
+        result[size] = entry
+    result['srcset'] = {fmt: ', '.join(items) for fmt, items in srcset.items()}
+    return result
@@ -0,0 +1,172 @@
+"""
+Чтение с реплик БД (DATABASE_REPLICAS) с "прилипанием" к основной БД после записи.
+
+ReplicaRoutingMiddleware выбирает для запроса одну реплику, если запрос безопасный
+(GET, HEAD, OPTIONS), обрабатывается представлением приложений DATABASE_REPLICA_APPS
+и клиент не закреплён за основной БД. PrimaryReplicaRouter направляет на неё чтение;
+запись, чтение внутри транзакции и всё вне запросов (команды, обработчик задач) -
+на основную БД (default).
+
+Read-your-writes: после успешного небезопасного запроса или запроса с записью клиент на
+DATABASE_REPLICA_PIN_SECONDS закрепляется за основной БД - по учётным данным (заголовок
+Authorization или сессия, метка в кеше, общая для процессов) и по cookie (для запросов без
+учётных данных). Значение должно быть больше задержки репликации. Закреплённый клиент не получает ответы из кеша ответов, а ответы,
+вычисленные по реплике, кешируются не дольше этого же времени (см. library.response_cache).
+"""
+import contextvars
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+PIN_KEY_PREFIX = 'dbpin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    """Маршрутизация текущего запроса"""
+
+    def __init__(self, pinned=False):
+        self.replica = None
+        self.pinned = pinned
+        self.wrote = False
+        self.used_replica = False
+
+
+def is_pinned():
+    """Текущий запрос закреплён за основной БД"""
+    state = _state.get()
+    return state is not None and state.pinned
+
+
+def used_replica():
+    """В текущем запросе было чтение с реплики"""
+    state = _state.get()
+    return state is not None and state.used_replica
+
+
+def _pin_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return f'{PIN_KEY_PREFIX}:{hashlib.sha1(credentials.encode()).hexdigest()}'
+
+
+def _request_pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = _pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+async def _arequest_pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = _pin_key(request)
+    return key is not None and await cache.aget(key) is not None
+
+
+def _needs_pin(request, response, state):
+    # Запись с явным using= или без ORM роутер не видит, поэтому учитывается и сам метод
+    return state.wrote or (request.method not in SAFE_METHODS and response.status_code < 400)
+
+
+def _pin(request, response):
+    seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+    key = _pin_key(request)
+    if key is not None:
+        cache.set(key, 1, seconds)
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+
+
+async def _apin(request, response):
+    seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+    key = _pin_key(request)
+    if key is not None:
+        await cache.aset(key, 1, seconds)
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+
+
+class PrimaryReplicaRouter:
+    """Роутер БД: чтение - на реплику, выбранную ReplicaRoutingMiddleware, остальное - на default"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        # Чтение внутри транзакции должно видеть её изменения и блокировки
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        state.used_replica = True
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Явно: иначе объект, прочитанный с реплики, сохранялся бы в неё же (instance._state.db)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Выбор реплики для безопасных запросов и закрепление клиента за основной БД после записи.
+    Работает и в синхронном (WSGI), и в асинхронном (ASGI) стеке: состояние маршрутизации
+    хранится в contextvar и видно представлениям, выполняемым через sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = RoutingState(pinned=_request_pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+            if _needs_pin(request, response, state):
+                _pin(request, response)
+            return response
+        finally:
+            _state.reset(token)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        state = RoutingState(pinned=await _arequest_pinned(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+            if _needs_pin(request, response, state):
+                await _apin(request, response)
+            return response
+        finally:
+            _state.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is None or state.pinned or request.method not in SAFE_METHODS:
+            return None
+        if view_func.__module__.partition('.')[0] in settings.DATABASE_REPLICA_APPS:
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return None
@@ -0,0 +1,104 @@
+"""
+Раскрытие связанных объектов по запросу: ?expand=book,user.
+
+Связанный объект попадает в ответ (полем ExpandedField) только если он указан в ?expand=.
+Объекты загружаются пачкой для всей страницы: ExpandableListSerializer собирает
+идентификаторы всех элементов, загрузчик поля получает их без повторов и строит
+представление каждого объекта один раз, даже если на него ссылаются многие элементы.
+Как и ?fields=, раскрытие действует только на сериализатор верхнего уровня.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+EXPAND_PARAM = 'expand'
+
+
+def select_expansions(names, request):
+    """Множество раскрываемых связей из ?expand= (неизвестные имена - ошибка 400)"""
+    if request is None:
+        return set()
+    params = request.query_params if hasattr(request, 'query_params') else request.GET
+    requested = {name.strip() for name in params.get(EXPAND_PARAM, '').split(',') if name.strip()}
+    unknown = sorted(requested - set(names))
+    if unknown:
+        raise ValidationError({EXPAND_PARAM: f'Нельзя раскрыть: {", ".join(unknown)}'})
+    return requested
+
+
+class ExpandedField(serializers.Field):
+    """
+    Поле со связанным объектом, раскрываемым по ?expand=<expand_name>.
+    loader(ids, field) возвращает словарь id -> представление объекта.
+    """
+
+    def __init__(self, expand_name, key, loader, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.expand_name = expand_name
+        self.key = key
+        self.loader = loader
+
+    def to_representation(self, instance):
+        object_id = getattr(instance, self.key)
+        if object_id is None:
+            return None
+        return self.parent.get_expanded(self, [object_id]).get(object_id)
+
+
+class ExpandableSerializerMixin:
+    """Примесь для ModelSerializer с полями ExpandedField"""
+
+    @classmethod
+    def get_expansion_requirements(cls, request):
+        """Колонки ключей раскрываемых связей (для .only() в library.fieldsets)"""
+        fields = [field for field in cls._declared_fields.values() if isinstance(field, ExpandedField)]
+        requested = select_expansions([field.expand_name for field in fields], request)
+        return {field.key for field in fields if field.expand_name in requested}
+
+    def _expanded_fields(self, fields):
+        return {name: field for name, field in fields.items() if isinstance(field, ExpandedField)}
+
+    def _is_top_level(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = self._expanded_fields(fields)
+        if not expandable:
+            return fields
+        requested = set()
+        if self._is_top_level():
+            names = [field.expand_name for field in expandable.values()]
+            requested = select_expansions(names, self.context.get('request'))
+        return {
+            name: field for name, field in fields.items()
+            if name not in expandable or expandable[name].expand_name in requested
+        }
+
+    def get_expanded(self, field, ids):
+        """Представления связанных объектов; недостающие загружаются одним запросом"""
+        if not hasattr(self, '_expanded_cache'):
+            self._expanded_cache = {}
+        loaded = self._expanded_cache.setdefault(field.field_name, {})
+        missing = {object_id for object_id in ids if object_id not in loaded}
+        if missing:
+            loaded.update(dict.fromkeys(missing))
+            loaded.update(field.loader(sorted(missing), field))
+        return loaded
+
+    def prefetch_expanded(self, instances):
+        for field in self._expanded_fields(self.fields).values():
+            ids = {getattr(instance, field.key) for instance in instances}
+            ids.discard(None)
+            self.get_expanded(field, ids)
+
+
+class ExpandableListSerializer(serializers.ListSerializer):
+    """ListSerializer, загружающий раскрываемые объекты сразу для всех элементов"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prefetch_expanded(items)
+        return super().to_representation(items)
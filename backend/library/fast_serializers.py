@@ -0,0 +1,143 @@
+"""
+Быстрая сериализация списков книг.
+
+BookSerializer тратит основное время на обработку каждого поля DRF, вызовы
+SerializerMethodField и request.build_absolute_uri для каждого URL каждой строки.
+FastBookRows строит те же словари из строк .values(): набор колонок и функции
+преобразования для каждого поля собираются один раз, а абсолютный адрес хранилища
+(MEDIA_URL) вычисляется один раз на запрос. Результат совпадает с выводом
+BookSerializer побайтно (проверка: python manage.py benchmark_book_serializer).
+
+Используется только для чтения списков; создание и изменение книг идут через обычный сериализатор.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework.response import Response
+
+from . import covers, metrics
+from .models import Book, RATING_CHOICES
+
+_HISTOGRAM_COLUMNS = [(str(i), f'rating_{i}_count') for i, _ in RATING_CHOICES]
+
+
+def _column(name):
+    def build(rows):
+        return lambda row: row[name]
+    return [name], build
+
+
+def _file_url(name):
+    def build(rows):
+        url_for = rows.url_builder(name)
+        return lambda row: url_for(row[name]) if row[name] else None
+    return [name], build
+
+
+def _average_rating(rows):
+    # Как Book.average_rating
+    return lambda row: round(row['rating_sum'] / row['reviews_count'], 1) if row['reviews_count'] else None
+
+
+def _rating_histogram(rows):
+    return lambda row: {key: row[column] for key, column in _HISTOGRAM_COLUMNS}
+
+
+def _cover_images(rows):
+    url_for = rows.url_builder('cover_image')
+    return lambda row: covers.build_cover_images(row['cover_derivatives'], url_for)
+
+
+# Поле сериализатора -> (колонки .values(), фабрика функции строка -> значение)
+FIELD_BUILDERS = {
+    'id': _column('id'),
+    'title': _column('title'),
+    'author': _column('author_id'),
+    'author_name': _column('author__name'),
+    'genre': _column('genre_id'),
+    'genre_name': _column('genre__name'),
+    'publication_year': _column('publication_year'),
+    'isbn': _column('isbn'),
+    'description': _column('description'),
+    'cover_image': _file_url('cover_image'),
+    'cover_image_url': _file_url('cover_image'),
+    'cover_images': (['cover_derivatives'], _cover_images),
+    'file': _file_url('file'),
+    'file_url': _file_url('file'),
+    'average_rating': (['rating_sum', 'reviews_count'], _average_rating),
+    'reviews_count': _column('reviews_count'),
+    'rating_histogram': ([column for _, column in _HISTOGRAM_COLUMNS], _rating_histogram),
+    'total_pages': _column('text_pages'),
+}
+
+
+class FastBookRows:
+    """Сериализация книг из .values() с тем же результатом, что у serializer_class"""
+
+    def __init__(self, serializer_class, request=None, fields=None):
+        # Порядок полей - как в сериализаторе, независимо от порядка в fields
+        names = serializer_class.Meta.fields
+        requested = set(names if fields is None else fields)
+        self.fields = [name for name in names if name in requested]
+        unknown = requested - FIELD_BUILDERS.keys()
+        if unknown:
+            raise ValueError(f'Поля без быстрой сериализации: {", ".join(sorted(unknown))}')
+        self.request = request
+        self._media_bases = {}
+        columns = {'id': None}
+        for field in self.fields:
+            columns.update(dict.fromkeys(FIELD_BUILDERS[field][0]))
+        self.columns = list(columns)
+        self.getters = [(field, FIELD_BUILDERS[field][1](self)) for field in self.fields]
+
+    @classmethod
+    def supports(cls, serializer_class, fields=None):
+        return set(fields if fields is not None else serializer_class.Meta.fields) <= FIELD_BUILDERS.keys()
+
+    def values(self, queryset, extra=()):
+        # Фильтры и сортировка queryset сохраняются, select_related для .values() не нужен;
+        # extra - дополнительные колонки (например, ключ курсорной пагинации)
+        return queryset.values(*self.columns, *(column for column in extra if column not in self.columns))
+
+    def url_builder(self, field_name):
+        """Функция имя файла -> абсолютный URL, как FieldFile.url + request.build_absolute_uri"""
+        storage = Book._meta.get_field(field_name).storage
+        if isinstance(storage, FileSystemStorage):
+            base = self._media_bases.get(storage.base_url)
+            if base is None:
+                base = self.request.build_absolute_uri(storage.base_url) if self.request else storage.base_url
+                self._media_bases[storage.base_url] = base
+            # FileSystemStorage.url: urljoin(base_url, filepath_to_uri(name).lstrip('/'))
+            return lambda name: base + filepath_to_uri(name).lstrip('/')
+        if self.request:
+            return lambda name: self.request.build_absolute_uri(storage.url(name))
+        return storage.url
+
+    def to_representation(self, rows):
+        getters = self.getters
+        with metrics.timed('serializer'):
+            return [{field: getter(row) for field, getter in getters} for row in rows]
+
+
+class FastBookListMixin:
+    """Примесь для списков книг: GET отдаётся через FastBookRows (если поля это позволяют)"""
+
+    def get_fast_rows(self):
+        serializer_class = self.get_serializer_class()
+        # Поля с учётом ?fields= / ?omit= (library.fieldsets), если представление их поддерживает
+        fields = self.get_selected_fields() if hasattr(self, 'get_selected_fields') else None
+        if not settings.BOOKS_FAST_SERIALIZER or not FastBookRows.supports(serializer_class, fields):
+            return None
+        return FastBookRows(serializer_class, self.request, fields=fields)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_fast_rows()
+        if rows is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        extra = self.get_ordering_attnames(queryset) if hasattr(self, 'get_ordering_attnames') else ()
+        queryset = rows.values(queryset, extra)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.to_representation(page))
+        return Response(rows.to_representation(queryset))
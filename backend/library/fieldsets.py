@@ -0,0 +1,171 @@
+"""
+Частичные представления (sparse fieldsets): ?fields=id,title и ?omit=description.
+
+SparseFieldsetSerializerMixin убирает из ответа незапрошенные поля (только для чтения
+и только у сериализатора верхнего уровня - вложенные сериализаторы не затрагиваются).
+SparseFieldsetViewMixin сокращает и сам запрос: в .only() попадают лишь колонки нужных
+полей, select_related - лишь нужные связи, а агрегаты можно добавлять только при запросе
+поля (см. wants_field).
+
+Колонки поля определяются по его source; для полей, которые читают несколько колонок
+или вычисляются в методах, они указываются в sparse_requirements сериализатора
+(поле -> список путей ORM, None - поле нельзя сократить, запрос остаётся полным).
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import SAFE_METHODS
+
+from . import metrics
+from .expansion import ExpandedField
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def select_fields(names, request, extra=()):
+    """
+    Поля (в исходном порядке), оставшиеся после ?fields= и ?omit=.
+    extra - поля, которые добавляет к ответу само представление (их можно запрашивать наравне с полями names).
+    """
+    names = list(names) + [name for name in extra if name not in names]
+    if request is None or request.method not in SAFE_METHODS:
+        return names
+    params = request.query_params if hasattr(request, 'query_params') else request.GET
+    only = _split(params.get(FIELDS_PARAM, ''))
+    omit = _split(params.get(OMIT_PARAM, ''))
+    if not only and not omit:
+        return names
+    unknown = sorted(set(only + omit) - set(names))
+    if unknown:
+        raise ValidationError({
+            FIELDS_PARAM if set(unknown) & set(only) else OMIT_PARAM: f'Неизвестные поля: {", ".join(unknown)}'
+        })
+    selected = set(only) if only else set(names)
+    return [name for name in names if name in selected and name not in omit]
+
+
+class SparseFieldsetSerializerMixin:
+    """Примесь для ModelSerializer: поддержка ?fields= и ?omit="""
+    sparse_requirements = {}
+
+    def _is_top_level(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_top_level():
+            return fields
+        # Раскрываемые поля (library.expansion) выбираются параметром ?expand=, а не ?fields=
+        names = [name for name, field in fields.items() if not isinstance(field, ExpandedField)]
+        view = self.context.get('view')
+        if isinstance(view, SparseFieldsetViewMixin) and view.get_serializer_class() is type(self):
+            # Выбор представления учитывает поля, нужные его собственным полям (extra_fields)
+            selected = [name for name in view.get_selected_fields() if name in names]
+        else:
+            selected = select_fields(names, self.context.get('request'))
+        if len(selected) == len(names):
+            return fields
+        selected = set(selected)
+        return {name: field for name, field in fields.items() if name in selected or name not in names}
+
+    def to_representation(self, instance):
+        with metrics.timed('serializer'):
+            return super().to_representation(instance)
+
+    @classmethod
+    def get_field_requirements(cls, names):
+        """Пути ORM для .only() или None, если запрос сократить нельзя"""
+        model = cls.Meta.model
+        declared = cls._declared_fields
+        paths = set()
+        for name in names:
+            if name in cls.sparse_requirements:
+                required = cls.sparse_requirements[name]
+                if required is None:
+                    return None
+                paths.update(required)
+                continue
+            field = declared.get(name)
+            if isinstance(field, serializers.SerializerMethodField):
+                return None
+            source = field.source if field is not None and field.source else name
+            path = source.replace('.', '__')
+            try:
+                model._meta.get_field(path.split('__')[0])
+            except FieldDoesNotExist:
+                # Свойство модели без описания в sparse_requirements
+                return None
+            paths.add(path)
+        return paths
+
+
+class SparseFieldsetViewMixin:
+    """Примесь для представлений DRF: сокращает запрос до колонок запрошенных полей"""
+    # Поля, которые добавляет к ответу само представление, а не сериализатор:
+    # имя -> поля сериализатора, нужные для его вычисления
+    extra_fields = {}
+
+    def get_all_fields(self):
+        if not hasattr(self, '_all_fields'):
+            self._all_fields = list(self.get_serializer_class()().fields)
+        return self._all_fields
+
+    def get_requested_fields(self):
+        """Запрошенные поля ответа, включая extra_fields"""
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = select_fields(self.get_all_fields(), self.request, extra=self.extra_fields)
+        return self._requested_fields
+
+    def get_selected_fields(self):
+        """Поля сериализатора: запрошенные и нужные запрошенным extra_fields"""
+        if not hasattr(self, '_selected_fields'):
+            requested = set(self.get_requested_fields())
+            for name, required in self.extra_fields.items():
+                if name in requested:
+                    requested.update(required)
+            self._selected_fields = [name for name in self.get_all_fields() if name in requested]
+        return self._selected_fields
+
+    def wants_field(self, name):
+        return name in self.get_requested_fields()
+
+    def get_ordering_attnames(self, queryset):
+        """Колонки сортировки: они нужны курсорной пагинации и не должны откладываться"""
+        ordering = OrderingFilter().get_ordering(self.request, queryset, self) or queryset.query.order_by \
+            or queryset.model._meta.ordering
+        names = set()
+        for name in ordering or ():
+            name = name.lstrip('-')
+            try:
+                names.add(queryset.model._meta.get_field(name).attname)
+            except FieldDoesNotExist:
+                continue
+        return names
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        selected = self.get_selected_fields()
+        if len(selected) == len(self.get_all_fields()) or not hasattr(serializer_class, 'get_field_requirements'):
+            return queryset
+        paths = serializer_class.get_field_requirements(selected)
+        if paths is None:
+            return queryset
+        paths |= self.get_ordering_attnames(queryset)
+        if hasattr(serializer_class, 'get_expansion_requirements'):
+            paths |= serializer_class.get_expansion_requirements(self.request)
+        # Связи, к полям которых обращаются запрошенные поля, загружаем тем же запросом, остальные - не соединяем
+        relations = {path.rsplit('__', 1)[0] for path in paths if '__' in path}
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*paths)
@@ -0,0 +1,151 @@
+"""
+Очередь фоновых задач в базе данных (без внешнего брокера).
+
+Задача - функция, зарегистрированная декоратором @task('имя'); параметры передаются
+именованными аргументами из JSON. enqueue() создаёт строку Job в текущей транзакции:
+задача станет видна обработчику только после фиксации изменений, ради которых она создана.
+
+Обработчики (python manage.py runworker) выбирают задачи:
+- на PostgreSQL - SELECT ... FOR UPDATE SKIP LOCKED, несколько обработчиков не мешают друг другу;
+- на СУБД без SKIP LOCKED (SQLite) - условным UPDATE ... WHERE status = 'queued'
+  (задачу получает тот, чьё обновление затронуло строку).
+
+Неудачная задача повторяется с экспоненциальной задержкой до max_attempts попыток.
+При JOBS_EAGER = True задачи выполняются сразу после фиксации транзакции (для разработки).
+"""
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+_registry = {}
+
+
+def task(name):
+    """Регистрирует функцию как фоновую задачу"""
+    def decorator(func):
+        _registry[name] = func
+        func.task_name = name
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'Неизвестная задача: {name}') from None
+
+
+def enqueue(name, payload=None, *, priority=0, delay=None, max_attempts=None):
+    """Ставит задачу в очередь; возвращает Job (или None при JOBS_EAGER)"""
+    get_task(name)
+    payload = payload or {}
+    if settings.JOBS_EAGER:
+        # robust: ошибка задачи записывается в лог и не прерывает запрос
+        transaction.on_commit(lambda: get_task(name)(**payload), using=router.db_for_write(Job), robust=True)
+        return None
+    return Job.objects.create(
+        task=name,
+        payload=payload,
+        priority=priority,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def _claimable(now):
+    return Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+
+
+def claim_jobs(worker_id, limit=1):
+    """Забирает до limit готовых к выполнению задач и помечает их выполняемыми"""
+    now = timezone.now()
+    claimed_fields = {
+        'status': Job.RUNNING, 'started_at': now, 'locked_by': worker_id, 'attempts': F('attempts') + 1,
+    }
+    connection = connections[router.db_for_write(Job)]
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=connection.alias):
+            ids = list(_claimable(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            if ids:
+                Job.objects.filter(id__in=ids).update(**claimed_fields)
+    else:
+        ids = []
+        # Кандидатов берём с запасом: часть может перехватить другой обработчик
+        for job_id in _claimable(now).values_list('id', flat=True)[:limit * 2]:
+            if Job.objects.filter(id=job_id, status=Job.QUEUED).update(**claimed_fields):
+                ids.append(job_id)
+                if len(ids) >= limit:
+                    break
+    if not ids:
+        return []
+    jobs = Job.objects.in_bulk(ids)
+    return [jobs[job_id] for job_id in ids]
+
+
+def execute(name, payload):
+    """
+    Выполняет задачу (в потоке или дочернем процессе обработчика).
+    Возвращает (успех, текст ошибки, длительность в секундах).
+    """
+    started = time.perf_counter()
+    try:
+        get_task(name)(**payload)
+        return True, '', time.perf_counter() - started
+    except Exception:
+        return False, traceback.format_exc(), time.perf_counter() - started
+    finally:
+        close_old_connections()
+
+
+def retry_delay(attempt):
+    """Экспоненциальная задержка с разбросом, чтобы повторы не совпадали по времени"""
+    delay = min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempt - 1), settings.JOBS_RETRY_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def complete_job(job, success, error=''):
+    """
+    Сохраняет результат выполнения; возвращает итоговый статус задачи или None,
+    если задача уже не принадлежит этому обработчику (requeue_stale вернул её в очередь
+    и её забрал другой обработчик) - тогда чужое состояние не перезаписывается.
+    """
+    now = timezone.now()
+    # attempts в условии отличает эту попытку от повторной выдачи задачи тому же обработчику
+    owned = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by, attempts=job.attempts)
+    if success:
+        status, fields = Job.DONE, {'finished_at': now, 'last_error': ''}
+    elif job.attempts >= job.max_attempts:
+        status, fields = Job.FAILED, {'finished_at': now, 'last_error': error}
+    else:
+        status, fields = Job.QUEUED, {'run_at': now + retry_delay(job.attempts), 'locked_by': '', 'last_error': error}
+    if not owned.update(status=status, **fields):
+        return None
+    return status
+
+
+def requeue_stale(timeout=None):
+    """Возвращает в очередь задачи, «зависшие» у аварийно завершившихся обработчиков"""
+    timeout = timeout if timeout is not None else settings.JOBS_TIMEOUT
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=timeout))
+    error = 'Превышено время выполнения (обработчик остановлен?)'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=timezone.now(), last_error=error,
+    )
+    requeued = stale.update(status=Job.QUEUED, run_at=timezone.now(), locked_by='', last_error=error)
+    return requeued, failed
+
+
+def retry(queryset):
+    """Повторно ставит задачи в очередь (действие админки)"""
+    return queryset.exclude(status=Job.RUNNING).update(
+        status=Job.QUEUED, attempts=0, run_at=timezone.now(), locked_by='', finished_at=None,
+    )
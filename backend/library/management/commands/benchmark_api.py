@@ -0,0 +1,387 @@
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.favorites import favorites_changed
+from api.models import UserFavorite, UserStats
+from library import compression, response_cache
+from library.conditional import bump_catalog_version
+from library.models import Author, Book, Genre, Review
+from library.textfiles import PAGE_INDEX_SUFFIX, normalize_book_text, precompressed_path
+
+# Все тестовые данные помечены префиксом: их можно найти и удалить, не затрагивая остальной каталог
+PREFIX = 'bench_api'
+PASSWORD = 'bench-api-password'
+
+# Сценарии: имя -> (метод, адрес, тело запроса, нужен ли токен доступа).
+# Подстановки: {book}, {genre}, {username}, {refresh}, {text_file} - выбираются для каждого запроса
+SCENARIOS = {
+    'books': ('GET', '/api/books/', None, False),
+    'books_by_genre': ('GET', '/api/books/?genre={genre}', None, False),
+    'book_detail': ('GET', '/api/books/{book}/', None, False),
+    'reviews_by_book': ('GET', '/api/reviews/?book={book}&expand=book', None, False),
+    'favorites': ('GET', '/api/user-favorites/', None, True),
+    'favorites_toggle': ('POST', '/api/user-favorites/toggle/', {'book_id': '{book}'}, True),
+    'token': ('POST', '/api/auth/token/', {'username': '{username}', 'password': PASSWORD}, False),
+    'token_refresh': ('POST', '/api/auth/token/refresh/', {'refresh': '{refresh}'}, False),
+    'download_txt': ('GET', '/media/{text_file}', None, False),
+}
+
+# Число SQL-запросов из заголовка Server-Timing (library.metrics)
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    if not values:
+        return None
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=settings.BASE_DIR,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _fill(value, values):
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    if isinstance(value, str):
+        filled = value.format(**values)
+        return int(filled) if filled.isdigit() and value != filled else filled
+    return value
+
+
+class InProcessTransport:
+    """Запросы через тестовый клиент Django: полный стек middleware без сети"""
+
+    def __init__(self, accept_encoding):
+        self.client = Client(raise_request_exception=False, HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    def send(self, method, path, body, token):
+        extra = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        data = json.dumps(body) if body is not None else ''
+        response = self.client.generic(method, path, data, content_type='application/json', **extra)
+        size = sum(map(len, response.streaming_content)) if response.streaming else len(response.content)
+        return response.status_code, size, response.get('Server-Timing', '')
+
+    def close(self):
+        # У каждого потока своё подключение к БД
+        connections.close_all()
+
+
+class HTTPTransport:
+    """Запросы к запущенному серверу (runserver, gunicorn, uvicorn)"""
+
+    def __init__(self, base_url, accept_encoding):
+        import httpx
+
+        self.client = httpx.Client(base_url=base_url, headers={'Accept-Encoding': accept_encoding}, timeout=60)
+
+    def send(self, method, path, body, token):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        with self.client.stream(method, path, json=body, headers=headers) as response:
+            size = sum(len(chunk) for chunk in response.iter_raw())
+            return response.status_code, size, response.headers.get('Server-Timing', '')
+
+    def close(self):
+        self.client.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест API: создаёт тестовые данные, выполняет запросы к основным маршрутам '
+        'в несколько потоков и выводит пропускную способность, p50/p95/p99 и число SQL-запросов '
+        'на запрос в JSON для сравнения между коммитами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='Сценарий (можно несколько раз; по умолчанию все)')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=20, help='Запросов на прогрев (не учитываются)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Одновременных клиентов')
+        parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess',
+                            help='inprocess - тестовый клиент Django, http - запросы к --url')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сервера для --mode http')
+        parser.add_argument('--accept-encoding', default='br, gzip', help='Заголовок Accept-Encoding запросов')
+        parser.add_argument('--no-response-cache', action='store_true',
+                            help='Отключить кеш ответов (только --mode inprocess)')
+        parser.add_argument('--books', type=int, default=2000, help='Книг в тестовых данных')
+        parser.add_argument('--users', type=int, default=50, help='Пользователей в тестовых данных')
+        parser.add_argument('--per-user', type=int, default=20, help='Отзывов и избранных книг на пользователя')
+        parser.add_argument('--text-kb', type=int, default=256, help='Размер текста книги для download_txt, КБ')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно выбора книг и пользователей в запросах')
+        parser.add_argument('--output', help='Записать результат в JSON-файл')
+        parser.add_argument('--compare', help='Сравнить с результатом из JSON-файла')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные после замера')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['books'], options['users'],
+               options['per_user'], options['text_kb']) < 1 or options['warmup'] < 0:
+            raise CommandError('Размеры данных, --requests и --concurrency должны быть положительными')
+        if options['no_response_cache'] and options['mode'] == 'http':
+            raise CommandError('--no-response-cache действует только в режиме inprocess')
+        scenarios = options['scenarios'] or list(SCENARIOS)
+
+        self.remove_data()
+        try:
+            values = self.create_data(options['books'], options['users'], options['per_user'], options['text_kb'])
+            overrides = {}
+            if options['mode'] == 'inprocess':
+                # Число SQL-запросов берётся из Server-Timing; журнал медленных запросов не нужен
+                overrides = {
+                    'ALLOWED_HOSTS': ['*'], 'METRICS_ENABLED': True, 'METRICS_SERVER_TIMING': True,
+                    'METRICS_SLOW_REQUEST_MS': float('inf'),
+                }
+                if options['no_response_cache']:
+                    overrides['RESPONSE_CACHE_ENABLED'] = False
+            with override_settings(**overrides):
+                results = {name: self.run_scenario(name, values, options) for name in scenarios}
+        finally:
+            if not options['keep']:
+                self.remove_data()
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'mode': options['mode'],
+                'url': options['url'] if options['mode'] == 'http' else None,
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'accept_encoding': options['accept_encoding'],
+                'response_cache': settings.RESPONSE_CACHE_ENABLED and not options['no_response_cache'],
+                'dataset': {key: options[key] for key in ('books', 'users', 'per_user', 'text_kb')},
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'scenarios': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        if options['json']:
+            self.stdout.write(output)
+        else:
+            self.print_table(results)
+        if options['compare']:
+            self.print_comparison(options['compare'], results)
+
+    def create_data(self, books_count, users_count, per_user, text_kb):
+        genres = Genre.objects.bulk_create([Genre(name=f'{PREFIX} genre {i}') for i in range(20)])
+        authors = Author.objects.bulk_create(
+            [Author(name=f'{PREFIX} author {i}') for i in range(max(books_count // 20, 1))]
+        )
+        # Текст для download_txt проходит тот же путь, что и загруженный файл (нормализация, сжатие)
+        line = 'Съешь же ещё этих мягких французских булок, да выпей чаю. The quick brown fox.\n'
+        text_name = default_storage.save(
+            f'books/{PREFIX}.txt', ContentFile((line * (text_kb * 1024 // len(line.encode()) + 1)).encode()),
+        )
+        Book.objects.bulk_create([
+            Book(
+                title=f'{PREFIX} {i * 7919 % books_count:06d}', author_id=authors[i % len(authors)].pk,
+                genre_id=genres[i % len(genres)].pk, publication_year=1900 + i % 120, isbn=f'979{i:010d}',
+                description='Описание книги для нагрузочного теста. ' * 5,
+                file=text_name if i == 0 else None,
+            )
+            for i in range(books_count)
+        ], batch_size=1000)
+        book_ids = list(Book.objects.filter(author__in=authors).order_by('pk').values_list('pk', flat=True))
+        normalize_book_text(Book.objects.get(file=text_name))
+
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([User(username=f'{PREFIX}_{i}', password=password) for i in range(users_count)])
+        users = list(User.objects.filter(username__startswith=f'{PREFIX}_').order_by('pk'))
+        per_user = min(per_user, len(book_ids))
+        Review.objects.bulk_create([
+            Review(book_id=book_ids[(u * 37 + i) % len(book_ids)], user=user, rating=i % 5 + 1,
+                   comment=f'Отзыв {i} для нагрузочного теста')
+            for u, user in enumerate(users) for i in range(per_user)
+        ], batch_size=1000)
+        UserFavorite.objects.bulk_create([
+            UserFavorite(user=user, book_id=book_ids[(u * 53 + i) % len(book_ids)])
+            for u, user in enumerate(users) for i in range(per_user)
+        ], batch_size=1000)
+        favorites_changed()
+        return {
+            'book_ids': book_ids,
+            'genre_ids': [genre.pk for genre in genres],
+            'users': [(user.username, RefreshToken.for_user(user)) for user in users],
+            'text_file': text_name,
+        }
+
+    def remove_data(self):
+        """Удаляет тестовые данные этой команды (в том числе оставшиеся от прерванного запуска)"""
+        users = User.objects.filter(username__startswith=f'{PREFIX}_')
+        books = Book.objects.filter(author__name__startswith=f'{PREFIX} ')
+        # Отзывы и избранное тестовых пользователей (обработчики сигналов поддерживают агрегаты книг),
+        # затем статистика, которую эти обработчики обновили
+        for queryset in (
+            UserFavorite.objects.filter(user__in=users), Review.objects.filter(user__in=users),
+            UserStats.objects.filter(user__in=users),
+        ):
+            queryset.delete()
+        names = []
+        for book in books.exclude(file='').exclude(file=None).only('file', 'text_file'):
+            names.append(book.file.name)
+            if book.text_file:
+                names += [book.text_file.name, book.text_file.name + PAGE_INDEX_SUFFIX]
+                names += [precompressed_path(book.text_file.name, encoding) for encoding in compression.CODECS]
+        books.delete()
+        users.delete()
+        Author.objects.filter(name__startswith=f'{PREFIX} ').delete()
+        Genre.objects.filter(name__startswith=f'{PREFIX} ').delete()
+        for name in names:
+            default_storage.delete(name)
+        response_cache.clear()
+        bump_catalog_version()
+        favorites_changed()
+
+    def build_requests(self, name, values, count, rng):
+        method, path, body, authenticated = SCENARIOS[name]
+        requests = []
+        for _ in range(count):
+            username, refresh = rng.choice(values['users'])
+            substitutions = {
+                'book': rng.choice(values['book_ids']),
+                'genre': rng.choice(values['genre_ids']),
+                'username': username,
+                'refresh': str(refresh),
+                'text_file': values['text_file'],
+            }
+            token = str(refresh.access_token) if authenticated else None
+            requests.append((method, path.format(**substitutions), _fill(body, substitutions), token))
+        return requests
+
+    def make_transport(self, options):
+        if options['mode'] == 'http':
+            return HTTPTransport(options['url'], options['accept_encoding'])
+        return InProcessTransport(options['accept_encoding'])
+
+    def run_requests(self, requests, options):
+        transport = self.make_transport(options)
+        results = []
+        try:
+            for method, path, body, token in requests:
+                started = time.perf_counter()
+                try:
+                    status, size, server_timing = transport.send(method, path, body, token)
+                except Exception:
+                    status, size, server_timing = None, 0, ''
+                elapsed = time.perf_counter() - started
+                queries = SERVER_TIMING_QUERIES.search(server_timing)
+                results.append((elapsed, status, size, int(queries.group(1)) if queries else None))
+        finally:
+            transport.close()
+        return results
+
+    def run_scenario(self, name, values, options):
+        # Один и тот же --seed даёт одну и ту же последовательность запросов для каждого сценария
+        rng = random.Random(f'{options["seed"]}:{name}')
+        warmup = self.build_requests(name, values, options['warmup'], rng)
+        requests = self.build_requests(name, values, options['requests'], rng)
+        if warmup:
+            self.run_requests(warmup, options)
+
+        concurrency = min(options['concurrency'], len(requests))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            parts = pool.map(lambda part: self.run_requests(part, options),
+                             [requests[worker::concurrency] for worker in range(concurrency)])
+            results = [result for part in parts for result in part]
+        duration = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for elapsed, *_ in results)
+        statuses = {}
+        for _, status, _, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        queries = [count for *_, count in results if count is not None]
+        return {
+            'requests': len(results),
+            'errors': sum(1 for _, status, _, _ in results if status is None or status >= 400),
+            'statuses': statuses,
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(results) / duration, 1),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 2),
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2),
+            },
+            'queries_per_request': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+            } if queries else None,
+            'bytes_per_request': round(sum(size for _, _, size, _ in results) / len(results)),
+        }
+
+    def print_table(self, results):
+        self.stdout.write(
+            f"{'сценарий':<18}{'запр/с':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+            f"{'SQL/запр':>10}{'байт/запр':>11}{'ошибок':>8}"
+        )
+        for name, row in results.items():
+            queries = row['queries_per_request']
+            self.stdout.write(
+                f"{name:<18}{row['throughput_rps']:>9.1f}{row['latency_ms']['p50']:>10.1f}"
+                f"{row['latency_ms']['p95']:>10.1f}{row['latency_ms']['p99']:>10.1f}"
+                f"{queries['mean'] if queries else '-':>10}{row['bytes_per_request']:>11}"
+                f"{row['errors']:>8}"
+            )
+
+    def print_comparison(self, path, results):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Не удалось прочитать {path}: {exc}')
+
+        def change(new, old):
+            return f'{(new - old) / old * 100:+.0f}%' if old else '-'
+
+        self.stdout.write(f"\nСравнение с {path} (коммит {baseline.get('meta', {}).get('commit') or '?'}):")
+        self.stdout.write(f"{'сценарий':<18}{'запр/с':>10}{'p50':>8}{'p95':>8}{'p99':>8}{'SQL/запр':>10}")
+        for name, row in results.items():
+            old = baseline.get('scenarios', {}).get(name)
+            if old is None:
+                self.stdout.write(f'{name:<18}{"нет в исходном замере":>44}')
+                continue
+            queries, old_queries = row['queries_per_request'], old.get('queries_per_request')
+            self.stdout.write(
+                f"{name:<18}{change(row['throughput_rps'], old['throughput_rps']):>10}"
+                + ''.join(
+                    f"{change(row['latency_ms'][p], old['latency_ms'][p]):>8}" for p in ('p50', 'p95', 'p99')
+                )
+                + f"{change(queries['mean'], old_queries['mean']) if queries and old_queries else '-':>10}"
+            )
@@ -0,0 +1,109 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import BookSerializer as ApiBookSerializer
+from library.fast_serializers import FastBookRows
+from library.models import Author, Book, Genre
+from library.serializers import BookSerializer as LibraryBookSerializer
+
+SERIALIZERS = {'library': LibraryBookSerializer, 'api': ApiBookSerializer}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает BookSerializer и быструю сериализацию из .values() на странице из N книг '
+        '(тестовые книги создаются во временной транзакции и откатываются)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help='Книг на странице')
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов (берётся лучший результат)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        if options['books'] < 1:
+            raise CommandError('--books должен быть положительным')
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            ids = self.create_books(options['books'])
+            request = RequestFactory().get('/api/books/')
+            queryset = Book.objects.select_related('author', 'genre').filter(pk__in=ids).order_by('title', 'id')
+            results = [
+                self.measure(name, serializer_class, queryset, request, options['repeat'])
+                for name, serializer_class in SERIALIZERS.items()
+            ]
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'сериализатор':<14}{'книг':>8}{'DRF мкс/стр':>14}{'fast мкс/стр':>14}{'ускорение':>11}"
+            f"{'с запросом DRF/fast, мс':>26}{'совпадает':>11}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['serializer']:<14}{row['books']:>8}{row['drf_us_per_row']:>14.1f}"
+                f"{row['fast_us_per_row']:>14.1f}{row['speedup']:>10.1f}x"
+                f"{row['drf_total_ms']:>17.1f} / {row['fast_total_ms']:<6.1f}"
+                f"{'да' if row['identical'] else 'НЕТ':>11}"
+            )
+
+    def create_books(self, count):
+        author = Author.objects.create(name='Benchmark author')
+        genre = Genre.objects.create(name='Benchmark genre')
+        derivatives = {'source': 'covers/bench.jpg', 'sizes': {
+            size: {'width': w, 'height': h, 'files': {'webp': f'covers/bench.{size}.webp', 'jpeg': f'covers/bench.{size}.jpg'}}
+            for size, (w, h) in (('thumbnail', (160, 240)), ('card', (320, 480)), ('full', (800, 1200)))
+        }}
+        books = []
+        for i in range(count):
+            with_cover = i % 2 == 0
+            books.append(Book(
+                title=f'Книга {i:06d}', author=author, genre=genre, publication_year=1900 + i % 120,
+                isbn=f'978{i:010d}', description='Описание книги ' * 10,
+                cover_image=f'covers/обложка {i}.jpg' if with_cover else None,
+                cover_derivatives=derivatives if with_cover else {},
+                file=f'books/book_{i}.txt' if i % 3 == 0 else None,
+                rating_sum=i % 50, reviews_count=i % 12, rating_5_count=i % 12, text_pages=i % 300 or None,
+            ))
+        Book.objects.bulk_create(books, batch_size=1000)
+        return list(Book.objects.filter(author=author).values_list('pk', flat=True))
+
+    def measure(self, name, serializer_class, queryset, request, repeat):
+        drf_serialize = drf_total = fast_serialize = fast_total = float('inf')
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            books = list(queryset)
+            fetched = time.perf_counter()
+            drf_data = serializer_class(books, many=True, context={'request': request}).data
+            finished = time.perf_counter()
+            drf_serialize = min(drf_serialize, finished - fetched)
+            drf_total = min(drf_total, finished - started)
+
+            started = time.perf_counter()
+            rows = FastBookRows(serializer_class, request)
+            values = list(rows.values(queryset))
+            fetched = time.perf_counter()
+            fast_data = rows.to_representation(values)
+            finished = time.perf_counter()
+            fast_serialize = min(fast_serialize, finished - fetched)
+            fast_total = min(fast_total, finished - started)
+
+        renderer = JSONRenderer()
+        count = len(drf_data)
+        return {
+            'serializer': name,
+            'books': count,
+            'drf_us_per_row': round(drf_serialize / count * 1e6, 2),
+            'fast_us_per_row': round(fast_serialize / count * 1e6, 2),
+            'speedup': round(drf_serialize / fast_serialize, 1),
+            'drf_total_ms': round(drf_total * 1000, 1),
+            'fast_total_ms': round(fast_total * 1000, 1),
+            'identical': renderer.render(drf_data) == renderer.render(fast_data),
+        }
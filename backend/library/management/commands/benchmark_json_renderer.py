@@ -0,0 +1,132 @@
+import io
+import json
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import BookSerializer, ReviewSerializer
+from library.models import Author, Book, Genre, Review
+from library.renderers import FastJSONParser, FastJSONRenderer, orjson
+
+
+def _best_time(func, repeat):
+    best = float('inf')
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает JSONRenderer/JSONParser DRF и варианты на orjson на больших списках книг и отзывов '
+        '(тестовые данные создаются во временной транзакции и откатываются)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=5000, help='Книг в списке')
+        parser.add_argument('--reviews', type=int, default=5000, help='Отзывов в списке (с вложенной книгой)')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов (берётся лучший результат)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        if options['books'] < 1 or options['reviews'] < 1:
+            raise CommandError('--books и --reviews должны быть положительными')
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson не установлен: сравниваются одинаковые реализации'))
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            book_ids, review_ids = self.create_data(options['books'], options['reviews'])
+            request = RequestFactory().get('/api/')
+            context = {'request': request}
+            books = BookSerializer(
+                Book.objects.select_related('author', 'genre').filter(pk__in=book_ids), many=True, context=context,
+            ).data
+            reviews = ReviewSerializer(
+                Review.objects.select_related('book__author', 'book__genre', 'user').filter(pk__in=review_ids),
+                many=True, context=context,
+            ).data
+            transaction.set_rollback(True)
+
+        results = [
+            self.measure('books', books, options['repeat']),
+            self.measure('reviews', reviews, options['repeat']),
+        ]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'список':<9}{'строк':>7}{'размер, КБ':>12}{'render DRF/orjson, мс':>24}{'ускорение':>11}"
+            f"{'память DRF/orjson, КБ':>24}{'parse DRF/orjson, мс':>23}{'совпадает':>11}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['list']:<9}{row['rows']:>7}{row['size_bytes'] / 1024:>12.0f}"
+                f"{row['drf_render_ms']:>15.1f} / {row['fast_render_ms']:<6.1f}{row['render_speedup']:>10.1f}x"
+                f"{row['drf_peak_bytes'] / 1024:>15.0f} / {row['fast_peak_bytes'] / 1024:<6.0f}"
+                f"{row['drf_parse_ms']:>14.1f} / {row['fast_parse_ms']:<6.1f}"
+                f"{'да' if row['identical'] else 'НЕТ':>11}"
+            )
+
+    def create_data(self, books_count, reviews_count):
+        author = Author.objects.create(name='Benchmark author')
+        genre = Genre.objects.create(name='Benchmark genre')
+        Book.objects.bulk_create([
+            Book(
+                title=f'Книга {i:06d}', author=author, genre=genre, publication_year=1900 + i % 120,
+                isbn=f'978{i:010d}', description='Описание книги «с кавычками» и переводами\nстрок ' * 5,
+                cover_image=f'covers/обложка {i}.jpg' if i % 2 == 0 else None,
+                rating_sum=i % 50, reviews_count=i % 12, rating_5_count=i % 12,
+            )
+            for i in range(books_count)
+        ], batch_size=1000)
+        book_ids = list(Book.objects.filter(author=author).values_list('pk', flat=True))
+        # Один отзыв пользователя на книгу: пользователей столько, чтобы хватило на все отзывы
+        users_count = -(-reviews_count // len(book_ids))
+        User.objects.bulk_create([User(username=f'benchmark_json_{i}') for i in range(users_count)])
+        user_ids = list(User.objects.filter(username__startswith='benchmark_json_').values_list('pk', flat=True))
+        Review.objects.bulk_create([
+            Review(
+                book_id=book_ids[i % len(book_ids)], user_id=user_ids[i // len(book_ids)],
+                rating=i % 5 + 1, comment=f'Отзыв {i}: ' + 'текст отзыва ' * 10,
+            )
+            for i in range(reviews_count)
+        ], batch_size=1000)
+        review_ids = list(Review.objects.filter(book__author=author).values_list('pk', flat=True))
+        return book_ids, review_ids
+
+    def measure(self, name, data, repeat):
+        drf, fast = JSONRenderer(), FastJSONRenderer()
+        drf_body, fast_body = drf.render(data), fast.render(data)
+        drf_parser, fast_parser = JSONParser(), FastJSONParser()
+        drf_render = _best_time(lambda: drf.render(data), repeat)
+        fast_render = _best_time(lambda: fast.render(data), repeat)
+        return {
+            'list': name,
+            'rows': len(data),
+            'size_bytes': len(drf_body),
+            'drf_render_ms': round(drf_render * 1000, 2),
+            'fast_render_ms': round(fast_render * 1000, 2),
+            'render_speedup': round(drf_render / fast_render, 1),
+            'drf_peak_bytes': _peak_memory(lambda: drf.render(data)),
+            'fast_peak_bytes': _peak_memory(lambda: fast.render(data)),
+            'drf_parse_ms': round(_best_time(lambda: drf_parser.parse(io.BytesIO(drf_body)), repeat) * 1000, 2),
+            'fast_parse_ms': round(_best_time(lambda: fast_parser.parse(io.BytesIO(drf_body)), repeat) * 1000, 2),
+            'identical': drf_body == fast_body,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from library import openlibrary
+from library.openlibrary_stub import FakeOpenLibraryServer
+
+SYNC_URL = '/api/find_openlibrary_books/'
+ASYNC_URL = '/api/find_openlibrary_books_async/'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность синхронного и асинхронного поиска OpenLibrary '
+        'на локальной заглушке с искусственной задержкой'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов в сценарии')
+        parser.add_argument('--concurrency', type=int, default=50, help='Одновременных запросов')
+        parser.add_argument('--latency', type=float, default=0.2, help='Задержка ответа заглушки, сек')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        with FakeOpenLibraryServer(latency=options['latency']) as server:
+            with override_settings(OPENLIBRARY_URL=server.url, OPENLIBRARY_CONCURRENCY=options['concurrency'],
+                                   OPENLIBRARY_POOL_SIZE=options['concurrency'], ALLOWED_HOSTS=['*']):
+                for scenario in ('unique', 'same'):
+                    for mode in ('sync', 'async'):
+                        results.append(self.run_scenario(server, mode, scenario, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'сценарий':<10}{'режим':<8}{'запросов':>10}{'req/s':>10}{'upstream':>10}{'ошибок':>8}")
+        for row in results:
+            self.stdout.write(
+                f"{row['scenario']:<10}{row['mode']:<8}{row['requests']:>10}"
+                f"{row['throughput']:>10.1f}{row['upstream_requests']:>10}{row['errors']:>8}"
+            )
+
+    def run_scenario(self, server, mode, scenario, options):
+        # Новые клиенты с пустым кешем: измеряем обращения к сервису, а не попадания в кеш
+        openlibrary.reset_clients()
+        total = options['requests']
+        if scenario == 'unique':
+            titles = [f'{mode} book {i}' for i in range(total)]
+        else:
+            titles = [f'{mode} same book'] * total
+
+        served_before = server.requests_served
+        started = time.perf_counter()
+        if mode == 'sync':
+            statuses = self.run_sync(titles, options['concurrency'])
+        else:
+            statuses = asyncio.run(self.run_async(titles, options['concurrency']))
+        elapsed = time.perf_counter() - started
+
+        return {
+            'scenario': scenario,
+            'mode': mode,
+            'requests': total,
+            'concurrency': options['concurrency'],
+            'seconds': round(elapsed, 3),
+            'throughput': round(total / elapsed, 1),
+            'upstream_requests': server.requests_served - served_before,
+            'errors': sum(1 for code in statuses if code != 200),
+        }
+
+    def run_sync(self, titles, concurrency):
+        def get(title):
+            return Client().get(SYNC_URL, {'title': title}).status_code
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(get, titles))
+
+    async def run_async(self, titles, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def get(title):
+            async with limit:
+                response = await client.get(ASYNC_URL, {'title': title})
+                return response.status_code
+
+        try:
+            return await asyncio.gather(*(get(title) for title in titles))
+        finally:
+            await openlibrary.close_async_client()
@@ -0,0 +1,230 @@
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.models import UserFavorite, UserStats
+from library.models import Author, Book, Genre, Review
+
+# Канонические запросы эндпоинтов: (имя, адрес, от имени пользователя, пройти на следующую страницу)
+ENDPOINTS = [
+    ('books', '/api/books/', False, True),
+    ('books_by_author', '/api/books/?author={author}', False, True),
+    ('books_by_genre', '/api/books/?genre={genre}', False, True),
+    ('books_by_year', '/api/books/?publication_year={year}', False, True),
+    ('books_by_isbn', '/api/books/?isbn={isbn}', False, False),
+    ('books_favorited', '/api/books/', True, False),
+    ('book_detail', '/api/books/{book}/', False, False),
+    ('reviews', '/api/reviews/', False, True),
+    ('reviews_by_book', '/api/reviews/?book={book}', False, True),
+    ('my_reviews', '/api/reviews/my_reviews/', True, False),
+    ('favorites', '/api/user-favorites/', True, True),
+    ('my_stats', '/api/user-stats/my_stats/', True, False),
+]
+
+# Минимум отзывов и избранного в среднем на книгу и на пользователя. При меньшем числе строк
+# ANALYZE оценивает выборку по индексу (book_id = ?) в одну строку, планировщик считает её
+# сортировку бесплатной и выбирает план с USE TEMP B-TREE / Sort, которого нет на реальных данных
+MIN_ROWS_PER_KEY = 2
+# Жанров в тестовых данных; авторов - не меньше, по 25 книг на автора
+SEED_GENRES = 20
+
+# SQLite: "SCAN library_book" - полный просмотр, "SCAN library_book USING INDEX ..." - просмотр по индексу
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(.*)$')
+SQLITE_TABLE = re.compile(r'^(?:SCAN|SEARCH) (?:TABLE )?(\S+)')
+
+
+def _sqlite_problems(rows, large_tables):
+    problems, tables = [], set()
+    for row in rows:
+        detail = row[-1]
+        table = SQLITE_TABLE.match(detail)
+        if table:
+            tables.add(table.group(1))
+        scan = SQLITE_SCAN.match(detail)
+        if scan and scan.group(1) in large_tables and 'INDEX' not in scan.group(2):
+            problems.append(f'полный просмотр {scan.group(1)}')
+    if tables & large_tables:
+        problems += [row[-1] for row in rows if row[-1].startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in row[-1]]
+    return problems
+
+
+def _postgresql_problems(plan, large_tables):
+    """Возвращает (проблемы, таблицы поддерева) для узла плана EXPLAIN (FORMAT JSON)"""
+    problems, tables = [], set()
+    for child in plan.get('Plans', []):
+        child_problems, child_tables = _postgresql_problems(child, large_tables)
+        problems += child_problems
+        tables |= child_tables
+    relation = plan.get('Relation Name')
+    if relation:
+        tables.add(relation)
+    if plan['Node Type'] == 'Seq Scan' and relation in large_tables:
+        problems.append(f'Seq Scan {relation}')
+    if plan['Node Type'] in ('Sort', 'Incremental Sort') and tables & large_tables:
+        problems.append(f"{plan['Node Type']} ({', '.join(plan.get('Sort Key', []))})")
+    return problems, tables
+
+
+def explain(sql, params, large_tables):
+    """Строки плана запроса и найденные в нём полные просмотры и сортировки больших таблиц"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()], _postgresql_problems(plan[0]['Plan'], large_tables)[0]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+        return [row[-1] for row in rows], _sqlite_problems(rows, large_tables)
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет планы (EXPLAIN) SQL-запросов основных эндпоинтов на тестовых данных: ошибка, если '
+        'в плане полный просмотр или сортировка большой таблицы (данные создаются во временной '
+        'транзакции и откатываются)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=5000, help='Книг в тестовых данных')
+        parser.add_argument('--users', type=int, default=200, help='Пользователей (у каждого отзывы и избранное)')
+        parser.add_argument('--per-user', type=int, default=50, help='Отзывов и избранных книг на пользователя')
+        parser.add_argument('--large-rows', type=int, default=1000,
+                            help='С какого числа строк таблица считается большой')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='Проверить только указанный эндпоинт (можно несколько раз)')
+        parser.add_argument('--plans', action='store_true', help='Вывести планы всех запросов')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'Разбор планов поддерживается для PostgreSQL и SQLite, а не {connection.vendor}')
+        if min(options['books'], options['users'], options['per_user']) < 1:
+            raise CommandError('--books, --users и --per-user должны быть положительными')
+        per_user = min(options['per_user'], options['books'])
+        if (options['books'] < MIN_ROWS_PER_KEY * SEED_GENRES or per_user < MIN_ROWS_PER_KEY
+                or options['users'] * per_user < MIN_ROWS_PER_KEY * options['books']):
+            raise CommandError(
+                f'Слишком мало тестовых данных для устойчивых планов: нужно --books >= {MIN_ROWS_PER_KEY * SEED_GENRES}, '
+                f'--per-user >= {MIN_ROWS_PER_KEY} и --users * --per-user >= {MIN_ROWS_PER_KEY} * --books '
+                f'(в среднем не меньше {MIN_ROWS_PER_KEY} книг на автора и жанр и отзывов на книгу и пользователя)'
+            )
+        endpoints = ENDPOINTS
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - {name for name, *_ in ENDPOINTS}
+            if unknown:
+                raise CommandError(f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+            endpoints = [endpoint for endpoint in ENDPOINTS if endpoint[0] in options['endpoints']]
+
+        # Кеш ответов отключён: иначе повторные запросы не доходят до БД
+        with override_settings(ALLOWED_HOSTS=['*'], RESPONSE_CACHE_ENABLED=False), transaction.atomic():
+            values = self.create_data(options['books'], options['users'], options['per_user'])
+            large_tables = self.analyze(options['large_rows'])
+            results = [self.check_endpoint(endpoint, values, large_tables) for endpoint in endpoints]
+            transaction.set_rollback(True)
+
+        failed = [result for result in results if result['error'] or any(q['problems'] for q in result['queries'])]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            self.report(results, large_tables, options['plans'])
+        if failed:
+            raise CommandError(f'Проблемы в планах запросов эндпоинтов: {", ".join(r["endpoint"] for r in failed)}')
+
+    def create_data(self, books_count, users_count, per_user):
+        authors_count = max(books_count // 25, SEED_GENRES)
+        authors = Author.objects.bulk_create([Author(name=f'Query plan author {i}') for i in range(authors_count)])
+        genres = Genre.objects.bulk_create([Genre(name=f'Query plan genre {i}') for i in range(SEED_GENRES)])
+        Book.objects.bulk_create([
+            Book(
+                title=f'Книга {i * 7919 % books_count:06d}', author_id=authors[i % len(authors)].pk,
+                genre_id=genres[i % len(genres)].pk, publication_year=1900 + i % 120, isbn=f'978{i:010d}',
+            )
+            for i in range(books_count)
+        ], batch_size=1000)
+        book_ids = list(Book.objects.filter(author__in=authors).values_list('pk', flat=True))
+        User.objects.bulk_create([User(username=f'query_plan_{i}') for i in range(users_count)])
+        user_ids = list(User.objects.filter(username__startswith='query_plan_').values_list('pk', flat=True))
+        per_user = min(per_user, len(book_ids))
+        # Книги пользователя - последовательный отрезок со сдвигом, чтобы отзывы распределились по каталогу
+        Review.objects.bulk_create([
+            Review(book_id=book_ids[(u * 37 + i) % len(book_ids)], user_id=user_id, rating=i % 5 + 1, comment='Отзыв')
+            for u, user_id in enumerate(user_ids) for i in range(per_user)
+        ], batch_size=1000)
+        UserFavorite.objects.bulk_create([
+            UserFavorite(user_id=user_id, book_id=book_ids[(u * 53 + i) % len(book_ids)])
+            for u, user_id in enumerate(user_ids) for i in range(per_user)
+        ], batch_size=1000)
+        book = Book.objects.get(pk=book_ids[len(book_ids) // 2])
+        return {
+            'book': book.pk, 'author': book.author_id, 'genre': book.genre_id,
+            'year': book.publication_year, 'isbn': book.isbn, 'user': user_ids[0],
+        }
+
+    def analyze(self, large_rows):
+        """Обновляет статистику планировщика; возвращает имена больших таблиц"""
+        large_tables = set()
+        with connection.cursor() as cursor:
+            for model in (Author, Genre, Book, Review, User, UserFavorite, UserStats):
+                table = model._meta.db_table
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+                if model.objects.count() >= large_rows:
+                    large_tables.add(table)
+        return large_tables
+
+    def check_endpoint(self, endpoint, values, large_tables):
+        name, url, authenticated, follow_next = endpoint
+        client = Client()
+        if authenticated:
+            client.force_login(User.objects.get(pk=values['user']))
+        captured = []
+
+        def capture(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith('SELECT'):
+                captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        result = {'endpoint': name, 'url': url.format(**values), 'error': None, 'queries': []}
+        # Первая страница и, для курсорных списков, следующая (условие по ключу курсора)
+        urls = [result['url']]
+        while urls:
+            url = urls.pop()
+            with connection.execute_wrapper(capture):
+                response = client.get(url)
+            if response.status_code != 200:
+                result['error'] = f'{response.status_code} {response.reason_phrase}'
+                return result
+            data = response.json()
+            if follow_next and url == result['url'] and isinstance(data, dict) and data.get('next'):
+                urls.append(data['next'])
+            for sql, params in captured:
+                plan, problems = explain(sql, params, large_tables)
+                result['queries'].append({'sql': sql, 'plan': plan, 'problems': problems})
+            captured.clear()
+        return result
+
+    def report(self, results, large_tables, show_plans):
+        self.stdout.write(f'Большие таблицы: {", ".join(sorted(large_tables)) or "нет"}')
+        for result in results:
+            problems = [problem for query in result['queries'] for problem in query['problems']]
+            if result['error']:
+                status = self.style.ERROR(f'ошибка {result["error"]}')
+            elif problems:
+                status = self.style.ERROR(f'проблем: {len(problems)}')
+            else:
+                status = self.style.SUCCESS('ok')
+            self.stdout.write(f'{result["endpoint"]:<18}{len(result["queries"]):>4} запр.  {status}  {result["url"]}')
+            for query in result['queries']:
+                if not (query['problems'] or show_plans):
+                    continue
+                self.stdout.write(f'    {query["sql"][:200]}')
+                for line in query['plan']:
+                    self.stdout.write(f'      {line}')
+                for problem in query['problems']:
+                    self.stdout.write(self.style.WARNING(f'      ! {problem}'))
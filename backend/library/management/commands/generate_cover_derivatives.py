@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from library import covers, response_cache
+from library.conditional import bump_catalog_version
+from library.models import Book
+
+
+def render_cover(book_id, source_name):
+    # Выполняется в дочернем процессе: только работа с изображениями, без обращений к БД
+    storage = Book._meta.get_field('cover_image').storage
+    return book_id, covers.render_derivatives(source_name, storage)
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии обложек (AVIF/WebP/JPEG) для загруженных ранее книг, параллельно на всех ядрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать копии даже для уже обработанных обложек')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Количество процессов (по умолчанию - число ядер)')
+
+    def handle(self, *args, **options):
+        books = {}
+        cleared = 0
+        for book in Book.objects.only('id', 'title', 'cover_image', 'cover_derivatives').iterator():
+            if not options['force'] and not covers.needs_update(book):
+                continue
+            if book.cover_image:
+                books[book.pk] = book
+            elif book.cover_derivatives:
+                # Обложку удалили - удаляем и её копии
+                covers.apply_derivatives(book, {})
+                cleared += 1
+
+        processed = failed = 0
+        started = time.perf_counter()
+        if books:
+            # Дочерние процессы не должны наследовать открытые соединения с БД
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=max(options['workers'], 1), initializer=django.setup) as pool:
+                futures = {
+                    pool.submit(render_cover, book.pk, book.cover_image.name): book for book in books.values()
+                }
+                for future in as_completed(futures):
+                    book = futures[future]
+                    try:
+                        _, derivatives = future.result()
+                    except Exception as e:  # повреждённый файл не должен останавливать обработку остальных
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f'[{book.pk}] {book.title}: {e}'))
+                        continue
+                    covers.apply_derivatives(book, derivatives)
+                    processed += 1
+                    self.stdout.write(f'[{book.pk}] {book.title}: {len(covers.derivative_names(derivatives))} файлов')
+
+        if processed or cleared:
+            # update() не отправляет сигналы - версию каталога и кеш ответов обновляем явно
+            bump_catalog_version()
+            response_cache.invalidate(Book)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано обложек: {processed}, очищено: {cleared}, ошибок: {failed}, время: {elapsed:.1f} с'
+        ))
@@ -0,0 +1,229 @@
+import csv
+import json
+import os
+import re
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library import response_cache, search
+from library.conditional import bump_catalog_version
+from library.models import Author, Book, Genre, ImportCheckpoint
+
+FORMATS = ('csv', 'jsonl', 'openlibrary')
+_YEAR_RE = re.compile(r'\b(\d{4})\b')
+
+# Ограничения длины полей моделей
+_TITLE_MAX = Book._meta.get_field('title').max_length
+_ISBN_MAX = Book._meta.get_field('isbn').max_length
+_AUTHOR_MAX = Author._meta.get_field('name').max_length
+_GENRE_MAX = Genre._meta.get_field('name').max_length
+
+
+def _parse_year(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, int):
+        return value
+    match = _YEAR_RE.search(str(value))
+    return int(match.group(1)) if match else None
+
+
+def _string(record, *fields):
+    """Первое непустое значение из полей записи в виде строки (в JSON бывают числа, например isbn)"""
+    for field in fields:
+        value = record.get(field)
+        if isinstance(value, (dict, list)):
+            raise ValueError(f'поле {field}: ожидалась строка, получено {type(value).__name__}')
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+
+def _text(value):
+    # В дампах OpenLibrary описание бывает строкой или объектом {"type": ..., "value": ...}
+    if isinstance(value, dict):
+        value = value.get('value', '')
+    return str(value or '').strip()
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield row
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        yield json.loads(line) if line else {}
+
+
+def read_openlibrary(stream):
+    """Дамп OpenLibrary: type<TAB>key<TAB>revision<TAB>last_modified<TAB>json"""
+    for line in stream:
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) < 5 or parts[0] not in ('/type/edition', '/type/work'):
+            yield {}
+            continue
+        data = json.loads(parts[4])
+        isbn = (data.get('isbn_13') or data.get('isbn_10') or [''])[0]
+        subjects = data.get('subjects') or data.get('genres') or []
+        yield {
+            'title': data.get('title'),
+            'author': data.get('by_statement') or '',
+            'genre': subjects[0] if subjects else '',
+            'publication_year': data.get('publish_date') or data.get('first_publish_date'),
+            'isbn': isbn,
+            'description': data.get('description'),
+        }
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'openlibrary': read_openlibrary}
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовый импорт каталога книг из CSV, JSONL или дампа OpenLibrary '
+        '(потоковое чтение, bulk_create пакетами, возобновление с контрольной точки)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Файл для импорта ("-" - стандартный ввод)')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--encoding', type=str, default='utf-8', help='Кодировка файла')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Книг в одной транзакции')
+        parser.add_argument('--checkpoint', type=str,
+                            help='Имя контрольной точки (хранится в БД); при наличии импорт продолжается '
+                                 'с сохранённой позиции')
+        parser.add_argument('--default-author', type=str, default='Неизвестный автор')
+        parser.add_argument('--default-genre', type=str, default='Без жанра')
+        parser.add_argument('--defer-index', action='store_true',
+                            help='Не обновлять поисковый индекс по пакетам, а перестроить его в конце')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or self.guess_format(path)
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        self.default_author = options['default_author'][:_AUTHOR_MAX]
+        self.default_genre = options['default_genre'][:_GENRE_MAX]
+        self.defer_index = options['defer_index']
+        # Словари дедупликации: имя -> id (загружаются один раз, дальше пополняются)
+        self.authors = dict(Author.objects.values_list('name', 'id'))
+        self.genres = dict(Genre.objects.values_list('name', 'id'))
+
+        self.checkpoint = self.load_checkpoint(options['checkpoint'], path)
+        start_at = self.checkpoint.records if self.checkpoint else 0
+        if start_at:
+            self.stdout.write(f'Продолжение импорта с записи {start_at}')
+
+        stream = sys.stdin if path == '-' else open(path, encoding=options['encoding'], newline='')
+        self.imported = self.skipped = 0
+        position = 0
+        started = time.perf_counter()
+        try:
+            batch = []
+            for record in READERS[fmt](stream):
+                position += 1
+                if position <= start_at:
+                    continue
+                try:
+                    book = self.build_book(record)
+                except ValueError as e:
+                    self.stderr.write(f'Запись {position} пропущена: {e}')
+                    book = None
+                if book is None:
+                    self.skipped += 1
+                else:
+                    batch.append(book)
+                if len(batch) >= batch_size:
+                    self.flush(batch, position)
+                    batch = []
+                    self.report(started)
+            self.flush(batch, position)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if self.defer_index:
+            search.rebuild_index()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано книг: {self.imported}, пропущено: {self.skipped}, '
+            f'время: {elapsed:.1f} с, скорость: {self.imported / max(elapsed, 1e-9):.0f} книг/с'
+        ))
+
+    def guess_format(self, path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.csv':
+            return 'csv'
+        if ext in ('.jsonl', '.ndjson'):
+            return 'jsonl'
+        if ext in ('.txt', '.tsv', '.dump'):
+            return 'openlibrary'
+        raise CommandError('Не удалось определить формат файла, укажите --format')
+
+    def build_book(self, record):
+        """Книга из записи файла; None - запись без названия, ValueError - некорректная запись"""
+        title = _string(record, 'title')[:_TITLE_MAX]
+        if not title:
+            return None
+        author = _string(record, 'author', 'author_name')[:_AUTHOR_MAX]
+        genre = _string(record, 'genre', 'genre_name')[:_GENRE_MAX]
+        book = Book(
+            title=title,
+            publication_year=_parse_year(record.get('publication_year')),
+            isbn=_string(record, 'isbn')[:_ISBN_MAX],
+            description=_text(record.get('description')),
+        )
+        # Имена временно храним на объекте, id проставляются в flush()
+        book._author_name = author or self.default_author
+        book._genre_name = genre or self.default_genre
+        return book
+
+    def resolve(self, model, mapping, names):
+        missing = [name for name in dict.fromkeys(names) if name not in mapping]
+        if missing:
+            created = model.objects.bulk_create([model(name=name) for name in missing])
+            if any(obj.pk is None for obj in created):
+                # СУБД не вернула id после bulk_create - дочитываем их
+                mapping.update(model.objects.filter(name__in=missing).values_list('name', 'id'))
+            else:
+                mapping.update((obj.name, obj.pk) for obj in created)
+
+    def flush(self, books, position):
+        """Сохраняет пакет книг и контрольную точку (position - записей обработано) одной транзакцией"""
+        with transaction.atomic():
+            if books:
+                self.resolve(Author, self.authors, [book._author_name for book in books])
+                self.resolve(Genre, self.genres, [book._genre_name for book in books])
+                for book in books:
+                    book.author_id = self.authors[book._author_name]
+                    book.genre_id = self.genres[book._genre_name]
+                created = Book.objects.bulk_create(books)
+                if not self.defer_index:
+                    search.index_books([book.pk for book in created if book.pk is not None])
+                # bulk_create не отправляет сигналы - версию каталога и кеш ответов обновляем явно
+                bump_catalog_version()
+                response_cache.invalidate(Book, Author, Genre)
+            if self.checkpoint is not None:
+                self.checkpoint.records = position
+                self.checkpoint.save(update_fields=['records', 'updated_at'])
+        self.imported += len(books)
+
+    def report(self, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'  {self.imported} книг, {self.imported / max(elapsed, 1e-9):.0f} книг/с')
+
+    def load_checkpoint(self, name, path):
+        if not name:
+            return None
+        source = os.path.abspath(path)
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(name=name, defaults={'source': source})
+        if checkpoint.source != source:
+            raise CommandError(f'Контрольная точка {name} относится к другому файлу: {checkpoint.source}')
+        return checkpoint
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from library.models import Book
+from library.textfiles import build_precompressed, normalize_book_text
+
+
+class Command(BaseCommand):
+    help = 'Создает нормализованные UTF-8 копии txt-файлов книг, загруженных ранее'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать копии даже для уже обработанных книг')
+        parser.add_argument('--precompress', action='store_true',
+                            help='Только создать сжатые копии (gzip/br/zstd) уже нормализованных текстов')
+
+    def handle(self, *args, **options):
+        if options['precompress']:
+            return self.precompress()
+        books = Book.objects.exclude(file='').exclude(file__isnull=True)
+        if not options['force']:
+            # Новые и заменённые файлы, а также копии без индекса страниц (созданные до появления читалки)
+            books = books.filter(
+                ~Q(text_source=F('file')) | Q(text_file='') | Q(text_pages__isnull=True)
+            )
+
+        processed = failed = 0
+        for book in books.iterator():
+            try:
+                if normalize_book_text(book):
+                    processed += 1
+                    self.stdout.write(f'[{book.pk}] {book.title}: {book.text_encoding}, {book.text_size} байт')
+            except OSError as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'[{book.pk}] {book.title}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано книг: {processed}, ошибок: {failed}'))
+
+    def precompress(self):
+        processed = failed = 0
+        for book in Book.objects.exclude(text_file='').exclude(text_file__isnull=True).only('title', 'text_file'):
+            try:
+                build_precompressed(book.text_file.path)
+                processed += 1
+            except OSError as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'[{book.pk}] {book.title}: {e}'))
+        self.stdout.write(self.style.SUCCESS(f'Сжато текстов: {processed}, ошибок: {failed}'))
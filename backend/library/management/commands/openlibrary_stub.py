@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from library.openlibrary_stub import FakeOpenLibraryServer
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальную заглушку OpenLibrary (для разработки и замеров без интернета)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Адрес')
+        parser.add_argument('--port', type=int, default=8089, help='Порт')
+        parser.add_argument('--latency', type=float, default=0.0, help='Искусственная задержка ответа, сек')
+
+    def handle(self, *args, **options):
+        server = FakeOpenLibraryServer(options['host'], options['port'], options['latency'], verbose=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заглушка OpenLibrary запущена на {server.url} (OPENLIBRARY_URL={server.url})'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from library import search
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает полнотекстовый индекс книг'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Поисковый индекс перестроен, книг: {indexed}'))
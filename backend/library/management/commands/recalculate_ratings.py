@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from library import response_cache
+from library.conditional import bump_catalog_version
+from library.management.drift import check_drift
+from library.models import Book, RATING_AGGREGATE_FIELDS, compute_rating_aggregates, recalculate_book_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты рейтинга книг по таблице отзывов и проверяет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить расхождения, ничего не изменяя')
+        parser.add_argument('--book', type=int, action='append', dest='book_ids',
+                            help='ID книги (можно указать несколько раз)')
+
+    def handle(self, *args, **options):
+        book_ids = options['book_ids']
+
+        if options['check']:
+            aggregates = compute_rating_aggregates(book_ids)
+            empty = {field: 0 for field in RATING_AGGREGATE_FIELDS}
+            books = Book.objects.only('pk', 'title', *RATING_AGGREGATE_FIELDS)
+            if book_ids:
+                books = books.filter(pk__in=book_ids)
+            check_drift(
+                self, books.iterator(), lambda book: aggregates.get(book.pk, empty), RATING_AGGREGATE_FIELDS,
+                label=lambda book: f'[{book.pk}] {book.title}',
+                error='Расхождения найдены у книг',
+                success='Агрегаты рейтинга совпадают с отзывами',
+            )
+            return
+
+        changed = recalculate_book_ratings(book_ids)
+        if changed:
+            # Агрегаты записаны через bulk_update без сигналов - версию каталога и кеш ответов сбрасываем явно
+            bump_catalog_version()
+            response_cache.invalidate(Book)
+        self.stdout.write(self.style.SUCCESS(f'Агрегаты рейтинга пересчитаны, исправлено книг: {len(changed)}'))
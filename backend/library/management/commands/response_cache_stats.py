@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from library import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики кеша ответов API (общие для всех процессов при общем бэкенде кеша)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики')
+        parser.add_argument('--clear', action='store_true', help='Сбросить все кешированные ответы')
+
+    def handle(self, *args, **options):
+        stats = response_cache.get_stats()
+        lookups = stats['hits'] + stats['waits'] + stats['misses']
+        for name, value in stats.items():
+            self.stdout.write(f'{name:<14}{value:>10}')
+        if lookups:
+            ratio = (stats['hits'] + stats['waits']) / lookups
+            self.stdout.write(f'{"hit ratio":<14}{ratio:>10.1%}')
+        if options['reset']:
+            response_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены'))
+        if options['clear']:
+            response_cache.clear()
+            self.stdout.write(self.style.SUCCESS('Кеш ответов сброшен'))
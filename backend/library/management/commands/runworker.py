@@ -0,0 +1,135 @@
+import os
+import signal
+import socket
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from library import jobs
+from library.models import Job
+
+# Сколько последних задач учитывается в статистике задержек
+LATENCY_WINDOW = 10000
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+class Command(BaseCommand):
+    help = 'Обработчик фоновых задач из очереди в БД (пул потоков или процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременно выполняемых задач')
+        parser.add_argument('--mode', choices=('thread', 'process'), default='thread',
+                            help='thread - для задач с вводом-выводом, process - для вычислительных')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, сек')
+        parser.add_argument('--burst', action='store_true', help='Завершиться, когда очередь опустеет')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Завершиться после N задач (0 - без ограничения)')
+        parser.add_argument('--stats-interval', type=float, default=60, help='Период вывода статистики, сек')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency должен быть положительным')
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.counts = Counter()
+        self.wait_times = deque(maxlen=LATENCY_WINDOW)
+        self.run_times = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.perf_counter()
+        self.stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self.request_stop)
+
+        requeued, failed = jobs.requeue_stale()
+        if requeued or failed:
+            self.stdout.write(f'Зависших задач возвращено в очередь: {requeued}, помечено ошибочными: {failed}')
+
+        if options['mode'] == 'process':
+            # Дочерние процессы открывают собственные соединения с БД
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=concurrency, initializer=django.setup)
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+        self.stdout.write(f'Обработчик {self.worker_id}: {options["mode"]} x {concurrency}')
+
+        running = {}
+        last_stats = last_stale_check = time.monotonic()
+        try:
+            while not self.stopping.is_set():
+                limit = concurrency - len(running)
+                if options['max_jobs']:
+                    limit = min(limit, options['max_jobs'] - self.counts['claimed'])
+                if limit > 0:
+                    for job in jobs.claim_jobs(self.worker_id, limit):
+                        self.counts['claimed'] += 1
+                        self.wait_times.append((job.started_at - job.run_at).total_seconds())
+                        running[executor.submit(jobs.execute, job.task, job.payload)] = job
+
+                if running:
+                    done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.finish(running.pop(future), future)
+                elif options['burst'] or (options['max_jobs'] and self.counts['claimed'] >= options['max_jobs']):
+                    break
+                else:
+                    self.stopping.wait(options['poll_interval'])
+
+                now = time.monotonic()
+                if now - last_stats >= options['stats_interval']:
+                    self.report()
+                    last_stats = now
+                if now - last_stale_check >= 60:
+                    jobs.requeue_stale()
+                    last_stale_check = now
+        finally:
+            # Корректная остановка: дожидаемся уже начатых задач и сохраняем их результат
+            for future in list(running):
+                self.finish(running.pop(future), future)
+            executor.shutdown()
+            self.report()
+
+    def request_stop(self, signum, frame):
+        self.stdout.write('Остановка после завершения текущих задач...')
+        self.stopping.set()
+
+    def finish(self, job, future):
+        try:
+            success, error, duration = future.result()
+        except Exception as e:  # например, аварийное завершение дочернего процесса
+            success, error, duration = False, repr(e), 0.0
+        self.run_times.append(duration)
+        status = jobs.complete_job(job, success, error)
+        if status is None:
+            self.stdout.write(self.style.WARNING(
+                f'[{job.pk}] {job.task}: задача передана другому обработчику, результат не сохранён'
+            ))
+            return
+        self.counts[{Job.DONE: 'succeeded', Job.FAILED: 'failed', Job.QUEUED: 'retried'}[status]] += 1
+        if not success:
+            last_line = error.strip().splitlines()[-1] if error.strip() else ''
+            self.stdout.write(self.style.ERROR(f'[{job.pk}] {job.task} (попытка {job.attempts}): {last_line}'))
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        completed = self.counts['succeeded'] + self.counts['failed'] + self.counts['retried']
+        waits = sorted(self.wait_times)
+        runs = sorted(self.run_times)
+        queued = Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).count()
+        self.stdout.write(
+            f'[{self.worker_id}] выполнено: {self.counts["succeeded"]}, повторов: {self.counts["retried"]}, '
+            f'ошибок: {self.counts["failed"]}, в очереди: {queued}, '
+            f'скорость: {completed / max(elapsed, 1e-9):.1f} задач/с, '
+            f'ожидание p50/p95: {_percentile(waits, 50):.3f}/{_percentile(waits, 95):.3f} с, '
+            f'выполнение p50/p95: {_percentile(runs, 50):.3f}/{_percentile(runs, 95):.3f} с'
+        )
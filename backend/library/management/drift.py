@@ -0,0 +1,28 @@
+"""
+Режим --check команд пересчёта денормализованных данных (recalculate_ratings,
+recalculate_user_stats): сравнение хранимых значений с рассчитанными по таблицам.
+"""
+from django.core.management.base import CommandError
+
+
+def check_drift(command, rows, expected, fields, label, error, success):
+    """
+    Выводит расхождения каждой строки rows с expected(row) по полям fields и
+    завершает команду ошибкой error, если они есть; иначе выводит success.
+    label(row) - подпись строки в отчёте.
+    """
+    drifted = 0
+    for row in rows:
+        values = expected(row)
+        diff = {
+            field: (getattr(row, field), values[field])
+            for field in fields
+            if getattr(row, field) != values[field]
+        }
+        if diff:
+            drifted += 1
+            details = ', '.join(f'{field}: {stored} != {actual}' for field, (stored, actual) in diff.items())
+            command.stdout.write(command.style.WARNING(f'{label(row)}: {details}'))
+    if drifted:
+        raise CommandError(f'{error}: {drifted}')
+    command.stdout.write(command.style.SUCCESS(success))
@@ -0,0 +1,313 @@
+"""
+Метрики производительности запросов: Server-Timing, гистограммы для Prometheus и журнал
+медленных запросов.
+
+MetricsMiddleware для каждого запроса считает число и время SQL-запросов (на всех
+подключениях, в том числе репликах), время сериализации (timed('serializer') в сериализаторах
+каталога и FastBookRows), время рендеринга JSON, размер ответа и представление (имя маршрута).
+Итог добавляется в заголовок Server-Timing (METRICS_SERVER_TIMING) и в гистограммы процесса.
+
+Несколько процессов (gunicorn, runworker): при заданном METRICS_DIR каждый процесс не чаще
+раза в METRICS_FLUSH_INTERVAL секунд атомарно записывает свои значения в <METRICS_DIR>/<pid>.json,
+а /metrics суммирует файлы всех процессов. Без METRICS_DIR /metrics отдаёт данные только
+своего процесса. Каталог стоит очищать при перезапуске сервиса.
+
+Запросы дольше METRICS_SLOW_REQUEST_MS пишутся в журнал library.metrics вместе с самыми
+долгими SQL-запросами.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Имя: (тип, описание, корзины, метки)
+METRICS = {
+    'http_requests_total': ('counter', 'Запросы', None, ('view', 'method', 'status')),
+    'http_slow_requests_total': ('counter', 'Медленные запросы', None, ('view',)),
+    'http_request_duration_seconds': ('histogram', 'Время обработки запроса', DURATION_BUCKETS, ('view', 'method')),
+    'http_request_db_queries': ('histogram', 'SQL-запросов на запрос', QUERY_BUCKETS, ('view',)),
+    'http_request_db_duration_seconds': ('histogram', 'Время SQL-запросов', DURATION_BUCKETS, ('view',)),
+    'http_request_serializer_duration_seconds': ('histogram', 'Время сериализации', DURATION_BUCKETS, ('view',)),
+    'http_request_render_duration_seconds': ('histogram', 'Время рендеринга ответа', DURATION_BUCKETS, ('view',)),
+    'http_response_size_bytes': ('histogram', 'Размер тела ответа', SIZE_BUCKETS, ('view',)),
+}
+# Сколько SQL-запросов хранить для журнала медленных запросов и сколько из них выводить
+MAX_RECORDED_QUERIES = 1000
+SLOW_LOG_QUERIES = 5
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Замеры текущего запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.recorded = []
+        self.timings = {'serializer': 0.0, 'render': 0.0}
+        self.depth = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            if len(self.recorded) < MAX_RECORDED_QUERIES:
+                self.recorded.append((duration, sql))
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Добавляет время блока к замеру name текущего запроса (вложенные блоки не суммируются)"""
+    metrics = _current.get()
+    if metrics is None or metrics.depth.get(name):
+        yield
+        return
+    metrics.depth[name] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth[name] = 0
+        metrics.timings[name] += time.perf_counter() - started
+
+
+class Registry:
+    """Счётчики и гистограммы процесса: {(имя, значения меток): число или [корзины..., сумма, количество]}"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.flushed = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * (len(buckets) + 3)
+            # Корзины хранятся некумулятивно, последняя - для значений больше всех границ
+            data[bisect_left(buckets, value)] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return [[name, list(labels), value if isinstance(value, (int, float)) else list(value)]
+                    for (name, labels), value in self.values.items()]
+
+    def flush(self, force=False):
+        """Записывает значения процесса в METRICS_DIR (не чаще METRICS_FLUSH_INTERVAL)"""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.flushed = now
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+registry = Registry()
+
+
+def collect():
+    """Значения всех процессов (из METRICS_DIR) или только текущего"""
+    directory = settings.METRICS_DIR
+    if not directory:
+        snapshots = [registry.snapshot()]
+    else:
+        registry.flush(force=True)
+        snapshots = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.json') and not filename.startswith('.'):
+                try:
+                    with open(os.path.join(directory, filename)) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue  # файл процесса удалён во время чтения
+    merged = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(labels))
+            if isinstance(value, list):
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(values):
+    """Текстовый формат Prometheus 0.0.4"""
+    lines = []
+    for name, (kind, description, buckets, label_names) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f'{name}_bucket{_labels(label_names, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(float(value[-2]))}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    GET /metrics - метрики в формате Prometheus. Требует заголовок Authorization: Bearer <METRICS_TOKEN>;
+    без заданного METRICS_TOKEN доступен только при DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def _wrap_connections(metrics):
+    """Подключает замер SQL ко всем подключениям текущего потока; закрытие стека - отключает"""
+    stack = contextlib.ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+    return stack
+
+
+class MetricsMiddleware:
+    """
+    Замеры запроса, заголовок Server-Timing, гистограммы и журнал медленных запросов.
+    Работает и в синхронном (WSGI), и в асинхронном (ASGI) стеке.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with _wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - metrics.started)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            # Подключения БД привязаны к потоку: синхронные представления и ORM запроса выполняются
+            # через sync_to_async в одном потоке запроса, поэтому замер подключается и снимается там же
+            stack = await sync_to_async(_wrap_connections)(metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - metrics.started)
+        return response
+
+    def record(self, request, response, metrics, duration):
+        view = _view_name(request)
+        size = None if response.streaming else len(response.content)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'serializer;dur={metrics.timings["serializer"] * 1000:.1f}',
+                f'render;dur={metrics.timings["render"] * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}',
+            ])
+
+        registry.inc('http_requests_total', (view, request.method, str(response.status_code)))
+        registry.observe('http_request_duration_seconds', (view, request.method), duration)
+        registry.observe('http_request_db_queries', (view,), metrics.queries)
+        registry.observe('http_request_db_duration_seconds', (view,), metrics.db_time)
+        registry.observe('http_request_serializer_duration_seconds', (view,), metrics.timings['serializer'])
+        registry.observe('http_request_render_duration_seconds', (view,), metrics.timings['render'])
+        if size is not None:
+            registry.observe('http_response_size_bytes', (view,), size)
+
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            registry.inc('http_slow_requests_total', (view,))
+            slowest = sorted(metrics.recorded, key=lambda item: item[0], reverse=True)[:SLOW_LOG_QUERIES]
+            logger.warning(
+                'Медленный запрос %s %s (%s): %d, %.0f мс, SQL: %d за %.0f мс, сериализация %.0f мс, '
+                'рендеринг %.0f мс, ответ %s байт%s',
+                request.method, request.get_full_path(), view, response.status_code, duration * 1000,
+                metrics.queries, metrics.db_time * 1000, metrics.timings['serializer'] * 1000,
+                metrics.timings['render'] * 1000, size if size is not None else '?',
+                ''.join(f'\n  {seconds * 1000:.1f} мс: {sql}' for seconds, sql in slowest),
+            )
+        registry.flush()
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from library import search
+    search.create_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from library import search
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_book_rating_aggregates'),
+    ]
+
+    operations = [
+        # Колонка tsvector с GIN-индексом (PostgreSQL) или таблица FTS5 (SQLite)
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
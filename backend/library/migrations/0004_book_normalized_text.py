@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='text_encoding',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Исходная кодировка'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='text_file',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='books_utf8/', verbose_name='Текст в UTF-8'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='text_lines',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Количество строк'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='text_sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256 текста'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='text_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='Размер текста (байт)'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='text_source',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Исходный файл текста'),
+        ),
+    ]
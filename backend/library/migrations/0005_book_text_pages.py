@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_normalized_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='text_pages',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Количество страниц'),
+        ),
+    ]
@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
+from django.db.models import Count, F, Q, Sum
 from django.contrib.auth.models import User
+from django.dispatch import Signal
+
+RATING_CHOICES = [(i, i) for i in range(1, 6)]
 
 # Модель автора книги
 class Author(models.Model):
@@ -38,16 +43,111 @@ class Book(models.Model):
     isbn = models.CharField(max_length=20, blank=True, verbose_name="ISBN")
     description = models.TextField(blank=True, verbose_name="Описание")
     cover_image = models.ImageField(upload_to='covers/', blank=True, null=True, verbose_name="Обложка")
+    # Уменьшенные копии обложки в AVIF/WebP/JPEG (см. library.covers)
+    cover_derivatives = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Копии обложки")
     file = models.FileField(upload_to='books/', null=True, blank=True, verbose_name="Файл книги")
+    # Нормализованная UTF-8 копия txt-файла и её метаданные (см. library.textfiles)
+    text_file = models.FileField(upload_to='books_utf8/', null=True, blank=True, editable=False, verbose_name="Текст в UTF-8")
+    text_source = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Исходный файл текста")
+    text_encoding = models.CharField(max_length=32, blank=True, editable=False, verbose_name="Исходная кодировка")
+    text_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False, verbose_name="Размер текста (байт)")
+    text_lines = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Количество строк")
+    text_sha256 = models.CharField(max_length=64, blank=True, editable=False, verbose_name="SHA-256 текста")
+    text_pages = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Количество страниц")
+    # Денормализованные агрегаты рейтинга, поддерживаются при изменении отзывов
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Сумма оценок")
+    reviews_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 1")
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 2")
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 3")
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 4")
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Оценок 5")
     
     class Meta:
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
         ordering = ['title']
+        indexes = [
+            # Курсорная пагинация списка книг: ORDER BY title, id
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            # То же с фильтрами списка (?author=, ?genre=, ?publication_year=, ?isbn=): поиск и порядок по индексу
+            models.Index(fields=['author', 'title', 'id'], name='book_author_title_id_idx'),
+            models.Index(fields=['genre', 'title', 'id'], name='book_genre_title_id_idx'),
+            models.Index(fields=['publication_year', 'title', 'id'], name='book_year_title_id_idx'),
+            models.Index(fields=['isbn', 'title', 'id'], name='book_isbn_title_id_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
+    @property
+    def average_rating(self):
+        if not self.reviews_count:
+            return None
+        return round(self.rating_sum / self.reviews_count, 1)
+
+    @property
+    def rating_histogram(self):
+        return {str(i): getattr(self, f'rating_{i}_count') for i, _ in RATING_CHOICES}
+
+
+# Поля агрегатов рейтинга в модели Book
+RATING_AGGREGATE_FIELDS = ['rating_sum', 'reviews_count'] + [f'rating_{i}_count' for i, _ in RATING_CHOICES]
+
+
+def apply_rating_delta(book_id, rating, sign, using='default'):
+    """Атомарно добавляет (sign=1) или вычитает (sign=-1) одну оценку из агрегатов книги"""
+    Book.objects.using(using).filter(pk=book_id).update(
+        rating_sum=F('rating_sum') + sign * rating,
+        reviews_count=F('reviews_count') + sign,
+        **{f'rating_{rating}_count': F(f'rating_{rating}_count') + sign},
+    )
+
+
+def compute_rating_aggregates(book_ids=None, using='default'):
+    """Считает агрегаты рейтинга по таблице отзывов одним сгруппированным запросом"""
+    reviews = Review.objects.using(using).order_by()
+    if book_ids is not None:
+        reviews = reviews.filter(book_id__in=book_ids)
+    rows = reviews.values('book_id').annotate(
+        rating_sum=Sum('rating'),
+        reviews_count=Count('id'),
+        **{f'rating_{i}_count': Count('id', filter=Q(rating=i)) for i, _ in RATING_CHOICES},
+    )
+    return {row.pop('book_id'): row for row in rows}
+
+
+def recalculate_book_ratings(book_ids=None, using='default'):
+    """Пересчитывает агрегаты рейтинга с нуля для указанных книг (или для всех)"""
+    aggregates = compute_rating_aggregates(book_ids, using=using)
+    empty = {field: 0 for field in RATING_AGGREGATE_FIELDS}
+    books = Book.objects.using(using).only('pk', *RATING_AGGREGATE_FIELDS)
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    changed = []
+    for book in books.iterator():
+        values = aggregates.get(book.pk, empty)
+        if any(getattr(book, field) != values[field] for field in RATING_AGGREGATE_FIELDS):
+            for field in RATING_AGGREGATE_FIELDS:
+                setattr(book, field, values[field])
+            changed.append(book)
+    Book.objects.using(using).bulk_update(changed, RATING_AGGREGATE_FIELDS, batch_size=500)
+    return changed
+
+
+# Версия каталога для условных GET-запросов (ETag), см. library.conditional
+class CatalogVersion(models.Model):
+    """Счётчик изменений каталога: увеличивается при любой записи книг, авторов, жанров и отзывов"""
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Версия")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Изменено")
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версия каталога"
+
+    def __str__(self):
+        return f"{self.version} ({self.updated_at:%Y-%m-%d %H:%M:%S})"
+
 
 # Модель настроек в админ-панели
 class SiteSetting(models.Model):
@@ -58,19 +158,167 @@ class SiteSetting(models.Model):
         return f"{self.key}: {self.value}"
 
 
+def _reviews_changed(using):
+    # Массовые операции не отправляют сигналы: версию каталога и кеш ответов обновляем явно
+    from . import response_cache
+    from .conditional import bump_catalog_version
+    bump_catalog_version(using=using)
+    response_cache.invalidate(Review, Book, using=using)
+
+
+# Массовые операции с отзывами (ReviewQuerySet) не отправляют post_save/post_delete.
+# Данные других приложений, зависящие от отзывов пользователей (например, api.user_stats),
+# пересчитываются получателями этого сигнала: sender=Review, user_ids, using.
+# Отправляется внутри транзакции операции, после записи.
+reviews_bulk_changed = Signal()
+
+
+class ReviewQuerySet(models.QuerySet):
+    """QuerySet отзывов, поддерживающий агрегаты книг при массовых операциях"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            recalculate_book_ratings({obj.book_id for obj in objs}, using=self.db)
+            reviews_bulk_changed.send(sender=Review, user_ids={obj.user_id for obj in objs}, using=self.db)
+            _reviews_changed(self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            previous = list(self.filter(pk__in=[obj.pk for obj in objs]).values_list('book_id', 'user_id'))
+            book_ids = {book_id for book_id, _ in previous}
+            user_ids = {user_id for _, user_id in previous}
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            recalculate_book_ratings(book_ids | {obj.book_id for obj in objs}, using=self.db)
+            reviews_bulk_changed.send(sender=Review, user_ids=user_ids | {obj.user_id for obj in objs}, using=self.db)
+            _reviews_changed(self.db)
+        return rows
+
+    def update(self, **kwargs):
+        # Сброс кеша регистрируется в той же транзакции после записи и выполняется после её фиксации:
+        # иначе запрос между сбросом и UPDATE закешировал бы старые данные под новым поколением
+        with transaction.atomic(using=self.db):
+            if not {'rating', 'book', 'book_id', 'user', 'user_id'} & kwargs.keys():
+                rows = super().update(**kwargs)
+                _reviews_changed(self.db)
+                return rows
+            previous = list(self.values_list('book_id', 'user_id'))
+            book_ids = {book_id for book_id, _ in previous}
+            user_ids = {user_id for _, user_id in previous}
+            rows = super().update(**kwargs)
+            if 'book' in kwargs or 'book_id' in kwargs:
+                book = kwargs.get('book', kwargs.get('book_id'))
+                book_ids.add(getattr(book, 'pk', book))
+            if 'user' in kwargs or 'user_id' in kwargs:
+                user = kwargs.get('user', kwargs.get('user_id'))
+                user_ids.add(getattr(user, 'pk', user))
+            recalculate_book_ratings(book_ids, using=self.db)
+            reviews_bulk_changed.send(sender=Review, user_ids=user_ids, using=self.db)
+            _reviews_changed(self.db)
+        return rows
+
+
 class Review(models.Model):
     """Модель отзыва о книге"""
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews', verbose_name="Книга")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
-    rating = models.PositiveIntegerField(choices=[(i, i) for i in range(1, 6)], verbose_name="Рейтинг")
+    rating = models.PositiveIntegerField(choices=RATING_CHOICES, verbose_name="Рейтинг")
     comment = models.TextField(verbose_name="Комментарий")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    objects = ReviewQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         ordering = ['-created_at']
         unique_together = ['book', 'user']  # Один отзыв от пользователя на книгу
+        indexes = [
+            # Курсорная пагинация отзывов: ORDER BY created_at DESC, id DESC (в т.ч. с фильтром по книге)
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+            models.Index(fields=['book', '-created_at', '-id'], name='review_book_created_id_idx'),
+            # Отзывы пользователя (my_reviews, статистика): WHERE user_id = ? ORDER BY created_at DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='review_user_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.book.title} ({self.rating}/5)"
+
+    def _lock_rating_state(self, using):
+        # Блокируем строку и запоминаем сохранённые в БД книгу, оценку и автора отзыва,
+        # чтобы обработчики сигналов скорректировали агрегаты на точную разницу
+        self._previous_rating_state = None
+        if self.pk is not None and not self._state.adding:
+            self._previous_rating_state = (
+                Review.objects.using(using).select_for_update()
+                .filter(pk=self.pk).values_list('book_id', 'rating', 'user_id').first()
+            )
+
+    def save(self, *args, **kwargs):
+        # Отзыв и агрегаты книги сохраняются в одной транзакции (см. library.signals)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            self._lock_rating_state(using)
+            super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            self._lock_rating_state(using)
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+# Фоновая задача (очередь задач в БД, см. library.jobs и команду runworker)
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    task = models.CharField(max_length=100, verbose_name="Задача")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name="Статус")
+    priority = models.SmallIntegerField(default=0, verbose_name="Приоритет")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Выполнить не раньше")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="Обработчик")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ['-created_at']
+        indexes = [
+            # Выбор следующей задачи: WHERE status = 'queued' AND run_at <= now ORDER BY priority DESC, run_at, id
+            models.Index(fields=['status', '-priority', 'run_at', 'id'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+
+# Контрольная точка массового импорта (команда import_books): хранится в БД и обновляется
+# в той же транзакции, что и пакет книг, поэтому после сбоя пакет не импортируется повторно
+class ImportCheckpoint(models.Model):
+    name = models.CharField(max_length=200, unique=True, verbose_name="Название")
+    source = models.CharField(max_length=1000, verbose_name="Файл")
+    records = models.PositiveBigIntegerField(default=0, verbose_name="Обработано записей")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    class Meta:
+        verbose_name = "Контрольная точка импорта"
+        verbose_name_plural = "Контрольные точки импорта"
+
+    def __str__(self):
+        return f"{self.name}: {self.records}"
@@ -0,0 +1,362 @@
+"""
+Клиент OpenLibrary для поиска книг по названию.
+
+- один requests.Session на процесс с пулом keep-alive соединений;
+- кеш ответов TTL + LRU по нормализованному названию;
+- stale-while-revalidate: устаревший ответ отдаётся сразу, а обновляется в фоне;
+- отрицательное кеширование ошибок, чтобы не нагружать недоступный сервис;
+- счётчики попаданий/промахов для оценки эффективности кеша;
+- асинхронный клиент (httpx) для ASGI: общий пул соединений, ограничение
+  параллельности и объединение одинаковых одновременных запросов (single-flight).
+
+Адрес сервиса задаётся настройкой OPENLIBRARY_URL (для локальной проверки можно
+запустить заглушку: python manage.py openlibrary_stub).
+"""
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Максимальное количество книг в ответе
+MAX_RESULTS = 20
+
+
+class OpenLibraryError(Exception):
+    """Ошибка обращения к OpenLibrary"""
+
+
+def normalize_title(title):
+    return ' '.join(title.split()).casefold()
+
+
+class TTLLRUCache:
+    """Потокобезопасный LRU-кеш, запоминающий время сохранения записей"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Возвращает (значение, ошибка, возраст в секундах) или None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+        value, error, stored_at = entry
+        return value, error, time.monotonic() - stored_at
+
+    def set(self, key, value=None, error=None):
+        with self._lock:
+            self._data[key] = (value, error, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BaseOpenLibraryClient:
+    """Общая логика кеширования для синхронного и асинхронного клиентов"""
+
+    def __init__(self, base_url=None, timeout=None, ttl=None, stale_ttl=None,
+                 negative_ttl=None, cache=None, pool_size=None):
+        self.base_url = (base_url or settings.OPENLIBRARY_URL).rstrip('/')
+        self.timeout = timeout if timeout is not None else settings.OPENLIBRARY_TIMEOUT
+        self.ttl = ttl if ttl is not None else settings.OPENLIBRARY_CACHE_TTL
+        self.stale_ttl = stale_ttl if stale_ttl is not None else settings.OPENLIBRARY_STALE_TTL
+        self.negative_ttl = negative_ttl if negative_ttl is not None else settings.OPENLIBRARY_NEGATIVE_TTL
+        self.cache = cache if cache is not None else TTLLRUCache(settings.OPENLIBRARY_CACHE_SIZE)
+        self.pool_size = pool_size or settings.OPENLIBRARY_POOL_SIZE
+
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0, 'stale_hits': 0, 'negative_hits': 0, 'misses': 0, 'errors': 0,
+            'coalesced': 0, 'upstream_requests': 0, 'upstream_seconds': 0.0,
+        }
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _lookup(self, key):
+        """
+        Проверяет кеш. Возвращает (найдено, значение, нужно_обновить) или бросает
+        OpenLibraryError для закешированной ошибки.
+        """
+        cached = self.cache.get(key)
+        if cached is None:
+            return False, None, False
+        value, error, age = cached
+        if error is not None:
+            if age < self.negative_ttl:
+                self._count('negative_hits')
+                raise OpenLibraryError(error)
+            return False, None, False
+        if age < self.ttl:
+            self._count('hits')
+            return True, value, False
+        if age < self.ttl + self.stale_ttl:
+            # Отдаём устаревший ответ сразу и обновляем его в фоне
+            self._count('stale_hits')
+            return True, value, True
+        return False, None, False
+
+    def _start_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _finish_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _search_url(self):
+        return f'{self.base_url}/search.json'
+
+
+class OpenLibraryClient(BaseOpenLibraryClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def search_books(self, title):
+        """Ищет книги по названию; возвращает список словарей или бросает OpenLibraryError"""
+        key = normalize_title(title)
+        found, value, refresh = self._lookup(key)
+        if found:
+            if refresh:
+                self._refresh_in_background(key, title)
+            return value
+
+        self._count('misses')
+        return self._fetch_and_store(key, title)
+
+    def _fetch_and_store(self, key, title):
+        try:
+            books = self.fetch(title)
+        except OpenLibraryError as e:
+            self._count('errors')
+            self.cache.set(key, error=str(e))
+            raise
+        self.cache.set(key, books)
+        return books
+
+    def _refresh_in_background(self, key, title):
+        if not self._start_refresh(key):
+            return
+
+        def refresh():
+            try:
+                self.cache.set(key, self.fetch(title))
+            except OpenLibraryError:
+                # При ошибке обновления продолжаем отдавать устаревший ответ до истечения stale_ttl
+                self._count('errors')
+            finally:
+                self._finish_refresh(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def fetch(self, title):
+        """Запрос к OpenLibrary без кеша"""
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self._search_url(), params={'title': title}, timeout=self.timeout)
+            response.raise_for_status()
+            docs = response.json().get('docs', [])
+        except (requests.RequestException, ValueError) as e:
+            raise OpenLibraryError(str(e)) from e
+        finally:
+            self._count('upstream_requests')
+            self._count('upstream_seconds', time.perf_counter() - started)
+        return format_docs(docs)
+
+
+class AsyncOpenLibraryClient(BaseOpenLibraryClient):
+    """
+    Асинхронный клиент для одного цикла событий. Одновременные запросы с одинаковым
+    нормализованным названием ожидают один общий запрос к OpenLibrary.
+    """
+
+    def __init__(self, *args, concurrency=None, **kwargs):
+        import httpx
+
+        super().__init__(*args, **kwargs)
+        self._httpx = httpx
+        self.http = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+        self.semaphore = asyncio.Semaphore(concurrency or settings.OPENLIBRARY_CONCURRENCY)
+        self._in_flight = {}
+        self._background = set()
+
+    async def search_books(self, title):
+        key = normalize_title(title)
+        found, value, refresh = self._lookup(key)
+        if found:
+            if refresh and self._start_refresh(key):
+                task = asyncio.create_task(self._refresh(key, title))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self._count('misses')
+            # Запрос выполняется отдельной задачей: отмена одного из ожидающих её не прерывает
+            task = asyncio.create_task(self._fetch_and_store(key, title))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key, None))
+        else:
+            self._count('coalesced')
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, key, title):
+        try:
+            books = await self.fetch(title)
+        except OpenLibraryError as e:
+            self._count('errors')
+            self.cache.set(key, error=str(e))
+            raise
+        self.cache.set(key, books)
+        return books
+
+    async def _refresh(self, key, title):
+        try:
+            self.cache.set(key, await self.fetch(title))
+        except OpenLibraryError:
+            self._count('errors')
+        finally:
+            self._finish_refresh(key)
+
+    async def fetch(self, title):
+        started = time.perf_counter()
+        try:
+            async with self.semaphore:
+                response = await self.http.get(self._search_url(), params={'title': title})
+            response.raise_for_status()
+            docs = response.json().get('docs', [])
+        except (self._httpx.HTTPError, ValueError) as e:
+            raise OpenLibraryError(str(e) or e.__class__.__name__) from e
+        finally:
+            self._count('upstream_requests')
+            self._count('upstream_seconds', time.perf_counter() - started)
+        return format_docs(docs)
+
+    async def aclose(self):
+        # Фоновые обновления кеша используют пул соединений: дожидаемся их перед закрытием
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.http.aclose()
+
+
+def format_docs(docs):
+    books = []
+    for book in docs[:MAX_RESULTS]:  # Ограничиваем 20 результатами
+        books.append({
+            'title': book.get('title'),
+            'author': ', '.join(book.get('author_name', [])),
+            'year': book.get('first_publish_year'),
+            'cover_id': book.get('cover_i'),
+            'url': f"https://openlibrary.org{book.get('key')}",
+        })
+    return books
+
+
+_client = None
+_client_lock = threading.Lock()
+_shared_cache = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_cache():
+    """Кеш ответов, общий для синхронного и асинхронных клиентов процесса"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _client_lock:
+            if _shared_cache is None:
+                _shared_cache = TTLLRUCache(settings.OPENLIBRARY_CACHE_SIZE)
+    return _shared_cache
+
+
+def get_client():
+    """Общий для процесса клиент (пул соединений и кеш переиспользуются между запросами)"""
+    global _client
+    if _client is None:
+        cache = get_cache()
+        with _client_lock:
+            if _client is None:
+                _client = OpenLibraryClient(cache=cache)
+    return _client
+
+
+def get_async_client():
+    """
+    Асинхронный клиент текущего цикла событий. Под ASGI цикл один на процесс, поэтому
+    пул соединений и объединение запросов общие; соединения httpx нельзя переносить
+    между циклами. Клиент закрывается вызовом close_async_client() в том же цикле.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOpenLibraryClient(cache=get_cache())
+    return client
+
+
+async def close_async_client():
+    """Закрывает асинхронный клиент текущего цикла событий (если он создавался)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def async_client(shared=True):
+    """
+    Асинхронный клиент для одного запроса. shared=True - общий клиент цикла событий
+    (ASGI: цикл живёт столько же, сколько процесс). При shared=False (async-представление
+    под WSGI, где у каждого запроса свой цикл) создаётся отдельный клиент, который
+    закрывается по выходу из блока, чтобы соединения не оставались открытыми.
+    """
+    if shared:
+        yield get_async_client()
+        return
+    client = AsyncOpenLibraryClient(cache=get_cache())
+    try:
+        yield client
+    finally:
+        await client.aclose()
+
+
+def reset_clients():
+    """
+    Сбрасывает клиентов и кеш процесса (тесты, замеры): следующие вызовы get_client()
+    и get_async_client() создадут новых клиентов с пустым кешем. Асинхронные клиенты
+    нужно закрыть заранее через close_async_client() в их цикле событий.
+    """
+    global _client, _shared_cache
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
+        _shared_cache = None
+        _async_clients.clear()
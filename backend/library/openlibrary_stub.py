@@ -0,0 +1,96 @@
+"""
+Локальная заглушка OpenLibrary (/search.json) для проверки клиента без доступа в интернет.
+
+    with FakeOpenLibraryServer(latency=0.05) as server:
+        client = OpenLibraryClient(base_url=server.url)
+        ...
+        server.requests_served  # сколько запросов дошло до «сервиса»
+
+Название, содержащее слово "error", возвращает ответ 503.
+"""
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_docs(title, count=5):
+    """Детерминированный ответ OpenLibrary для заданного названия"""
+    return [
+        {
+            'key': f"/works/OL{zlib.crc32(f'{title}:{i}'.encode()) % 10 ** 6}W",
+            'title': f'{title} ({i + 1})',
+            'author_name': [f'Автор {i + 1}'],
+            'first_publish_year': 1900 + i,
+            'cover_i': 1000 + i,
+        }
+        for i in range(count)
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        title = parse_qs(url.query).get('title', [''])[0]
+        with server.lock:
+            server.requests_served += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path != '/search.json':
+            status, payload = 404, {'error': 'not found'}
+        elif 'error' in title.lower():
+            status, payload = 503, {'error': 'service unavailable'}
+        else:
+            docs = fake_docs(title)
+            status, payload = 200, {'numFound': len(docs), 'docs': docs}
+
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeOpenLibraryServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, verbose=False):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.verbose = verbose
+        self.requests_served = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,210 @@
+"""
+Пагинация списков.
+
+KeysetPagination - курсорная (keyset) пагинация по паре (поле сортировки, id): без COUNT(*)
+и OFFSET, поэтому глубокие страницы больших таблиц отдаются так же быстро, как первая.
+Каждому порядку сортировки соответствует составной индекс (см. Meta.indexes моделей).
+
+Общее количество (count) курсорная пагинация возвращает только по запросу (?count=1):
+это отдельный COUNT(*) по всей выборке.
+
+CatalogPagination - курсорная пагинация по умолчанию; при передаче ?page=N (админка)
+используется обычная постраничная пагинация с номерами страниц и общим количеством.
+"""
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _get(obj, name):
+    # Страница может состоять из объектов моделей или из словарей .values() (см. library.fast_serializers)
+    return obj[name] if isinstance(obj, dict) else getattr(obj, name)
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """Первое поле сортировки с учётом OrderingFilter представления: (имя, по убыванию)"""
+        ordering = None
+        for backend in getattr(view, 'filter_backends', None) or []:
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        ordering = ordering or getattr(view, 'ordering', None) or queryset.query.order_by \
+            or queryset.model._meta.ordering or ['pk']
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        field = ordering[0]
+        return field.lstrip('-'), field.startswith('-')
+
+    def get_key_field(self, queryset, name):
+        """Поле модели для ключа или None, если по нему keyset-пагинация невозможна"""
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if '__' in name:
+            return None
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        # NULL не сравнивается операторами < и >, такие поля обслуживает постраничная пагинация
+        if field.null or not field.concrete:
+            return None
+        return field
+
+    def supports(self, request, queryset, view):
+        name, _ = self.get_ordering(request, queryset, view)
+        return self.get_key_field(queryset, name) is not None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        name, descending = self.get_ordering(request, queryset, view)
+        self.count = queryset.count() if self.wants_count(request) else None
+        self.field = self.get_key_field(queryset, name)
+        self.attname = self.field.attname
+        self.descending = descending
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['previous'])
+        # Для предыдущей страницы идём в обратную сторону и затем разворачиваем результат
+        backwards = descending != reverse
+        sign = '-' if backwards else ''
+        if self.field.primary_key:
+            order_by = [f'{sign}pk']
+        else:
+            order_by = [f'{sign}{self.attname}', f'{sign}pk']
+        queryset = queryset.order_by(*order_by)
+
+        if cursor:
+            op = 'lt' if backwards else 'gt'
+            if self.field.primary_key:
+                queryset = queryset.filter(**{f'pk__{op}': cursor['id']})
+            else:
+                # Избыточное условие (>= / <=) по первому полю даёт планировщику диапазон индекса:
+                # без него условие с OR SQLite и PostgreSQL могут выполнить полным просмотром с сортировкой
+                queryset = queryset.filter(
+                    Q(**{f'{self.attname}__{op}e': cursor['value']}),
+                    Q(**{f'{self.attname}__{op}': cursor['value']})
+                    | Q(**{self.attname: cursor['value'], f'pk__{op}': cursor['id']})
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = cursor is not None, has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        count = [('count', self.count)] if self.count is not None else []
+        return Response(OrderedDict([
+            *count,
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'description': f'Только при ?{self.count_query_param}=1'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link(self.page[-1], previous=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.build_link(self.page[0], previous=True)
+
+    def build_link(self, obj, previous):
+        value = _get(obj, self.attname)
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            # isoformat сохраняет микросекунды, иначе сравнение по ключу было бы неточным
+            value = value.isoformat()
+        pk = _get(obj, self.field.model._meta.pk.attname)
+        payload = json.dumps({'v': value, 'id': pk, 'p': previous}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            return {
+                'value': self.field.to_python(payload['v']),
+                'id': self.field.model._meta.pk.to_python(payload['id']),
+                'previous': bool(payload.get('p')),
+            }
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class PageNumberCatalogPagination(PageNumberPagination):
+    """Постраничная пагинация с тем же параметром размера страницы, что и у курсорной"""
+    page_size_query_param = KeysetPagination.page_size_query_param
+    max_page_size = KeysetPagination.max_page_size
+
+
+class CatalogPagination(BasePagination):
+    """Курсорная пагинация по умолчанию, постраничная - при явном ?page= (админка)"""
+    page_query_param = PageNumberPagination.page_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        keyset = KeysetPagination()
+        if self.page_query_param in request.query_params or not keyset.supports(request, queryset, view):
+            self.paginator = PageNumberCatalogPagination()
+        else:
+            self.paginator = keyset
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return KeysetPagination().get_paginated_response_schema(schema)
@@ -0,0 +1,88 @@
+"""
+Быстрые JSON-рендерер и парсер для DRF на основе orjson.
+
+Результат совпадает с rest_framework.renderers.JSONRenderer побайтно (компактный UTF-8):
+даты и время, Decimal, ленивые строки перевода, UUID, QuerySet и прочие типы, которых
+нет в orjson, преобразуются тем же rest_framework.utils.encoders.JSONEncoder.default.
+Запросы с отступом (Accept: application/json; indent=4) и настройки, которые orjson не
+поддерживает (ensure_ascii, нестрогий JSON), передаются стандартной реализации, как и данные,
+которые orjson записал бы иначе: целые вне 64 бит и числа с показателем степени (1e+16).
+Единственное отличие - NaN и бесконечность: orjson записывает их как null, а стандартный
+рендерер отказывается их сериализовать.
+
+orjson - необязательная зависимость: без него классы работают как стандартные.
+"""
+import codecs
+import re
+
+from django.conf import settings
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import encoders
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+_default = encoders.JSONEncoder().default
+# Показатель степени числа: orjson пишет 1e16 и 1e-7, json - 1e+16 и 1e-07. Шаблон начинается
+# с литерала, поэтому поиск быстрый; цифра перед «e» проверяется отдельно (см. _has_exponent)
+_EXPONENT_RE = re.compile(rb'e[-0-9]')
+
+
+def _has_exponent(ret):
+    # Совпадение внутри строки ("1e5") лишь переключает на стандартный рендерер - результат тот же
+    return any(ret[match.start() - 1:match.start()].isdigit() for match in _EXPONENT_RE.finditer(ret))
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer на orjson (см. описание модуля)"""
+
+    def _use_orjson(self, accepted_media_type, renderer_context):
+        return (
+            orjson is not None and self.ensure_ascii is False and self.compact and self.strict
+            and self.encoder_class is encoders.JSONEncoder
+            and not self.get_indent(accepted_media_type, renderer_context or {})
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with metrics.timed('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if not self._use_orjson(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Даты и время - через default, чтобы формат совпадал с DRF (миллисекунды, «Z» для UTC)
+        try:
+            ret = orjson.dumps(data, default=_default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Например, целые вне 64 бит - их сериализует стандартный кодировщик (или сообщит об ошибке)
+            return super().render(data, accepted_media_type, renderer_context)
+        if _has_exponent(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как JSONRenderer: U+2028 и U+2029 допустимы в JSON, но не в JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson (тела в UTF-8; иные кодировки разбирает стандартный парсер)"""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
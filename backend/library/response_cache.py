@@ -0,0 +1,190 @@
+"""
+Кеш ответов API для часто читаемых представлений каталога.
+
+Кешируются данные ответа (до рендеринга) GET-запросов list/retrieve. Ключ строится из
+адреса (хост, путь, отсортированные параметры), варианта аутентификации (анонимный
+пользователь или класс аутентификации + id пользователя) и поколений моделей, от которых
+зависит представление. Изменение модели (сигналы post_save/post_delete, массовые операции)
+увеличивает её поколение после фиксации транзакции - старые ключи перестают использоваться
+и вытесняются по таймауту, а представления, не зависящие от модели, свой кеш сохраняют.
+
+При промахе ответ вычисляет только один запрос (блокировка через cache.add), остальные
+ждут готовый результат - защита от "эффекта толпы". Счётчики попаданий и промахов хранятся
+в том же кеше и общие для всех процессов (python manage.py response_cache_stats).
+
+Клиент, закреплённый за основной БД после записи (library.db_router), кеш не читает, а ответ,
+вычисленный по реплике, хранится не дольше DATABASE_REPLICA_PIN_SECONDS: иначе отставшая реплика
+оставила бы в кеше устаревшие данные под ключом нового поколения.
+
+Работает с любым бэкендом кеша Django, в том числе locmem и filebased.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from . import db_router
+
+KEY_PREFIX = 'respcache'
+STATS = ('hits', 'misses', 'waits', 'invalidations')
+# Интервал опроса кеша при ожидании ответа, который вычисляет другой запрос
+POLL_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _model_label(model):
+    return model._meta.label_lower
+
+
+def _generation_key(label):
+    return f'{KEY_PREFIX}:gen:{label}'
+
+
+def _stats_key(name):
+    return f'{KEY_PREFIX}:stats:{name}'
+
+
+def _incr(cache, key, delta=1, initial=None):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Ключа нет (ещё не создан или вытеснен)
+        value = delta if initial is None else initial
+        cache.set(key, value, None)
+        return value
+
+
+def count(name, delta=1):
+    _incr(get_cache(), _stats_key(name), delta)
+
+
+def get_stats():
+    cache = get_cache()
+    values = cache.get_many([_stats_key(name) for name in STATS])
+    return {name: values.get(_stats_key(name), 0) for name in STATS}
+
+
+def reset_stats():
+    get_cache().delete_many([_stats_key(name) for name in STATS])
+
+
+def get_generations(labels):
+    """Текущие поколения моделей; отсутствующие создаются заново с уникальным значением"""
+    cache = get_cache()
+    keys = {label: _generation_key(label) for label in labels}
+    values = cache.get_many(list(keys.values()))
+    generations = {}
+    for label, key in keys.items():
+        value = values.get(key)
+        if value is None:
+            # Начальное значение по времени: после очистки кеша старые ключи не совпадут
+            cache.add(key, time.time_ns(), None)
+            value = cache.get(key)
+        generations[label] = value
+    return generations
+
+
+def invalidate(*models, using=None):
+    """Сбрасывает кеш представлений, зависящих от моделей, после фиксации транзакции"""
+    labels = {_model_label(model) for model in models}
+
+    def bump():
+        cache = get_cache()
+        for label in labels:
+            _incr(cache, _generation_key(label), initial=time.time_ns())
+        count('invalidations', len(labels))
+    transaction.on_commit(bump, using=using)
+
+
+def clear():
+    """Сбрасывает кеш ответов всех моделей (счётчики сохраняются)"""
+    from django.apps import apps
+
+    cache = get_cache()
+    for model in apps.get_models():
+        _incr(cache, _generation_key(_model_label(model)), initial=time.time_ns())
+
+
+class CachedResponseMixin:
+    """
+    Примесь для представлений DRF: кеширует ответы list и retrieve.
+    cache_dependencies - модели, изменение которых должно сбрасывать кеш представления.
+    """
+    cache_dependencies = ()
+    cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_variant(self, request):
+        authenticator = request.successful_authenticator
+        if authenticator is None:
+            return 'anon'
+        return f'{type(authenticator).__name__}:{request.user.pk}'
+
+    def get_cache_key(self, request):
+        labels = sorted(_model_label(model) for model in self.cache_dependencies)
+        generations = get_generations(labels)
+        query = urlencode(sorted(
+            (name, value) for name, values in request.query_params.lists() for value in values
+        ))
+        parts = [
+            request.scheme, request.get_host(), request.path, query, self.get_cache_variant(request),
+            *(f'{label}={generations[label]}' for label in labels),
+        ]
+        digest = hashlib.sha1('\0'.join(map(str, parts)).encode()).hexdigest()
+        return f'{KEY_PREFIX}:{type(self).__name__}:{digest}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED or request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        entry = None if db_router.is_pinned() else cache.get(key)
+        if entry is not None:
+            count('hits')
+            return self._cached(entry, 'HIT')
+
+        lock_key = f'{key}:lock'
+        locked = cache.add(lock_key, 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT)
+        if not locked and not db_router.is_pinned():
+            # Ответ уже вычисляет другой запрос - ждём его, но не дольше RESPONSE_CACHE_WAIT
+            deadline = time.monotonic() + settings.RESPONSE_CACHE_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    count('waits')
+                    return self._cached(entry, 'HIT')
+                if cache.get(lock_key) is None:
+                    break
+
+        count('misses')
+        try:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200 and not response.exception:
+                timeout = self.cache_timeout if self.cache_timeout is not None else settings.RESPONSE_CACHE_TIMEOUT
+                if db_router.used_replica():
+                    timeout = min(timeout, settings.DATABASE_REPLICA_PIN_SECONDS)
+                cache.set(key, {'data': response.data, 'status': response.status_code}, timeout)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def _cached(self, entry, state):
+        response = Response(entry['data'], status=entry['status'])
+        response['X-Cache'] = state
+        return response
@@ -0,0 +1,261 @@
+"""
+Полнотекстовый поиск по каталогу книг.
+
+Индекс строится по названию, имени автора, жанру и описанию книги:
+- PostgreSQL: колонка library_book.search_vector (tsvector, русская и английская
+  морфология, веса A-D) с GIN-индексом;
+- SQLite: виртуальная таблица FTS5 library_book_fts (стемминг Porter для английского,
+  для русского - отбрасывание окончаний и префиксный поиск);
+- прочие СУБД: поиск через icontains без ранжирования.
+
+Индекс обновляется обработчиками сигналов (library.signals) и командой rebuild_search_index.
+"""
+import html
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Book
+
+FTS_TABLE = 'library_book_fts'
+# Максимальное количество ранжированных результатов, из которых формируются страницы
+MAX_RESULTS = 1000
+# Поля книги, изменение которых требует переиндексации
+INDEXED_FIELDS = {'title', 'description', 'author', 'author_id', 'genre', 'genre_id'}
+
+# Служебные маркеры подсветки: экранируем текст и только потом превращаем их в <mark>
+_HL_START, _HL_STOP = '\x02', '\x03'
+_BATCH_SIZE = 500
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_CYRILLIC_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+_RUSSIAN_ENDINGS = sorted([
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'иях', 'ием',
+    'ах', 'ях', 'ам', 'ям', 'ом', 'ем', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ых', 'их', 'ую', 'юю', 'ов', 'ев', 'ью', 'ия', 'ию', 'ии',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+_PG_DOCUMENT = (
+    "setweight(to_tsvector('russian', coalesce(b.title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(b.title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(a.name, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(a.name, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(g.name, '')), 'C') || "
+    "setweight(to_tsvector('russian', coalesce(b.description, '')), 'D') || "
+    "setweight(to_tsvector('english', coalesce(b.description, '')), 'D')"
+)
+_PG_QUERY = "(websearch_to_tsquery('russian', %s) || websearch_to_tsquery('english', %s))"
+
+
+def _connection(using=None, read=False):
+    # Поиск читает по правилам роутера (в том числе с реплики), обслуживание индекса - через БД для записи
+    route = router.db_for_read if read else router.db_for_write
+    return connections[using or route(Book)]
+
+
+def _backend(connection):
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and _fts_table_exists(connection):
+        return 'sqlite'
+    return None
+
+
+def _fts_table_exists(connection):
+    # Таблица FTS5 создаётся миграцией только если SQLite собран с поддержкой FTS5
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _BATCH_SIZE):
+        yield ids[start:start + _BATCH_SIZE]
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _russian_stem(word):
+    for ending in _RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def build_fts5_query(query):
+    """Преобразует пользовательский запрос в безопасное выражение FTS5"""
+    terms = []
+    for word in _WORD_RE.findall(query.lower()):
+        if _CYRILLIC_RE.search(word):
+            terms.append(f'"{_russian_stem(word)}"*')
+        else:
+            terms.append(f'"{word}"')
+    return ' '.join(terms)
+
+
+def _highlight(text):
+    """Экранирует фрагмент и заменяет служебные маркеры на теги <mark>"""
+    if not text:
+        return None
+    return html.escape(text).replace(_HL_START, '<mark>').replace(_HL_STOP, '</mark>')
+
+
+# --- Поддержка индекса ---
+
+def create_index(connection):
+    """Создаёт структуры поискового индекса (вызывается из миграции)"""
+    backend = _backend(connection)
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            cursor.execute('ALTER TABLE library_book ADD COLUMN IF NOT EXISTS search_vector tsvector')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS library_book_search_vector_gin '
+                'ON library_book USING GIN (search_vector)'
+            )
+        elif connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                    "title, author, genre, description, tokenize = 'porter unicode61 remove_diacritics 2')"
+                )
+            except Exception:
+                # SQLite собран без FTS5 - остаётся поиск через icontains
+                return
+    rebuild_index(using=connection.alias)
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS library_book_search_vector_gin')
+            cursor.execute('ALTER TABLE library_book DROP COLUMN IF EXISTS search_vector')
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def index_books(book_ids, using=None):
+    """Переиндексирует указанные книги"""
+    connection = _connection(using)
+    backend = _backend(connection)
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(book_ids):
+            if backend == 'postgresql':
+                cursor.execute(
+                    f'UPDATE library_book AS b SET search_vector = {_PG_DOCUMENT} '
+                    'FROM library_author AS a, library_genre AS g '
+                    f'WHERE a.id = b.author_id AND g.id = b.genre_id AND b.id IN ({_placeholders(chunk)})',
+                    chunk,
+                )
+            else:
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({_placeholders(chunk)})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, title, author, genre, description) '
+                    'SELECT b.id, b.title, a.name, g.name, b.description FROM library_book AS b '
+                    'JOIN library_author AS a ON a.id = b.author_id '
+                    'JOIN library_genre AS g ON g.id = b.genre_id '
+                    f'WHERE b.id IN ({_placeholders(chunk)})',
+                    chunk,
+                )
+
+
+def remove_books(book_ids, using=None):
+    """Удаляет книги из индекса (в PostgreSQL вектор удаляется вместе со строкой)"""
+    connection = _connection(using)
+    if _backend(connection) != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(book_ids):
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({_placeholders(chunk)})', chunk)
+
+
+def rebuild_index(using=None):
+    """Полностью перестраивает индекс; возвращает количество проиндексированных книг"""
+    connection = _connection(using)
+    backend = _backend(connection)
+    if backend is None:
+        return 0
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            cursor.execute(
+                f'UPDATE library_book AS b SET search_vector = {_PG_DOCUMENT} '
+                'FROM library_author AS a, library_genre AS g '
+                'WHERE a.id = b.author_id AND g.id = b.genre_id'
+            )
+            return cursor.rowcount
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, author, genre, description) '
+            'SELECT b.id, b.title, a.name, g.name, b.description FROM library_book AS b '
+            'JOIN library_author AS a ON a.id = b.author_id '
+            'JOIN library_genre AS g ON g.id = b.genre_id'
+        )
+        return cursor.rowcount
+
+
+# --- Поиск ---
+
+def search_book_ids(query, limit=MAX_RESULTS, using=None):
+    """Возвращает список пар (id книги, релевантность), отсортированный по убыванию релевантности"""
+    connection = _connection(using, read=True)
+    backend = _backend(connection)
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            cursor.execute(
+                f'SELECT b.id, ts_rank_cd(b.search_vector, q, 32) AS rank '
+                f'FROM library_book AS b, {_PG_QUERY} AS q '
+                'WHERE b.search_vector @@ q ORDER BY rank DESC, b.title, b.id LIMIT %s',
+                [query, query, limit],
+            )
+            return [(book_id, float(rank)) for book_id, rank in cursor.fetchall()]
+        if backend == 'sqlite':
+            match = build_fts5_query(query)
+            if not match:
+                return []
+            # bm25 возвращает отрицательные значения: чем меньше, тем релевантнее
+            cursor.execute(
+                f'SELECT rowid, -bm25({FTS_TABLE}, 10.0, 5.0, 2.0, 1.0) AS rank FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s ORDER BY rank DESC, rowid LIMIT %s',
+                [match, limit],
+            )
+            return [(book_id, float(rank)) for book_id, rank in cursor.fetchall()]
+
+    lookup = Q()
+    for word in _WORD_RE.findall(query):
+        lookup &= (
+            Q(title__icontains=word) | Q(author__name__icontains=word)
+            | Q(genre__name__icontains=word) | Q(description__icontains=word)
+        )
+    if not lookup:
+        return []
+    ids = Book.objects.using(connection.alias).filter(lookup).values_list('id', flat=True)[:limit]
+    return [(book_id, 0.0) for book_id in ids]
+
+
+def build_snippets(query, book_ids, using=None):
+    """Возвращает словарь {id книги: HTML-фрагмент с подсветкой <mark>} для страницы результатов"""
+    connection = _connection(using, read=True)
+    backend = _backend(connection)
+    book_ids = list(book_ids)
+    if not book_ids or backend is None:
+        return {}
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            options = f'StartSel={_HL_START}, StopSel={_HL_STOP}, MaxFragments=2, MaxWords=20, MinWords=5'
+            cursor.execute(
+                "SELECT b.id, ts_headline('russian', concat_ws(' — ', b.title, b.description), q, %s) "
+                f'FROM library_book AS b, {_PG_QUERY} AS q WHERE b.id IN ({_placeholders(book_ids)})',
+                [options, query, query, *book_ids],
+            )
+        else:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, -1, %s, %s, '…', 16) FROM {FTS_TABLE} "
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid IN ({_placeholders(book_ids)})',
+                [_HL_START, _HL_STOP, build_fts5_query(query), *book_ids],
+            )
+        return {book_id: _highlight(snippet) for book_id, snippet in cursor.fetchall()}
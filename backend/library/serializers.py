@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Book, Review, SiteSetting, Author, Genre
+from . import covers
+from .fieldsets import SparseFieldsetSerializerMixin
 
 # Сериализатор для пользователя
 class UserSerializer(serializers.ModelSerializer):
@@ -9,29 +11,36 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'date_joined', 'is_staff', 'is_superuser', 'is_active']
         read_only_fields = ['id', 'date_joined']
 
+# Колонки модели Book для полей, которые вычисляются из нескольких колонок (см. library.fieldsets)
+BOOK_FIELD_REQUIREMENTS = {
+    'cover_image_url': ['cover_image'],
+    'cover_images': ['cover_image', 'cover_derivatives'],
+    'file_url': ['file'],
+    'average_rating': ['rating_sum', 'reviews_count'],
+    'rating_histogram': [f'rating_{i}_count' for i in range(1, 6)],
+}
+
 # Сериализатор для книги
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     cover_image_url = serializers.SerializerMethodField()
+    cover_images = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
     author_name = serializers.CharField(source='author.name', read_only=True)
     genre_name = serializers.CharField(source='genre.name', read_only=True)
+    # Агрегаты рейтинга хранятся в самой книге и не требуют дополнительных запросов
+    average_rating = serializers.FloatField(read_only=True)
+    reviews_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    total_pages = serializers.IntegerField(source='text_pages', read_only=True)
+    sparse_requirements = BOOK_FIELD_REQUIREMENTS
     
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'genre', 'publication_year', 'isbn', 'description', 
-                 'cover_image', 'file', 'cover_image_url', 'file_url', 'author_name', 'genre_name']
+                 'cover_image', 'file', 'cover_image_url', 'cover_images', 'file_url', 'author_name', 'genre_name',
+                 'average_rating', 'reviews_count', 'rating_histogram', 'total_pages']
         read_only_fields = ['id']  # id будет только для чтения
     
-    def create(self, validated_data):
-        # Логируем данные для отладки
-        print("Creating book with data:", validated_data)
-        return super().create(validated_data)
-    
-    def update(self, instance, validated_data):
-        # Логируем данные для отладки
-        print("Updating book with data:", validated_data)
-        return super().update(instance, validated_data)
-    
     def get_cover_image_url(self, obj):
         if obj.cover_image:
             request = self.context.get('request')
@@ -40,6 +49,11 @@ class BookSerializer(serializers.ModelSerializer):
             return obj.cover_image.url
         return None
     
+    def get_cover_images(self, obj):
+        # Копии обложки разных размеров и форматов (для <picture> и srcset)
+        request = self.context.get('request')
+        return covers.cover_images(obj, request.build_absolute_uri if request else str)
+
     def get_file_url(self, obj):
         if obj.file:
             request = self.context.get('request')
@@ -48,22 +62,40 @@ class BookSerializer(serializers.ModelSerializer):
             return obj.file.url
         return None
 
+# Сериализатор результата полнотекстового поиска: книга + релевантность и фрагмент с подсветкой
+class BookSearchResultSerializer(BookSerializer):
+    sparse_requirements = {**BOOK_FIELD_REQUIREMENTS, 'rank': None, 'highlight': None}
+    rank = serializers.FloatField(read_only=True)
+    highlight = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta(BookSerializer.Meta):
+        fields = BookSerializer.Meta.fields + ['rank', 'highlight']
+
+# Сериализатор страницы читалки
+class BookPageSerializer(serializers.Serializer):
+    book = serializers.IntegerField()
+    page = serializers.IntegerField()
+    total_pages = serializers.IntegerField()
+    start = serializers.IntegerField()
+    end = serializers.IntegerField()
+    text = serializers.CharField()
+
 # Сериализатор для отзыва
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
         read_only_fields = ['id', 'created_at']  # id и дата создания только для чтения
 
 # Сериализатор для автора
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Author
         fields = ['id', 'name', 'birth_year', 'nationality', 'biography']
         read_only_fields = ['id']
 
 # Сериализатор для жанра
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ['id', 'name', 'description']
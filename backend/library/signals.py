@@ -0,0 +1,87 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import covers, jobs, response_cache, search
+from .conditional import bump_catalog_version
+from .models import Author, Book, Genre, Review, apply_rating_delta, recalculate_book_ratings
+
+
+# Поддержка агрегатов рейтинга книги при создании, редактировании и удалении отзыва
+@receiver(post_save, sender=Review)
+def update_book_rating_on_save(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        # При загрузке фикстур агрегаты приходят вместе с книгами
+        return
+    if created:
+        apply_rating_delta(instance.book_id, instance.rating, 1, using=using)
+        return
+
+    previous = getattr(instance, '_previous_rating_state', None)
+    if previous is None:
+        # Прежнее состояние неизвестно - пересчитываем книгу полностью
+        recalculate_book_ratings({instance.book_id}, using=using)
+        return
+    old_book_id, old_rating, _ = previous
+    if old_book_id != instance.book_id or old_rating != instance.rating:
+        apply_rating_delta(old_book_id, old_rating, -1, using=using)
+        apply_rating_delta(instance.book_id, instance.rating, 1, using=using)
+
+
+@receiver(post_delete, sender=Review)
+def update_book_rating_on_delete(sender, instance, using, **kwargs):
+    # При удалении через QuerySet экземпляры загружены из БД непосредственно перед удалением
+    previous = getattr(instance, '_previous_rating_state', None)
+    book_id, rating = previous[:2] if previous else (instance.book_id, instance.rating)
+    apply_rating_delta(book_id, rating, -1, using=using)
+
+
+# Поддержка полнотекстового индекса книг (см. library.search)
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, raw, using, update_fields=None, **kwargs):
+    if update_fields is not None and not search.INDEXED_FIELDS & set(update_fields):
+        return
+    search.index_books([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_from_index(sender, instance, using, **kwargs):
+    search.remove_books([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def reindex_related_books(sender, instance, raw, using, created, **kwargs):
+    if created:
+        return
+    search.index_books(instance.books.using(using).values_list('pk', flat=True), using=using)
+
+
+# Нормализация txt-файла книги в UTF-8 один раз после загрузки или замены файла (в фоне)
+@receiver(post_save, sender=Book)
+def normalize_book_text_on_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    if (instance.file.name or '') != instance.text_source:
+        jobs.enqueue('library.normalize_book_text', {'book_id': instance.pk})
+
+
+# Уменьшенные копии обложки создаются один раз после загрузки или замены обложки (в фоне)
+@receiver(post_save, sender=Book)
+def update_cover_derivatives_on_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    if covers.needs_update(instance):
+        jobs.enqueue('library.update_cover_derivatives', {'book_id': instance.pk})
+
+
+# Любое изменение каталога меняет его версию (ETag ответов)
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Review)
+def bump_catalog_version_on_change(sender, using, **kwargs):
+    bump_catalog_version(using=using)
+    response_cache.invalidate(sender, using=using)
@@ -0,0 +1,47 @@
+"""
+Фоновые задачи приложения library (выполняются командой runworker, см. library.jobs).
+
+Задачи идемпотентны: повторный запуск (после сбоя или дублирующей постановки в очередь)
+не меняет результат.
+"""
+from . import covers, response_cache, search, textfiles
+from .conditional import bump_catalog_version
+from .jobs import task
+from .models import Book, recalculate_book_ratings
+
+
+def _book_changed():
+    # Задачи обновляют книгу через update() без сигналов - версию каталога и кеш ответов сбрасываем явно
+    bump_catalog_version()
+    response_cache.invalidate(Book)
+
+
+@task('library.normalize_book_text')
+def normalize_book_text(book_id, force=False):
+    book = Book.objects.filter(pk=book_id).first()
+    if book is None:
+        return
+    if force or (book.file.name or '') != book.text_source:
+        if textfiles.normalize_book_text(book):
+            _book_changed()
+
+
+@task('library.update_cover_derivatives')
+def update_cover_derivatives(book_id, force=False):
+    book = Book.objects.filter(pk=book_id).first()
+    if book is None:
+        return
+    if force or covers.needs_update(book):
+        covers.update_cover_derivatives(book)
+        _book_changed()
+
+
+@task('library.recalculate_ratings')
+def recalculate_ratings(book_ids=None):
+    if recalculate_book_ratings(book_ids):
+        _book_changed()
+
+
+@task('library.rebuild_search_index')
+def rebuild_search_index():
+    search.rebuild_index()
@@ -1,3 +1,1370 @@
-from django.test import TestCase
+import asyncio
+import codecs
+import datetime
+import decimal
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from PIL import Image
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from . import compression, covers, db_router, jobs, metrics, openlibrary, response_cache, textfiles
+from .compression import CompressionMiddleware
+from .fast_serializers import FastBookRows
+from .management.commands import check_query_plans, import_books
+from .models import Author, Book, Genre, ImportCheckpoint, Job, Review
+from .openlibrary_stub import FakeOpenLibraryServer, fake_docs
+from .renderers import FastJSONParser, FastJSONRenderer
+from .textfiles import TranscodedTextFile
+
+
+class CatalogTestCase(TestCase):
+    """
+    Основа тестов каталога: пустые кеши, временный MEDIA_ROOT и быстрый хешер паролей.
+    Изменения, которые должны быть видны после фиксации транзакции (версия каталога,
+    поколения кеша ответов), выполняются внутри self.captureOnCommitCallbacks(execute=True).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            MEDIA_ROOT=cls.media_root, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        ))
+        super().setUpClass()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    @classmethod
+    def make_book(cls, title='Книга', author=None, genre=None, **kwargs):
+        author = author or Author.objects.get_or_create(name='Автор')[0]
+        genre = genre or Genre.objects.get_or_create(name='Жанр')[0]
+        return Book.objects.create(title=title, author=author, genre=genre, **kwargs)
+
+    @classmethod
+    def make_user(cls, username='reader', **kwargs):
+        return User.objects.create_user(username=username, password='password123', **kwargs)
+
+
+class RatingAggregatesTests(CatalogTestCase):
+    """Агрегаты рейтинга Book"""
+
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book()
+        self.users = [self.make_user(f'user{i}') for i in range(3)]
+
+    def assertAggregates(self, book, rating_sum, reviews_count, histogram):
+        book.refresh_from_db()
+        self.assertEqual(book.rating_sum, rating_sum)
+        self.assertEqual(book.reviews_count, reviews_count)
+        self.assertEqual(book.rating_histogram, {str(i): histogram.get(i, 0) for i in range(1, 6)})
+
+    def test_save_and_delete_apply_deltas(self):
+        first = Review.objects.create(book=self.book, user=self.users[0], rating=5, comment='')
+        Review.objects.create(book=self.book, user=self.users[1], rating=2, comment='')
+        self.assertAggregates(self.book, 7, 2, {5: 1, 2: 1})
+        self.assertEqual(Book.objects.get(pk=self.book.pk).average_rating, 3.5)
+
+        first.rating = 3
+        first.save()
+        self.assertAggregates(self.book, 5, 2, {3: 1, 2: 1})
+
+        first.delete()
+        self.assertAggregates(self.book, 2, 1, {2: 1})
+
+    def test_moving_review_to_another_book(self):
+        other = self.make_book('Другая книга')
+        review = Review.objects.create(book=self.book, user=self.users[0], rating=4, comment='')
+        review.book = other
+        review.save()
+        self.assertAggregates(self.book, 0, 0, {})
+        self.assertAggregates(other, 4, 1, {4: 1})
+        self.assertIsNone(Book.objects.get(pk=self.book.pk).average_rating)
+
+    def test_bulk_operations_recalculate(self):
+        reviews = Review.objects.bulk_create([
+            Review(book=self.book, user=user, rating=rating, comment='')
+            for user, rating in zip(self.users, (1, 4, 5))
+        ])
+        self.assertAggregates(self.book, 10, 3, {1: 1, 4: 1, 5: 1})
+
+        Review.objects.filter(rating=1).update(rating=2)
+        self.assertAggregates(self.book, 11, 3, {2: 1, 4: 1, 5: 1})
+
+        reviews[2].rating = 3
+        Review.objects.bulk_update([reviews[2]], ['rating'])
+        self.assertAggregates(self.book, 9, 3, {2: 1, 4: 1, 3: 1})
+
+        Review.objects.filter(rating__gte=3).delete()
+        self.assertAggregates(self.book, 2, 1, {2: 1})
+
+    def test_recalculate_ratings_command(self):
+        Review.objects.create(book=self.book, user=self.users[0], rating=5, comment='')
+        Book.objects.filter(pk=self.book.pk).update(rating_sum=100, reviews_count=7)
+
+        with self.assertRaises(CommandError):
+            call_command('recalculate_ratings', '--check', stdout=io.StringIO())
+        url = f'/api/books/{self.book.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recalculate_ratings', stdout=io.StringIO())
+        self.assertAggregates(self.book, 5, 1, {5: 1})
+        call_command('recalculate_ratings', '--check', stdout=io.StringIO())
+        # Исправленные агрегаты меняют версию каталога и не отдаются из кеша ответов
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['average_rating'], 5)
+
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class ListQueryCountTests(CatalogTestCase):
+    """Число SQL-запросов списков не зависит от числа строк"""
+
+    def add_rows(self, count):
+        start = Book.objects.count()
+        for i in range(start, start + count):
+            author = Author.objects.create(name=f'Автор {i}')
+            genre = Genre.objects.create(name=f'Жанр {i}')
+            book = self.make_book(f'Книга {i}', author=author, genre=genre)
+            Review.objects.create(book=book, user=self.make_user(f'user{i}'), rating=i % 5 + 1, comment='')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_endpoints_have_constant_query_count(self):
+        urls = ['/api/books/', '/api/authors/', '/api/genres/', '/api/reviews/', '/api/books/?page=1']
+        self.add_rows(2)
+        small = {url: self.count_queries(url) for url in urls}
+        self.add_rows(8)
+        large = {url: self.count_queries(url) for url in urls}
+        self.assertEqual(small, large)
+
+    def test_books_count_is_annotated(self):
+        self.add_rows(3)
+        response = self.client.get('/api/authors/')
+        counts = {row['name']: row['books_count'] for row in response.json()['results']}
+        self.assertEqual(counts, {'Автор 0': 1, 'Автор 1': 1, 'Автор 2': 1})
+
+
+@skipUnless(connection.vendor in ('postgresql', 'sqlite'), 'Полнотекстовый индекс - PostgreSQL или SQLite FTS5')
+class SearchTests(CatalogTestCase):
+    """Полнотекстовый поиск /api/books/search/"""
+
+    def setUp(self):
+        super().setUp()
+        self.tolstoy = Author.objects.create(name='Лев Толстой')
+        self.war = self.make_book('Война и мир', author=self.tolstoy, description='Роман-эпопея')
+        self.other = self.make_book('Севастопольские рассказы', description='Рассказы о войне <b>1855</b> года')
+        self.unrelated = self.make_book('Dune', description='Desert planet')
+
+    def search(self, query):
+        response = self.client.get('/api/books/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_title_match_ranks_first_and_word_forms_match(self):
+        results = self.search('войны')
+        self.assertEqual([row['id'] for row in results], [self.war.pk, self.other.pk])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+
+    def test_highlight_is_escaped(self):
+        results = self.search('рассказы')
+        self.assertIn('<mark>', results[0]['highlight'])
+        self.assertNotIn('<b>', results[0]['highlight'])
+
+    def test_english_and_author_fields(self):
+        self.assertEqual([row['id'] for row in self.search('planets')], [self.unrelated.pk])
+        self.assertEqual([row['id'] for row in self.search('толстой')], [self.war.pk])
+
+    def test_index_follows_changes(self):
+        self.war.title = 'Анна Каренина'
+        self.war.save()
+        self.assertEqual([row['id'] for row in self.search('каренина')], [self.war.pk])
+        self.tolstoy.name = 'Л. Н. Толстой'
+        self.tolstoy.save()
+        self.assertEqual([row['id'] for row in self.search('толстой')], [self.war.pk])
+        self.war.delete()
+        self.assertEqual(self.search('каренина'), [])
+
+    def test_empty_query(self):
+        self.assertEqual(self.client.get('/api/books/search/', {'q': ' '}).status_code, 400)
+        self.assertEqual(self.search('!!!'), [])
+
+
+class DownloadTxtTests(CatalogTestCase):
+    """Потоковая выдача txt с перекодированием и Range/If-Range"""
+    text = 'Глава 1\nЖили-были дед да баба.\n' * 200
+
+    def write_file(self, name, data):
+        os.makedirs(os.path.join(self.media_root, 'books'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'books', name), 'wb') as f:
+            f.write(data)
+        return f'/media/books/{name}'
+
+    def test_cp1251_is_streamed_without_computing_size(self):
+        url = self.write_file('cp1251.txt', self.text.encode('cp1251'))
+        with mock.patch.object(TranscodedTextFile, 'size', new_callable=mock.PropertyMock) as size:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Content-Length', response)
+            self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), self.text)
+        size.assert_not_called()
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range_over_transcoded_text(self):
+        url = self.write_file('range.txt', self.text.encode('cp1251'))
+        data = self.text.encode('utf-8')
+        response = self.client.get(url, HTTP_RANGE='bytes=10-99')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-99/{len(data)}')
+        self.assertEqual(b''.join(response.streaming_content), data[10:100])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), data[-5:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(data)}-').status_code, 416)
+
+    def test_if_range(self):
+        url = self.write_file('if-range.txt', self.text.encode('utf-8'))
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(self.text.encode('utf-8')))
+
+    def test_utf8_bom_is_stripped(self):
+        url = self.write_file('bom.txt', codecs.BOM_UTF8 + self.text.encode('utf-8'))
+        response = self.client.get(url)
+        self.assertEqual(int(response['Content-Length']), len(self.text.encode('utf-8')))
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), self.text)
+
+    def test_missing_file_and_traversal(self):
+        self.assertEqual(self.client.get('/media/books/missing.txt').status_code, 404)
+        self.assertEqual(self.client.get('/media/books/../../etc/passwd.txt').status_code, 404)
+
+
+@override_settings(JOBS_EAGER=True)
+class NormalizedTextTests(CatalogTestCase):
+    """Нормализованная UTF-8 копия загруженного txt"""
+    text = 'Первая строка\nВторая строка\nбез перевода строки'
+
+    def upload(self, book, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            book.file = SimpleUploadedFile(name, data)
+            book.save()
+        book.refresh_from_db()
+        return book
+
+    def test_upload_creates_utf8_copy(self):
+        book = self.upload(self.make_book(), 'cp1251.txt', self.text.encode('cp1251'))
+        data = self.text.encode('utf-8')
+        self.assertEqual(book.text_source, book.file.name)
+        self.assertEqual(book.text_encoding, 'cp1251')
+        self.assertEqual((book.text_size, book.text_lines), (len(data), 3))
+        self.assertEqual(book.text_sha256, hashlib.sha256(data).hexdigest())
+        with book.text_file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+
+        response = self.client.get('/' + book.file.url.lstrip('/'))
+        self.assertEqual(response['ETag'], f'"{book.text_sha256}"')
+        self.assertEqual(int(response['Content-Length']), len(data))
+        self.assertEqual(b''.join(response.streaming_content), data)
+
+    def test_replacing_and_removing_file(self):
+        book = self.upload(self.make_book(), 'first.txt', codecs.BOM_UTF8 + self.text.encode('utf-8'))
+        old_copy = book.text_file.path
+        book = self.upload(book, 'second.txt', 'Другой текст\n'.encode('utf-8'))
+        self.assertFalse(os.path.exists(old_copy))
+        self.assertEqual(book.text_encoding, 'utf-8')
+        self.assertEqual(book.text_lines, 1)
+
+        new_copy = book.text_file.path
+        book = self.upload(book, 'scan.pdf', b'%PDF-1.4')
+        self.assertFalse(book.text_file)
+        self.assertEqual((book.text_source, book.text_size), ('', None))
+        self.assertFalse(os.path.exists(new_copy))
+
+    @override_settings(JOBS_EAGER=False)
+    def test_normalize_book_texts_command(self):
+        book = self.make_book()
+        book.file = SimpleUploadedFile('later.txt', self.text.encode('cp1251'))
+        book.save()
+        self.assertFalse(Book.objects.get(pk=book.pk).text_file)
+
+        call_command('normalize_book_texts', stdout=io.StringIO())
+        book.refresh_from_db()
+        self.assertEqual(book.text_encoding, 'cp1251')
+        self.assertEqual(book.text_source, book.file.name)
+        self.assertTrue(os.path.exists(book.text_file.path))
+
+
+@override_settings(JOBS_EAGER=True)
+class BookPageTests(CatalogTestCase):
+    """Страницы читалки по индексу смещений"""
+
+    def setUp(self):
+        super().setUp()
+        self.lines = [f'Строка номер {i}: ' + 'текст ' * 20 + '\n' for i in range(200)]
+        self.book = self.make_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.file = SimpleUploadedFile('reader.txt', ''.join(self.lines).encode('cp1251'))
+            self.book.save()
+        self.book.refresh_from_db()
+
+    def page(self, number):
+        return self.client.get(f'/api/books/{self.book.pk}/pages/{number}/')
+
+    def test_pages_cover_text_on_line_boundaries(self):
+        self.assertGreater(self.book.text_pages, 1)
+        texts = []
+        for number in range(1, self.book.text_pages + 1):
+            data = self.page(number).json()
+            self.assertEqual(data['total_pages'], self.book.text_pages)
+            self.assertTrue(data['text'].endswith('\n'))
+            self.assertLessEqual(data['end'] - data['start'], textfiles.PAGE_SIZE)
+            texts.append(data['text'])
+        self.assertEqual(''.join(texts), ''.join(self.lines))
+        self.assertEqual(self.page(self.book.text_pages + 1).status_code, 404)
+        self.assertEqual(self.page(0).status_code, 404)
+
+    def test_missing_index_is_not_built_by_reads(self):
+        os.remove(textfiles.page_index_path(self.book.text_file.path))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.page(1)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        # Ответ без страницы не получает валидатор: на него нельзя получить 304
+        self.assertNotIn('ETag', response)
+        self.assertFalse([query for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')])
+        self.assertFalse(os.path.exists(textfiles.page_index_path(self.book.text_file.path)))
+
+        # Индекс восстанавливает нормализация (обработчик задач или normalize_book_texts)
+        Book.objects.filter(pk=self.book.pk).update(text_pages=None)
+        call_command('normalize_book_texts', stdout=io.StringIO())
+        response = self.page(1)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+
+    def test_book_without_text(self):
+        book = self.make_book('Без текста')
+        self.assertEqual(self.client.get(f'/api/books/{book.pk}/pages/1/').status_code, 404)
+        self.assertEqual(self.client.get('/api/books/0/pages/1/').status_code, 404)
+
+
+class OpenLibraryClientTests(SimpleTestCase):
+    """Клиент OpenLibrary с кешем против локальной заглушки"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeOpenLibraryServer().start()
+        cls.addClassCleanup(cls.server.stop)
+
+    def make_client(self, **kwargs):
+        return openlibrary.OpenLibraryClient(base_url=self.server.url, **kwargs)
+
+    def served(self):
+        return self.server.requests_served
+
+    def test_cache_hit_by_normalized_title(self):
+        client = self.make_client()
+        before = self.served()
+        books = client.search_books('Война и мир')
+        self.assertEqual(books, openlibrary.format_docs(fake_docs('Война и мир')))
+        self.assertEqual(client.search_books('  война   И МИР '), books)
+        self.assertEqual(self.served() - before, 1)
+        self.assertEqual((client.stats['misses'], client.stats['hits']), (1, 1))
+
+    def test_errors_are_cached_for_negative_ttl(self):
+        client = self.make_client(negative_ttl=60)
+        before = self.served()
+        for _ in range(3):
+            with self.assertRaises(openlibrary.OpenLibraryError):
+                client.search_books('error book')
+        self.assertEqual(self.served() - before, 1)
+        self.assertEqual(client.stats['negative_hits'], 2)
+
+        expired = self.make_client(negative_ttl=0)
+        for _ in range(2):
+            with self.assertRaises(openlibrary.OpenLibraryError):
+                expired.search_books('error book')
+        self.assertEqual(self.served() - before, 3)
+
+    def test_stale_response_is_served_and_refreshed_in_background(self):
+        client = self.make_client(ttl=0, stale_ttl=60)
+        before = self.served()
+        books = client.search_books('Stale')
+        self.assertEqual(client.search_books('Stale'), books)
+        self.assertEqual(client.stats['stale_hits'], 1)
+        deadline = time.monotonic() + 5
+        while self.served() - before < 2 or client._refreshing:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(client.stats['misses'], 1)
+
+    def test_lru_eviction(self):
+        cache = openlibrary.TTLLRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a')[0], 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_view(self):
+        client = self.make_client()
+        with mock.patch.object(openlibrary, 'get_client', return_value=client):
+            response = self.client.get('/api/find_openlibrary_books/', {'title': 'Мастер'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), openlibrary.format_docs(fake_docs('Мастер')))
+            self.assertEqual(self.client.get('/api/find_openlibrary_books/', {'title': 'error'}).status_code, 500)
+            self.assertEqual(self.client.get('/api/find_openlibrary_books/').status_code, 400)
+
+
+class AsyncOpenLibraryClientTests(SimpleTestCase):
+    """Асинхронный клиент: объединение запросов и закрытие соединений"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeOpenLibraryServer(latency=0.1).start()
+        cls.addClassCleanup(cls.server.stop)
+        cls.enterClassContext(override_settings(OPENLIBRARY_URL=cls.server.url))
+
+    def setUp(self):
+        openlibrary.reset_clients()
+        self.addCleanup(openlibrary.reset_clients)
+
+    async def test_simultaneous_searches_are_coalesced(self):
+        client = openlibrary.AsyncOpenLibraryClient()
+        before = self.server.requests_served
+        try:
+            results = await asyncio.gather(*(client.search_books('Одна книга') for _ in range(10)))
+        finally:
+            await client.aclose()
+        self.assertEqual(self.server.requests_served - before, 1)
+        self.assertEqual(client.stats['coalesced'], 9)
+        self.assertTrue(all(books == results[0] for books in results))
+        self.assertTrue(client.http.is_closed)
+
+    async def test_shared_client_is_closed_publicly(self):
+        client = openlibrary.get_async_client()
+        self.assertIs(openlibrary.get_async_client(), client)
+        await openlibrary.close_async_client()
+        self.assertTrue(client.http.is_closed)
+        self.assertIsNot(openlibrary.get_async_client(), client)
+        await openlibrary.close_async_client()
+
+    async def test_asgi_view_uses_shared_client(self):
+        response = await self.async_client.get('/api/find_openlibrary_books_async/', {'title': 'ASGI'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), openlibrary.format_docs(fake_docs('ASGI')))
+        client = openlibrary.get_async_client()
+        self.assertFalse(client.http.is_closed)
+        await openlibrary.close_async_client()
+
+    def test_wsgi_view_closes_its_client(self):
+        closed = []
+        aclose = openlibrary.AsyncOpenLibraryClient.aclose
+
+        async def tracked_aclose(client):
+            await aclose(client)
+            closed.append(client.http.is_closed)
+
+        with mock.patch.object(openlibrary.AsyncOpenLibraryClient, 'aclose', tracked_aclose):
+            response = self.client.get('/api/find_openlibrary_books_async/', {'title': 'WSGI'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(closed, [True])
+
+
+class ImportBooksTests(CatalogTestCase):
+    """Массовый импорт каталога"""
+
+    def write_jsonl(self, records):
+        path = os.path.join(self.media_root, 'import.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def run_import(self, path, **options):
+        stderr = io.StringIO()
+        call_command('import_books', path, stdout=io.StringIO(), stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_numeric_values_are_coerced_and_invalid_records_skipped(self):
+        path = self.write_jsonl([
+            {'title': 1984, 'author': 'Оруэлл', 'isbn': 9780451524935, 'publication_year': 1949},
+            {'title': 'Без автора', 'genre': 7},
+            {'title': 'Список', 'isbn': ['978']},
+            {'author': 'Без названия'},
+        ])
+        errors = self.run_import(path)
+        self.assertIn('Запись 3', errors)
+        book = Book.objects.get(title='1984')
+        self.assertEqual((book.isbn, book.author.name, book.publication_year), ('9780451524935', 'Оруэлл', 1949))
+        other = Book.objects.get(title='Без автора')
+        self.assertEqual((other.author.name, other.genre.name), ('Неизвестный автор', '7'))
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_checkpoint_is_saved_with_batch(self):
+        path = self.write_jsonl([{'title': f'Книга {i}', 'author': 'Автор'} for i in range(5)])
+        original_flush = import_books.Command.flush
+        calls = []
+
+        def failing_flush(command, books, position):
+            calls.append(position)
+            if len(calls) == 2:
+                # Сбой внутри транзакции второго пакета: ни книги, ни контрольная точка не сохраняются
+                with transaction.atomic():
+                    original_flush(command, books, position)
+                    raise RuntimeError('сбой')
+            original_flush(command, books, position)
+
+        with mock.patch.object(import_books.Command, 'flush', failing_flush), self.assertRaises(RuntimeError):
+            self.run_import(path, checkpoint='catalog', batch_size=2)
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get(name='catalog').records, 2)
+
+        self.run_import(path, checkpoint='catalog', batch_size=2)
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), [f'Книга {i}' for i in range(5)])
+        self.assertEqual(ImportCheckpoint.objects.get(name='catalog').records, 5)
+
+        with self.assertRaises(CommandError):
+            self.run_import(self.write_jsonl([]).replace('import.jsonl', 'other.jsonl'), checkpoint='catalog')
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class KeysetPaginationTests(CatalogTestCase):
+    """Курсорная пагинация списков"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Повторяющиеся названия: порядок между ними задаёт id
+        for title in ['Б', 'А', 'В', 'А', 'Г', 'Б', 'Д']:
+            cls.make_book(title)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            pages.append(data)
+            url = data['next']
+        return pages
+
+    def ids(self, pages):
+        return [book['id'] for page in pages for book in page['results']]
+
+    def test_forward_and_backward(self):
+        for ordering, expected in [
+            ('title', list(Book.objects.order_by('title', 'pk').values_list('pk', flat=True))),
+            ('-title', list(Book.objects.order_by('-title', '-pk').values_list('pk', flat=True))),
+        ]:
+            with self.subTest(ordering=ordering):
+                pages = self.walk(f'/api/books/?ordering={ordering}&page_size=3')
+                self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+                self.assertEqual(self.ids(pages), expected)
+                self.assertIsNone(pages[0]['previous'])
+
+                # Обратно по ссылкам previous от последней страницы
+                back, url = [], pages[-1]['previous']
+                while url:
+                    data = self.client.get(url).json()
+                    back.insert(0, data)
+                    url = data['previous']
+                self.assertEqual(self.ids(back), expected[:6])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/books/?cursor=not-a-cursor').status_code, 404)
+
+    def test_count_on_request(self):
+        data = self.client.get('/api/books/?count=1&page_size=3').json()
+        self.assertEqual((data['count'], len(data['results'])), (7, 3))
+        # Параметр сохраняется в ссылках на соседние страницы
+        self.assertEqual(self.client.get(data['next']).json()['count'], 7)
+        self.assertNotIn('count', self.client.get('/api/books/?count=0').json())
+
+    def test_page_number_mode(self):
+        data = self.client.get('/api/books/?page=2&page_size=3').json()
+        self.assertEqual(data['count'], 7)
+        self.assertEqual(len(data['results']), 3)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class ConditionalRequestTests(CatalogTestCase):
+    """ETag версии каталога и ответы 304"""
+
+    def test_not_modified_until_catalog_changes(self):
+        book = self.make_book()
+        response = self.client.get('/api/books/')
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Время изменения не участвует: запись в ту же секунду тоже меняет ETag
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.title = 'Новое название'
+            book.save()
+        response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_request_variant(self):
+        self.make_book()
+        etag = self.client.get('/api/books/')['ETag']
+        self.assertNotEqual(self.client.get('/api/books/?ordering=-title')['ETag'], etag)
+        self.assertEqual(self.client.get('/api/books/?ordering=-title', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# Без реплик: тест проверяет кеш ответов, а не маршрутизацию чтения
+@override_settings(DATABASE_REPLICAS=[])
+class ReviewUpdateCacheTests(TransactionTestCase):
+    """Сброс кеша ответов после массового update отзывов"""
+
+    def setUp(self):
+        author = Author.objects.create(name='Автор')
+        genre = Genre.objects.create(name='Жанр')
+        self.book = Book.objects.create(title='Книга', author=author, genre=genre)
+        self.user = User.objects.create_user('reader', password='password123')
+        Review.objects.create(book=self.book, user=self.user, rating=3, comment='старый')
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    def backends(self):
+        return {
+            'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'review-update'},
+            'filebased': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                          'LOCATION': self.cache_dir},
+        }
+
+    def comments(self):
+        return [review['comment'] for review in self.client.get('/api/reviews/').json()['results']]
+
+    def test_update_invalidates_after_write(self):
+        for name, backend in self.backends().items():
+            for kwargs in ({'comment': f'{name}: новый'}, {'rating': 5, 'comment': f'{name}: с оценкой'}):
+                with self.subTest(backend=name, fields=sorted(kwargs)), \
+                        override_settings(CACHES={'default': backend}, RESPONSE_CACHE_ENABLED=True):
+                    caches['default'].clear()
+                    self.comments()
+                    seen = []
+                    incr = response_cache._incr
+
+                    def tracked_incr(*args, **kw):
+                        # Что видит запрос, пришедший в момент сброса поколения
+                        seen.append(Review.objects.get().comment)
+                        return incr(*args, **kw)
+
+                    with mock.patch.object(response_cache, '_incr', tracked_incr):
+                        Review.objects.filter(book=self.book).update(**kwargs)
+                    self.assertTrue(seen)
+                    self.assertEqual(set(seen), {kwargs['comment']})
+                    self.assertEqual(self.comments(), [kwargs['comment']])
+        self.assertEqual(Book.objects.get().average_rating, 5)
+
+
+@override_settings(JOBS_EAGER=True)
+class CoverDerivativesTests(CatalogTestCase):
+    """Уменьшенные копии обложек"""
+
+    def image(self, size, mode='RGBA', name='cover.png'):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def set_cover(self, book, cover):
+        with self.captureOnCommitCallbacks(execute=True):
+            book.cover_image = cover
+            book.save()
+        book.refresh_from_db()
+
+    def test_derivatives_are_generated_and_replaced(self):
+        book = self.make_book()
+        self.set_cover(book, self.image((1000, 1500)))
+        sizes = book.cover_derivatives['sizes']
+        self.assertEqual(book.cover_derivatives['source'], book.cover_image.name)
+        self.assertEqual({size: (info['width'], info['height']) for size, info in sizes.items()},
+                         {'full': (800, 1200), 'card': (320, 480), 'thumbnail': (160, 240)})
+        storage = book.cover_image.storage
+        old_files = covers.derivative_names(book.cover_derivatives)
+        self.assertEqual(len(old_files), 3 * len(covers.FORMATS))
+        for info in sizes.values():
+            self.assertEqual(set(info['files']), set(covers.FORMATS))
+            with storage.open(info['files']['jpeg']) as f:
+                self.assertEqual(Image.open(f).size, (info['width'], info['height']))
+
+        images = self.client.get(f'/api/books/{book.pk}/').json()['cover_images']
+        self.assertEqual(images['thumbnail']['width'], 160)
+        self.assertTrue(images['thumbnail']['jpeg'].startswith('http://testserver/'))
+        self.assertEqual(len(images['srcset']['jpeg'].split(', ')), 3)
+
+        # Маленькая обложка не увеличивается, а одинаковые копии не дублируются в srcset
+        self.set_cover(book, self.image((100, 150), mode='RGB', name='small.png'))
+        self.assertTrue(all(not storage.exists(name) for name in old_files))
+        images = self.client.get(f'/api/books/{book.pk}/').json()['cover_images']
+        self.assertEqual(images['full']['width'], 100)
+        self.assertEqual(len(images['srcset']['jpeg'].split(', ')), 1)
+
+        new_files = covers.derivative_names(book.cover_derivatives)
+        self.set_cover(book, None)
+        self.assertEqual(book.cover_derivatives, {})
+        self.assertTrue(all(not storage.exists(name) for name in new_files))
+        self.assertIsNone(self.client.get(f'/api/books/{book.pk}/').json()['cover_images'])
+
+    def test_names_do_not_collide(self):
+        # Оригинал, имя которого совпадает с именем копии другой обложки
+        lookalike = self.make_book('Похожее имя')
+        self.set_cover(lookalike, self.image((300, 450), name='same.png.full.jpg'))
+        books = [self.make_book(f'Книга {name}') for name in ('same.png', 'same.jpg')]
+        for book, name in zip(books, ('same.png', 'same.jpg')):
+            self.set_cover(book, self.image((1000, 1500), name=name))
+        storage = books[0].cover_image.storage
+
+        files = [covers.derivative_names(book.cover_derivatives) for book in books]
+        self.assertFalse(files[0] & files[1])
+        self.assertFalse(lookalike.cover_image.name in files[0] | files[1])
+        for book in [*books, lookalike]:
+            book.refresh_from_db()
+            self.assertTrue(storage.exists(book.cover_image.name))
+            self.assertTrue(all(storage.exists(name) for name in covers.derivative_names(book.cover_derivatives)))
+
+        # Повторное создание копий той же обложки не трогает файлы других книг
+        previous = files[0]
+        covers.update_cover_derivatives(books[0])
+        current = covers.derivative_names(books[0].cover_derivatives)
+        self.assertTrue(all(storage.exists(name) for name in current))
+        self.assertTrue(all(not storage.exists(name) for name in previous - current))
+        self.assertTrue(all(storage.exists(name) for name in files[1]))
+        self.assertTrue(storage.exists(lookalike.cover_image.name))
+
+
+_task_calls = []
+
+
+@jobs.task('tests.record')
+def _record_task(value):
+    _task_calls.append(value)
+
+
+@jobs.task('tests.fail')
+def _failing_task():
+    raise RuntimeError('ошибка задачи')
+
+
+@override_settings(JOBS_EAGER=False, JOBS_MAX_ATTEMPTS=2)
+class JobQueueTests(TransactionTestCase):
+    """Очередь фоновых задач в БД"""
+
+    def setUp(self):
+        _task_calls.clear()
+
+    def test_retry_and_failure(self):
+        job = jobs.enqueue('tests.fail')
+        self.assertEqual((job.status, job.max_attempts), (Job.QUEUED, 2))
+        with self.assertRaises(LookupError):
+            jobs.enqueue('tests.unknown')
+
+        [claimed] = jobs.claim_jobs('test-worker')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (job.pk, Job.RUNNING, 1))
+        self.assertEqual(jobs.claim_jobs('other-worker'), [])
+        success, error, _ = jobs.execute(claimed.task, claimed.payload)
+        self.assertFalse(success)
+        self.assertIn('ошибка задачи', error)
+
+        # Первая неудача - повтор с задержкой, вторая - окончательная ошибка
+        self.assertEqual(jobs.complete_job(claimed, success, error), Job.QUEUED)
+        job.refresh_from_db()
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(jobs.claim_jobs('test-worker'), [])
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        [claimed] = jobs.claim_jobs('test-worker')
+        self.assertEqual(jobs.complete_job(claimed, False, error), Job.FAILED)
+
+        self.assertEqual(jobs.retry(Job.objects.all()), 1)
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    def test_requeue_stale(self):
+        jobs.enqueue('tests.record', {'value': 1})
+        jobs.enqueue('tests.record', {'value': 2}, max_attempts=1)
+        jobs.claim_jobs('crashed-worker', limit=2)
+        Job.objects.update(started_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(timeout=60), (1, 1))
+        self.assertEqual(sorted(Job.objects.values_list('status', flat=True)), [Job.FAILED, Job.QUEUED])
+
+    def test_complete_ignores_lost_job(self):
+        jobs.enqueue('tests.record', {'value': 1})
+        [stale] = jobs.claim_jobs('crashed-worker')
+        Job.objects.update(started_at=timezone.now() - datetime.timedelta(hours=1))
+        jobs.requeue_stale(timeout=60)
+        [claimed] = jobs.claim_jobs('new-worker')
+
+        # Опоздавший обработчик не перезаписывает состояние задачи, выполняемой другим
+        self.assertIsNone(jobs.complete_job(stale, False, 'поздно'))
+        self.assertIsNone(jobs.complete_job(stale, True))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.locked_by, job.attempts), (Job.RUNNING, 'new-worker', 2))
+        self.assertNotEqual(job.last_error, 'поздно')
+        self.assertEqual(jobs.complete_job(claimed, True), Job.DONE)
+
+    def test_runworker_burst(self):
+        for value in range(5):
+            jobs.enqueue('tests.record', {'value': value}, priority=value % 2)
+        jobs.enqueue('tests.record', {'value': 'later'}, delay=datetime.timedelta(hours=1))
+        call_command('runworker', burst=True, concurrency=2, stdout=io.StringIO())
+        self.assertEqual(sorted(_task_calls), list(range(5)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 5)
+        self.assertEqual(Job.objects.get(status=Job.QUEUED).payload, {'value': 'later'})
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_after_commit(self):
+        with transaction.atomic():
+            self.assertIsNone(jobs.enqueue('tests.record', {'value': 'eager'}))
+            self.assertEqual(_task_calls, [])
+        self.assertEqual(_task_calls, ['eager'])
+        self.assertFalse(Job.objects.exists())
+
+
+@override_settings(JOBS_EAGER=True, RESPONSE_CACHE_ENABLED=False)
+class FastBookRowsTests(CatalogTestCase):
+    """FastBookRows совпадает с BookSerializer для любых наборов полей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = cls.make_book('Анна Каренина', publication_year=1877, isbn='978-5-00', description='Роман')
+        cls.make_book('Без файлов', author=Author.objects.create(name='Другой автор'))
+        user = cls.make_user()
+        Review.objects.create(book=cls.book, user=user, rating=4)
+        Review.objects.create(book=cls.book, user=cls.make_user('second'), rating=5)
+
+    def setUp(self):
+        super().setUp()
+        cover = io.BytesIO()
+        Image.new('RGB', (400, 600), (10, 120, 200)).save(cover, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.cover_image = SimpleUploadedFile('обложка 1.png', cover.getvalue())
+            self.book.file = SimpleUploadedFile('текст книги.txt', 'Текст\n'.encode())
+            self.book.save()
+
+    def field_sets(self, serializer_class):
+        names = serializer_class.Meta.fields
+        return [None] + [[name] for name in names] + [
+            ['id', 'title', 'author_name', 'genre_name'],
+            ['cover_image', 'cover_image_url', 'cover_images', 'file', 'file_url'],
+            ['average_rating', 'reviews_count', 'rating_histogram', 'total_pages'],
+        ]
+
+    def test_parity_with_serializers(self):
+        from api.serializers import BookSerializer as ApiBookSerializer
+        from .serializers import BookSerializer
+
+        factory = RequestFactory()
+        for serializer_class in (BookSerializer, ApiBookSerializer):
+            for fields in self.field_sets(serializer_class):
+                with self.subTest(serializer=serializer_class.__module__, fields=fields):
+                    request = factory.get('/api/books/', {'fields': ','.join(fields)} if fields else {})
+                    expected = serializer_class(
+                        Book.objects.select_related('author', 'genre').order_by('pk'),
+                        many=True, context={'request': request},
+                    ).data
+                    rows = FastBookRows(serializer_class, request, fields=fields)
+                    actual = rows.to_representation(rows.values(Book.objects.order_by('pk')))
+                    # Побайтное совпадение, включая порядок ключей
+                    self.assertEqual(json.dumps(actual, ensure_ascii=False), json.dumps(expected, ensure_ascii=False))
+
+    def test_list_endpoint(self):
+        for query in ('', '?fields=id,title,cover_images,file_url', '?omit=description,rating_histogram'):
+            with self.subTest(query=query):
+                with override_settings(BOOKS_FAST_SERIALIZER=True):
+                    fast = self.client.get(f'/api/books/{query}').content
+                with override_settings(BOOKS_FAST_SERIALIZER=False):
+                    slow = self.client.get(f'/api/books/{query}').content
+                self.assertEqual(fast, slow)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class SparseFieldsetTests(CatalogTestCase):
+    """?fields= и ?omit= сокращают и ответ, и SQL-запрос"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = cls.make_book(description='Длинное описание')
+        cls.make_book('Вторая')
+        Review.objects.create(book=cls.book, user=cls.make_user(), rating=5, comment='Отлично')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+
+    def test_fields_limit_columns_and_joins(self):
+        data, sql = self.get(f'/api/books/{self.book.pk}/?fields=id,title')
+        self.assertEqual(data, {'id': self.book.pk, 'title': self.book.title})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('JOIN', sql)
+
+        data, sql = self.get(f'/api/books/{self.book.pk}/?fields=id,author_name')
+        self.assertEqual(data['author_name'], 'Автор')
+        self.assertIn('JOIN', sql)
+
+    def test_counts_only_when_requested(self):
+        data, sql = self.get('/api/authors/')
+        self.assertEqual(data['results'][0]['books_count'], 2)
+        self.assertIn('COUNT("library_book"', sql)
+
+        for url in ('/api/authors/?fields=id,name', '/api/authors/?omit=books_count,biography'):
+            with self.subTest(url=url):
+                data, sql = self.get(url)
+                self.assertNotIn('books_count', data['results'][0])
+                self.assertNotIn('library_book', sql)
+                self.assertNotIn('"biography"', sql)
+
+    def test_omit_and_list(self):
+        data, _ = self.get('/api/reviews/?omit=comment,book_title')
+        self.assertNotIn('comment', data['results'][0])
+        self.assertIn('rating', data['results'][0])
+        data, _ = self.get('/api/books/?fields=id,title')
+        self.assertEqual([set(book) - {'is_favorited'} for book in data['results']], [{'id', 'title'}] * 2)
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/books/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+        self.assertIn('omit', self.client.get('/api/genres/?omit=secret').json())
+
+
+@override_settings(COMPRESSION_ENABLED=True, COMPRESSION_MIN_SIZE=200, COMPRESSION_ENCODINGS=['gzip'])
+class CompressionTests(SimpleTestCase):
+    """Сжатие ответов в синхронной и асинхронной цепочке middleware"""
+
+    body = json.dumps([{'title': f'Книга {i}', 'description': 'текст ' * 10} for i in range(20)]).encode()
+
+    def request(self, accept='gzip, br;q=0.5'):
+        return RequestFactory().get('/api/books/', HTTP_ACCEPT_ENCODING=accept)
+
+    def json_response(self, body=None):
+        return HttpResponse(body if body is not None else self.body, content_type='application/json')
+
+    def assert_gzip(self, response, body):
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(gzip.decompress(content), body)
+
+    def test_sync(self):
+        middleware = CompressionMiddleware(lambda request: self.json_response())
+        self.assertFalse(middleware.async_mode)
+        response = middleware(self.request())
+        self.assert_gzip(response, self.body)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+
+        self.assertNotIn('Content-Encoding', middleware(self.request(accept='identity')))
+        small = CompressionMiddleware(lambda request: self.json_response(b'[]'))(self.request())
+        self.assertNotIn('Content-Encoding', small)
+        html = CompressionMiddleware(lambda request: HttpResponse(self.body, content_type='text/html'))
+        self.assertNotIn('Content-Encoding', html(self.request()))
+
+    def test_sync_streaming(self):
+        chunks = [self.body[:100], self.body[100:]]
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(iter(chunks), content_type='text/plain'))
+        self.assert_gzip(middleware(self.request()), self.body)
+
+    async def test_async(self):
+        async def get_response(request):
+            return self.json_response()
+
+        middleware = CompressionMiddleware(get_response)
+        self.assertTrue(middleware.async_mode)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assert_gzip(await middleware(self.request()), self.body)
+
+    async def test_async_streaming(self):
+        async def chunks():
+            yield self.body[:100]
+            yield self.body[100:]
+
+        async def get_response(request):
+            return StreamingHttpResponse(chunks(), content_type='application/json')
+
+        response = await CompressionMiddleware(get_response)(self.request())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(gzip.decompress(content), self.body)
+
+    def test_negotiate(self):
+        encodings = ['zstd', 'br', 'gzip']
+        self.assertEqual(compression.negotiate('gzip, br', encodings), 'br')
+        self.assertEqual(compression.negotiate('gzip;q=1, br;q=0.5', encodings), 'gzip')
+        self.assertEqual(compression.negotiate('*;q=0.1, zstd;q=0', encodings), 'br')
+        self.assertIsNone(compression.negotiate('identity', encodings))
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Рендерер и парсер на orjson совпадают со стандартными DRF"""
+
+    values = [
+        0, -1, 2 ** 63 - 1, 2 ** 64, -(2 ** 63) - 1, 1.5, 0.1, -0.0, 123456789.123, 1e16, 1e-7, 1e300,
+        True, None, '', 'текст "в кавычках" \\ / \x00 \x7f     😀', '1e5',
+        datetime.datetime(2024, 1, 2, 3, 4, 5, 123456),
+        datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        datetime.date(2024, 1, 1), datetime.time(1, 2, 3, 456789), datetime.timedelta(seconds=5),
+        decimal.Decimal('1.10'), uuid.UUID(int=1), gettext_lazy('Книга'), b'bytes',
+        {1: 'a', 'b': [1, 2]}, (1, 2), [], {},
+    ]
+
+    def test_render_parity(self):
+        for value in self.values + [self.values, {'results': self.values}]:
+            with self.subTest(value=value):
+                self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+        indented = 'application/json; indent=2'
+        self.assertEqual(FastJSONRenderer().render({'a': [1]}, indented), JSONRenderer().render({'a': [1]}, indented))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render(object())
+
+    def test_parse_parity(self):
+        body = JSONRenderer().render({'title': 'Книга', 'rating': 5, 'year': None, 'tags': ['a', 1.5]})
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        cp1251 = '{"title": "Книга"}'.encode('cp1251')
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(cp1251), parser_context={'encoding': 'cp1251'}),
+                         {'title': 'Книга'})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"title": '))
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class ExpansionTests(CatalogTestCase):
+    """Раскрытие связанных объектов ?expand="""
+
+    @classmethod
+    def setUpTestData(cls):
+        books = [cls.make_book(f'Книга {i}') for i in range(3)]
+        users = [cls.make_user(f'reader{i}') for i in range(3)]
+        for book in books:
+            for user in users:
+                Review.objects.create(book=book, user=user, rating=4)
+
+    def reviews(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/reviews/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], len(queries)
+
+    def test_expand_loads_each_relation_once(self):
+        plain, plain_queries = self.reviews('')
+        self.assertNotIn('book_detail', plain[0])
+        self.assertNotIn('user_detail', plain[0])
+
+        for fast in (True, False):
+            with self.subTest(fast=fast), override_settings(BOOKS_FAST_SERIALIZER=fast):
+                expanded, queries = self.reviews('?expand=book,user')
+                # Один запрос на каждую раскрытую связь независимо от числа отзывов
+                self.assertEqual(queries, plain_queries + 2)
+                for review in expanded:
+                    self.assertEqual(review['book_detail']['id'], review['book'])
+                    self.assertEqual(review['book_detail']['title'], review['book_title'])
+                    self.assertEqual(review['user_detail'], {'id': review['user'], 'username': review['user_name']})
+
+    def test_expand_with_fields(self):
+        results, _ = self.reviews('?fields=id,rating&expand=book')
+        # ?fields= не действует на вложенную книгу
+        self.assertEqual(set(results[0]), {'id', 'rating', 'book_detail'})
+        self.assertIn('description', results[0]['book_detail'])
+
+    def test_unknown_expansion(self):
+        response = self.client.get('/api/reviews/?expand=book,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expand', response.json())
+
+
+class QueryPlanTests(CatalogTestCase):
+    """Команда check_query_plans: планы запросов эндпоинтов на тестовых данных"""
+
+    def check_plans(self, *args):
+        output = io.StringIO()
+        call_command('check_query_plans', '--json', *args, stdout=output)
+        return {result['endpoint']: result for result in json.loads(output.getvalue())}
+
+    def test_endpoint_plans(self):
+        # Небольшие данные с минимальной плотностью: по 2 книги на автора и жанр, по 3 отзыва на книгу
+        results = self.check_plans('--books', '40', '--users', '20', '--per-user', '6', '--large-rows', '40')
+        self.assertEqual(set(results), {name for name, *_ in check_query_plans.ENDPOINTS})
+        for name, result in results.items():
+            with self.subTest(endpoint=name):
+                self.assertIsNone(result['error'])
+                self.assertTrue(result['queries'])
+                self.assertEqual([query['problems'] for query in result['queries'] if query['problems']], [])
+
+        plans = [line for query in results['reviews_by_book']['queries'] for line in query['plan']]
+        self.assertTrue([line for line in plans if 'review_book_created_id_idx' in line])
+        self.assertFalse([line for line in plans if 'TEMP B-TREE' in line])
+        # Данные создаются в откатываемой транзакции
+        self.assertFalse(Book.objects.exists())
+
+    def test_problems_are_reported(self):
+        rows, problems = check_query_plans.explain(
+            'SELECT id FROM library_book WHERE description = %s ORDER BY text_size', ['x'], {'library_book'},
+        )
+        self.assertEqual(problems, ['полный просмотр library_book', 'USE TEMP B-TREE FOR ORDER BY'])
+        _, problems = check_query_plans.explain('SELECT id FROM library_book WHERE id = %s', [1], {'library_book'})
+        self.assertEqual(problems, [])
+
+    def test_minimum_dataset_size(self):
+        for args in (['--per-user', '1'], ['--books', '30'], ['--books', '1000', '--users', '5', '--per-user', '100']):
+            with self.subTest(args=args), self.assertRaisesMessage(CommandError, 'Слишком мало тестовых данных'):
+                call_command('check_query_plans', *args, stdout=io.StringIO())
+
+
+# Первая реплика из DB_REPLICAS или, если их нет, replica_test из настроек; в тестах это зеркало основной БД
+REPLICA = next(iter(settings.DATABASE_REPLICAS), 'replica_test')
+
+
+@override_settings(
+    DATABASE_REPLICAS=[REPLICA], RESPONSE_CACHE_ENABLED=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение с реплики, закрепление за основной БД и read-your-writes.
+    Реплика в тестах - зеркало основной БД (TEST MIRROR) с отдельным соединением, поэтому
+    TransactionTestCase: данные должны быть зафиксированы, чтобы их видело соединение реплики.
+    """
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.book = CatalogTestCase.make_book('Мастер и Маргарита')
+        self.user = CatalogTestCase.make_user()
+
+    def request(self, method, url, client=None, **kwargs):
+        """Ответ и SQL, выполненный на основной БД и на реплике"""
+        client = client or self.client
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = async_to_sync(getattr(client, method))(url, **kwargs) \
+                if client is self.async_client else getattr(client, method)(url, **kwargs)
+        return response, ' '.join(q['sql'] for q in primary), ' '.join(q['sql'] for q in replica)
+
+    def test_safe_requests_read_from_replica(self):
+        for client in (self.client, self.async_client):
+            with self.subTest(asgi=client is self.async_client):
+                response, primary, replica = self.request('get', '/api/books/', client)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('"library_book"', replica)
+                self.assertNotIn('"library_book"', primary)
+                self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+                # Поиск читает индекс с той же реплики
+                response, primary, replica = self.request('get', '/api/books/search/?q=Мастер', client)
+                self.assertEqual([hit['id'] for hit in response.json()['results']], [self.book.pk])
+                self.assertIn('library_book', replica)
+                self.assertNotIn('library_book', primary)
+
+    def test_write_pins_client_to_primary(self):
+        for client in (self.client, self.async_client):
+            with self.subTest(asgi=client is self.async_client):
+                Review.objects.all().delete()
+                client.cookies.clear()
+                client.force_login(self.user)
+                response, _, _ = self.request('get', '/api/reviews/my_reviews/', client)
+                self.assertEqual(response.json(), [])
+
+                response, primary, replica = self.request(
+                    'post', '/api/reviews/', client,
+                    data={'book': self.book.pk, 'rating': 5, 'comment': 'Отзыв'}, content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 201)
+                self.assertIn(db_router.PIN_COOKIE, response.cookies)
+                self.assertIn('INSERT INTO "library_review"', primary)
+                self.assertEqual(replica, '')
+
+                # Read-your-writes: следующие чтения клиента идут на основную БД
+                response, primary, replica = self.request('get', '/api/reviews/my_reviews/', client)
+                self.assertEqual([review['comment'] for review in response.json()], ['Отзыв'])
+                self.assertIn('"library_review"', primary)
+                self.assertNotIn('"library_review"', replica)
+
+                # Без cookie клиент закреплён по учётным данным (метка в кеше), после её истечения - снова реплика
+                del client.cookies[db_router.PIN_COOKIE]
+                _, primary, replica = self.request('get', '/api/reviews/my_reviews/', client)
+                self.assertIn('"library_review"', primary)
+                self.assertEqual(replica, '')
+                for cache in caches.all():
+                    cache.clear()
+                _, primary, replica = self.request('get', '/api/reviews/my_reviews/', client)
+                self.assertIn('"library_review"', replica)
+                self.assertNotIn('"library_review"', primary)
+
+                # Другой клиент не закреплён
+                _, primary, replica = self.request('get', '/api/reviews/', self.client_class())
+                self.assertIn('"library_review"', replica)
+
+    def test_router_rules(self):
+        router = db_router.PrimaryReplicaRouter()
+        # Вне запроса (команды, обработчик задач) - основная БД
+        self.assertEqual(router.db_for_read(Book), 'default')
+        state = db_router.RoutingState()
+        state.replica = REPLICA
+        token = db_router._state.set(state)
+        self.addCleanup(db_router._state.reset, token)
+        self.assertEqual(router.db_for_read(Book), REPLICA)
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Book), 'default')
+        self.assertEqual(router.db_for_write(Book), 'default')
+        # После записи запрос дочитывает с основной БД
+        self.assertEqual(router.db_for_read(Book), 'default')
+        self.assertTrue(state.used_replica)
+
+    def test_middleware_modes(self):
+        async def async_view(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(db_router.ReplicaRoutingMiddleware(async_view)))
+        self.assertFalse(iscoroutinefunction(db_router.ReplicaRoutingMiddleware(lambda request: HttpResponse())))
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SERVER_TIMING=True, METRICS_DIR='', METRICS_SLOW_REQUEST_MS=60000)
+class MetricsTests(CatalogTestCase):
+    """Замеры запросов (WSGI и ASGI) и доступ к /metrics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            cls.make_book(f'Книга {i}')
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.values.clear()
+
+    def test_request_metrics(self):
+        requests = {'wsgi': self.client.get, 'asgi': async_to_sync(self.async_client.get)}
+        for mode, get in requests.items():
+            with self.subTest(mode=mode), CaptureQueriesContext(connection) as queries:
+                response = get('/api/books/')
+                self.assertEqual(response.status_code, 200)
+                # Запросы считаются и в потоке, где ASGI выполняет синхронное представление
+                self.assertTrue(queries)
+                self.assertRegex(
+                    response['Server-Timing'],
+                    rf'^db;dur=[\d.]+;desc="{len(queries)} queries", serializer;dur=[\d.]+, '
+                    r'render;dur=[\d.]+, total;dur=[\d.]+$',
+                )
+
+        values = metrics.collect()
+        self.assertEqual(values[('http_requests_total', ('book-list-create', 'GET', '200'))], 2)
+        self.assertEqual(values[('http_request_db_queries', ('book-list-create',))][-1], 2)
+        self.assertGreater(values[('http_request_db_queries', ('book-list-create',))][-2], 0)
+
+    def test_middleware_modes(self):
+        async def async_view(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(metrics.MetricsMiddleware(async_view)))
+        self.assertFalse(iscoroutinefunction(metrics.MetricsMiddleware(lambda request: HttpResponse())))
+
+    def test_metrics_access(self):
+        self.client.get('/api/books/')
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with override_settings(METRICS_TOKEN='secret', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_requests_total counter', response.content.decode())
+        self.assertIn('http_requests_total{view="book-list-create",method="GET",status="200"} 1', response.content.decode())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], DATABASE_REPLICAS=[])
+class BenchmarkApiTests(TransactionTestCase):
+    """
+    Команда benchmark_api на маленьком наборе данных.
+    TransactionTestCase: запросы выполняются в потоках со своими подключениями к БД.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        for cache in caches.all():
+            cache.clear()
+        self.output = os.path.join(media_root, 'result.json')
+
+    def benchmark(self, *args):
+        output = io.StringIO()
+        # Один клиент: сценарий token пишет last_login, а параллельная запись в SQLite
+        # упирается в блокировку базы (database is locked) и даёт случайные 500
+        call_command(
+            'benchmark_api', '--requests', '6', '--warmup', '1', '--concurrency', '1', '--books', '30',
+            '--users', '3', '--per-user', '3', '--text-kb', '4', *args, stdout=output,
+        )
+        return output.getvalue()
+
+    def test_report_and_cleanup(self):
+        book = CatalogTestCase.make_book('Книга не из замера')
+        scenarios = ['books', 'reviews_by_book', 'favorites', 'token', 'download_txt']
+        self.benchmark(*[f'--scenario={name}' for name in scenarios], '--output', self.output)
+
+        with open(self.output, encoding='utf-8') as file:
+            report = json.load(file)
+        self.assertEqual(report['meta']['dataset'], {'books': 30, 'users': 3, 'per_user': 3, 'text_kb': 4})
+        self.assertEqual(set(report['scenarios']), set(scenarios))
+        for name, row in report['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual((row['requests'], row['errors'], row['statuses']), (6, 0, {'200': 6}))
+                self.assertLessEqual(row['latency_ms']['p50'], row['latency_ms']['p99'])
+                self.assertGreater(row['bytes_per_request'], 0)
+        # Число SQL-запросов берётся из Server-Timing
+        self.assertGreater(report['scenarios']['books']['queries_per_request']['max'], 0)
+
+        # Тестовые данные и файлы удалены, остальной каталог не затронут
+        self.assertEqual(list(Book.objects.all()), [book])
+        self.assertFalse(User.objects.filter(username__startswith='bench_api').exists())
+        self.assertFalse(Author.objects.filter(name__startswith='bench_api').exists())
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'books')), [])
+
+        output = self.benchmark('--scenario=books', '--compare', self.output)
+        self.assertIn(f'Сравнение с {self.output}', output)
+        self.assertRegex(output, r'\nbooks\s+[-+]\d+%')
+
+    def test_invalid_options(self):
+        with self.assertRaisesMessage(CommandError, 'должны быть положительными'):
+            self.benchmark('--requests', '0')
+        with self.assertRaisesMessage(CommandError, 'только в режиме inprocess'):
+            self.benchmark('--mode', 'http', '--no-response-cache')
@@ -0,0 +1,343 @@
+"""
+Потоковая выдача и нормализация текстовых файлов книг в UTF-8.
+
+Кодировка определяется по ограниченному фрагменту начала файла, перекодирование
+выполняется по частям фиксированного размера, поэтому потребление памяти не зависит
+от размера книги. Поддерживаются HTTP-запросы диапазонов (Range/If-Range) по байтам
+результирующего UTF-8 текста.
+
+При загрузке txt-файла книги один раз создаётся нормализованная UTF-8 копия
+(Book.text_file) вместе с исходной кодировкой, размером, числом строк и SHA-256;
+скачивание затем отдаёт готовые байты без перекодирования.
+
+Для постраничного чтения рядом с копией хранится индекс страниц (<копия>.pages):
+массив смещений начала страниц, по которому страница читается через mmap за O(1).
+
+Там же лежат заранее сжатые копии (<копия>.gz, .br, .zst - по доступным кодекам
+library.compression): скачивание отдаёт их клиентам с подходящим Accept-Encoding
+без сжатия на каждый запрос.
+"""
+import codecs
+import hashlib
+import mmap
+import os
+import struct
+import re
+import tempfile
+
+from django.core.cache import cache
+from django.core.files import File
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import compression
+
+# Размер фрагмента для определения кодировки и размер блока при потоковой передаче
+SAMPLE_SIZE = 64 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+# Порядок проверки кодировок (как и раньше: сначала UTF-8, затем кириллические)
+CANDIDATE_ENCODINGS = ('utf-8-sig', 'utf-8', 'cp1251', 'koi8-r')
+FALLBACK_ENCODING = 'latin-1'
+
+# Размер страницы читалки в байтах UTF-8 (страница заканчивается на границе строки)
+PAGE_SIZE = 4 * 1024
+PAGE_INDEX_SUFFIX = '.pages'
+_OFFSET = struct.Struct('<Q')
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def detect_encoding(path, sample_size=SAMPLE_SIZE):
+    """Определяет кодировку файла по первым sample_size байтам"""
+    with open(path, 'rb') as f:
+        return detect_sample_encoding(f.read(sample_size))
+
+
+def detect_sample_encoding(sample):
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    for encoding in CANDIDATE_ENCODINGS[1:]:
+        # final=False: многобайтовый символ может быть обрезан границей фрагмента
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return FALLBACK_ENCODING
+
+
+class TranscodedTextFile:
+    """Текстовый файл, отдаваемый как UTF-8 с поддержкой чтения произвольного диапазона байт"""
+
+    def __init__(self, path, encoding=None, chunk_size=STREAM_CHUNK_SIZE, etag=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        stat = os.stat(path)
+        self.source_size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.mtime_ns = stat.st_mtime_ns
+        self.encoding = encoding or detect_encoding(path)
+        self._etag = etag
+
+    @property
+    def etag(self):
+        if self._etag:
+            return self._etag
+        return f'"{self.mtime_ns:x}-{self.source_size:x}-{self.encoding}"'
+
+    @property
+    def last_modified(self):
+        return http_date(self.mtime)
+
+    @property
+    def _bom_size(self):
+        return len(codecs.BOM_UTF8) if self.encoding == 'utf-8-sig' else 0
+
+    @property
+    def is_passthrough(self):
+        # UTF-8 отдаётся как есть (без BOM), поэтому смещения совпадают с файлом
+        return self.encoding in ('utf-8', 'utf-8-sig')
+
+    @property
+    def size(self):
+        """Размер результирующего UTF-8 текста в байтах"""
+        if self.is_passthrough:
+            return self.source_size - self._bom_size
+        # Для перекодируемых файлов размер вычисляется одним потоковым проходом и кешируется,
+        # поэтому он запрашивается только там, где без него нельзя (запросы диапазонов)
+        key = f'textfile-size:{self.path}:{self.mtime_ns}:{self.source_size}:{self.encoding}'
+        size = cache.get(key)
+        if size is None:
+            size = sum(len(chunk) for chunk in self._transcoded_chunks())
+            cache.set(key, size, None)
+        return size
+
+    def _transcoded_chunks(self):
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        with open(self.path, 'rb') as f:
+            while True:
+                raw = f.read(self.chunk_size)
+                text = decoder.decode(raw, final=not raw)
+                if text:
+                    yield text.encode('utf-8')
+                if not raw:
+                    break
+
+    def iter_range(self, start=0, end=None):
+        """Генератор блоков UTF-8 для диапазона байт [start, end] включительно (end=None - до конца файла)"""
+        if self.is_passthrough:
+            with open(self.path, 'rb') as f:
+                f.seek(self._bom_size + start)
+                remaining = None if end is None else end - start + 1
+                while remaining is None or remaining > 0:
+                    block = f.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                    if not block:
+                        break
+                    if remaining is not None:
+                        remaining -= len(block)
+                    yield block
+            return
+
+        # Для однобайтовых кодировок пропускаем префикс, перекодируя его без накопления в памяти
+        stop = None if end is None else end + 1
+        offset = 0
+        for chunk in self._transcoded_chunks():
+            chunk_end = offset + len(chunk)
+            if chunk_end > start:
+                yield chunk[max(start - offset, 0):None if stop is None else stop - offset]
+            offset = chunk_end
+            if stop is not None and offset >= stop:
+                break
+
+
+# Поля книги с метаданными нормализованной копии текста
+TEXT_METADATA_FIELDS = [
+    'text_file', 'text_source', 'text_encoding', 'text_size', 'text_lines', 'text_sha256', 'text_pages',
+]
+
+
+def is_text_file(name):
+    return bool(name) and name.lower().endswith('.txt')
+
+
+def normalize_book_text(book, save=True):
+    """
+    Создаёт нормализованную UTF-8 копию txt-файла книги и сохраняет её метаданные.
+    Возвращает True, если копия была (пере)создана.
+    """
+    from .models import Book
+
+    source_name = book.file.name if book.file else ''
+    old_text_name = book.text_file.name if book.text_file else ''
+
+    if not is_text_file(source_name):
+        if not old_text_name and not book.text_source:
+            return False
+        book.text_file = None
+        book.text_source = ''
+        book.text_encoding = ''
+        book.text_size = book.text_lines = None
+        book.text_sha256 = ''
+        book.text_pages = None
+    else:
+        with book.file.open('rb') as source:
+            encoding = detect_sample_encoding(source.read(SAMPLE_SIZE))
+            source.seek(0)
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            digest = hashlib.sha256()
+            size = lines = 0
+            last_byte = b''
+            with tempfile.TemporaryFile() as tmp:
+                while True:
+                    raw = source.read(STREAM_CHUNK_SIZE)
+                    data = decoder.decode(raw, final=not raw).encode('utf-8')
+                    if data:
+                        tmp.write(data)
+                        digest.update(data)
+                        size += len(data)
+                        lines += data.count(b'\n')
+                        last_byte = data[-1:]
+                    if not raw:
+                        break
+                if last_byte and last_byte != b'\n':
+                    # Последняя строка без перевода строки тоже считается
+                    lines += 1
+                tmp.seek(0)
+                book.text_file.save(os.path.basename(source_name), File(tmp), save=False)
+        book.text_source = source_name
+        book.text_encoding = encoding
+        book.text_size = size
+        book.text_lines = lines
+        book.text_sha256 = digest.hexdigest()
+        book.text_pages = build_page_index(book.text_file.path)
+        build_precompressed(book.text_file.path)
+
+    if old_text_name and old_text_name != (book.text_file.name if book.text_file else ''):
+        book.text_file.storage.delete(old_text_name)
+        book.text_file.storage.delete(old_text_name + PAGE_INDEX_SUFFIX)
+        for encoding in compression.CODECS:
+            book.text_file.storage.delete(precompressed_path(old_text_name, encoding))
+    if save:
+        # update() не вызывает сигналы post_save и не перезаписывает остальные поля книги
+        Book.objects.filter(pk=book.pk).update(
+            **{field: getattr(book, field) for field in TEXT_METADATA_FIELDS}
+        )
+    return True
+
+
+def page_index_path(text_path):
+    return text_path + PAGE_INDEX_SUFFIX
+
+
+def _page_end(text, start, page_size):
+    limit = start + page_size
+    if limit >= len(text):
+        return len(text)
+    newline = text.rfind(b'\n', start, limit)
+    if newline >= start:
+        return newline + 1
+    # Строка длиннее страницы - режем по границе символа UTF-8
+    while limit > start and text[limit] & 0xC0 == 0x80:
+        limit -= 1
+    return limit if limit > start else start + page_size
+
+
+def build_page_index(text_path, page_size=PAGE_SIZE):
+    """Строит индекс смещений страниц для UTF-8 файла; возвращает количество страниц"""
+    offsets = [0]
+    if os.path.getsize(text_path):
+        with open(text_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+            while offsets[-1] < len(text):
+                offsets.append(_page_end(text, offsets[-1], page_size))
+    tmp_path = page_index_path(text_path) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for offset in offsets:
+            f.write(_OFFSET.pack(offset))
+    os.replace(tmp_path, page_index_path(text_path))
+    return len(offsets) - 1
+
+
+def read_page(text_path, page):
+    """
+    Читает страницу (нумерация с 1) по индексу смещений.
+    Возвращает (текст, начало, конец, всего страниц) или None, если страницы нет.
+    """
+    index_path = page_index_path(text_path)
+    total = os.path.getsize(index_path) // _OFFSET.size - 1
+    if page < 1 or page > total:
+        return None
+    with open(index_path, 'rb') as f:
+        f.seek((page - 1) * _OFFSET.size)
+        start, end = struct.unpack('<QQ', f.read(2 * _OFFSET.size))
+    with open(text_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+        return text[start:end].decode('utf-8', errors='replace'), start, end, total
+
+
+def precompressed_path(text_path, encoding):
+    return text_path + compression.file_suffix(encoding)
+
+
+def _read_chunks(f):
+    while True:
+        chunk = f.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_precompressed(text_path):
+    """Создаёт сжатые копии файла всеми доступными кодеками (с максимальной степенью сжатия)"""
+    for encoding in compression.CODECS:
+        target = precompressed_path(text_path, encoding)
+        tmp_path = target + '.tmp'
+        with open(text_path, 'rb') as source, open(tmp_path, 'wb') as f:
+            for data in compression.compress_chunks(_read_chunks(source), encoding, precompressed=True):
+                f.write(data)
+        os.replace(tmp_path, target)
+
+
+def find_precompressed(text_path, accept_encoding):
+    """Подходящая по Accept-Encoding сжатая копия: (кодирование, путь) или None"""
+    encodings = [
+        encoding for encoding in compression.available_encodings()
+        if os.path.exists(precompressed_path(text_path, encoding))
+    ]
+    encoding = compression.negotiate(accept_encoding, encodings)
+    if encoding is None:
+        return None
+    return encoding, precompressed_path(text_path, encoding)
+
+
+def parse_range_header(header, size):
+    """
+    Разбирает заголовок Range для одного диапазона.
+    Возвращает (start, end), None если заголовок нужно игнорировать,
+    или False если диапазон невыполним (416).
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        # Несколько диапазонов и прочие единицы не поддерживаются - отдаём файл целиком
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return False
+    return start, end
+
+
+def if_range_matches(header, text_file):
+    """Проверяет условие If-Range: по ETag или по дате изменения"""
+    if not header:
+        return True
+    header = header.strip()
+    if header.startswith(('"', 'W/')):
+        return header == text_file.etag
+    modified_since = parse_http_date_safe(header)
+    return modified_since is not None and text_file.mtime <= modified_since
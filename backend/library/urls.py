@@ -1,9 +1,9 @@
 from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from .views import (
-    RegisterView, ProfileView, find_openlibrary_books,
+    RegisterView, ProfileView, find_openlibrary_books, find_openlibrary_books_async,
     BookListCreateAPIView, BookRetrieveUpdateDestroyAPIView, UserListCreateView, UserRetrieveUpdateDestroyView,
-    SiteSettingViewSet, download_txt
+    SiteSettingViewSet, BookSearchAPIView, BookPageAPIView, download_txt
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -21,13 +21,16 @@ urlpatterns = [
     path('auth/profile/', ProfileView.as_view(), name='profile'),
     # Список книг и создание новой книги (GET, POST
     path('books/', BookListCreateAPIView.as_view(), name='book-list-create'),  # GET, POST
+    path('books/search/', BookSearchAPIView.as_view(), name='book-search'),  # GET ?q=
     path('books/<int:pk>/', BookRetrieveUpdateDestroyAPIView.as_view(), name='book-detail'),  # GET, PUT, PATCH, DELETE
+    path('books/<int:pk>/pages/<int:page>/', BookPageAPIView.as_view(), name='book-page'),  # GET
     # JWT-токены (аутентификация)
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # Поиск книг через OpenLibrary API
     path('find_openlibrary_books/', find_openlibrary_books, name='find_openlibrary_books'),
     path('find_openlibrary_file/', find_openlibrary_books, name='find_openlibrary_file'),  # Алиас для совместимости
+    path('find_openlibrary_books_async/', find_openlibrary_books_async, name='find_openlibrary_books_async'),  # ASGI
     # Список пользователей и создание пользователя
     path('users/', UserListCreateView.as_view(), name='user-list'),
     path('users/<int:pk>/', UserRetrieveUpdateDestroyView.as_view(), name='user-update'),
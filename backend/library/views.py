@@ -1,7 +1,21 @@
-from rest_framework import generics, permissions, viewsets
+from rest_framework import filters, generics, permissions, viewsets
+from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.models import User
-from .models import Book, SiteSetting
-from .serializers import BookSerializer, UserSerializer, SiteSettingSerializer
+from .models import Author, Book, Genre, Review, SiteSetting
+from .serializers import (
+    BookSerializer, BookSearchResultSerializer, BookPageSerializer, UserSerializer, SiteSettingSerializer
+)
+from . import openlibrary, search
+from .openlibrary import OpenLibraryError
+from .conditional import CatalogConditionalMixin
+from .fast_serializers import FastBookListMixin
+from .fieldsets import SparseFieldsetViewMixin
+from .pagination import CatalogPagination
+from .response_cache import CachedResponseMixin
+from .textfiles import (
+    TranscodedTextFile, if_range_matches, parse_range_header, page_index_path, read_page,
+    find_precompressed,
+)
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,109 +23,206 @@ from rest_framework import status
 from django.contrib.auth import authenticate
 from django.http import JsonResponse, Http404
 from rest_framework.decorators import api_view
-import requests
 import os
 from django.conf import settings
-from django.http import FileResponse, HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from urllib.parse import quote
 from django.contrib.auth.decorators import login_required
 from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
 
-# Безопасная функция скачивания txt-файлов книг
+# Безопасная функция скачивания txt-файлов книг (потоковая, с поддержкой Range)
 def download_txt(request, path):
     try:
         # Безопасно формируем путь к файлу, чтобы избежать атак типа path traversal
         file_path = safe_join(settings.MEDIA_ROOT, 'books', path)
         if not os.path.exists(file_path):
             raise Http404("Файл не найден")
-
-        # Читаем как байты и перекодируем в UTF-8 для корректного отображения русских символов
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-
-        decoded_text = None
-        for encoding in ('utf-8-sig', 'utf-8', 'cp1251', 'windows-1251', 'koi8-r'):
-            try:
-                decoded_text = raw_data.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        if decoded_text is None:
-            decoded_text = raw_data.decode('latin-1', errors='replace')
-
-        response = HttpResponse(decoded_text, content_type='text/plain; charset=utf-8')
-        # Корректное имя файла (RFC 5987)
-        response['Content-Disposition'] = (
-            "inline; filename*=UTF-8''" + quote(os.path.basename(file_path))
+        text_file = precompressed = None
+        book = (
+            Book.objects.filter(file=f'books/{path}').exclude(text_file='')
+            .only('text_file', 'text_size', 'text_sha256').first()
         )
-        return response
+        if book and book.text_file and os.path.exists(book.text_file.path):
+            # Нормализованная при загрузке UTF-8 копия отдаётся без перекодирования
+            text_file = TranscodedTextFile(
+                book.text_file.path, encoding='utf-8', etag=f'"{book.text_sha256}"'
+            )
+            if not request.headers.get('Range'):
+                # Заранее сжатая при загрузке копия (gzip/br/zstd) - без сжатия на каждый запрос
+                precompressed = find_precompressed(book.text_file.path, request.headers.get('Accept-Encoding', ''))
+        else:
+            # Кодировка определяется по началу файла, текст перекодируется в UTF-8 по частям
+            text_file = TranscodedTextFile(file_path)
     except Exception:
         raise Http404("Ошибка доступа к файлу")
 
+    # Размер перекодируемого текста требует полного прохода по файлу - он нужен только для диапазонов
+    size = byte_range = None
+    if request.headers.get('Range') and if_range_matches(request.headers.get('If-Range'), text_file):
+        size = text_file.size
+        byte_range = parse_range_header(request.headers.get('Range'), size)
+
+    if precompressed:
+        encoding, compressed_path = precompressed
+        response = FileResponse(open(compressed_path, 'rb'), content_type='text/plain; charset=utf-8')
+        response['Content-Encoding'] = encoding
+        # Сжатое представление - отдельная сущность: свой ETag, диапазоны только для несжатого
+        response['Accept-Ranges'] = 'none'
+        response['ETag'] = f'"{book.text_sha256}-{encoding}"'
+    elif byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            text_file.iter_range(start, end), status=206, content_type='text/plain; charset=utf-8'
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        # Перекодируемый файл отдаётся сразу, без Content-Length (chunked): длина станет известна в конце
+        response = StreamingHttpResponse(text_file.iter_range(), content_type='text/plain; charset=utf-8')
+        if text_file.is_passthrough:
+            response['Content-Length'] = text_file.size
+
+    if not precompressed:
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = text_file.etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Last-Modified'] = text_file.last_modified
+    # Корректное имя файла (RFC 5987)
+    response['Content-Disposition'] = (
+        "inline; filename*=UTF-8''" + quote(os.path.basename(file_path))
+    )
+    return response
+
 # Корневой эндпоинт API (можно использовать для проверки работоспособности)
 def api_root(request):
     return JsonResponse({"message": "Welcome to the Online Library API"})
 
-# Поиск книг через OpenLibrary API по названию
+# Поиск книг через OpenLibrary API по названию (через общий клиент с пулом соединений и кешем)
 @api_view(['GET'])
 def find_openlibrary_books(request):
     title = request.GET.get('title')
     if not title:
         return Response({'error': 'Не указано название книги'}, status=400)
-    search_url = f'https://openlibrary.org/search.json?title={title}'
     try:
-        response = requests.get(search_url, timeout=5)
-        response.raise_for_status()
-        results = response.json().get('docs', [])
-        books = []
-        for book in results[:20]:  # Ограничиваем 20 результатами
-            books.append({
-                'title': book.get('title'),
-                'author': ', '.join(book.get('author_name', [])),
-                'year': book.get('first_publish_year'),
-                'cover_id': book.get('cover_i'),
-                'url': f"https://openlibrary.org{book.get('key')}",
-            })
-        return Response(books)
-    except Exception as e:
+        return Response(openlibrary.get_client().search_books(title))
+    except OpenLibraryError as e:
         return Response({'error': str(e)}, status=500)
 
+# Асинхронная версия поиска через OpenLibrary (для запуска под ASGI, см. online_library/asgi.py):
+# не блокирует воркер на время запроса и объединяет одновременные запросы одного названия
+async def find_openlibrary_books_async(request):
+    title = request.GET.get('title')
+    if not title:
+        return JsonResponse({'error': 'Не указано название книги'}, status=400, json_dumps_params={'ensure_ascii': False})
+    try:
+        # Под WSGI у каждого запроса свой цикл событий: клиент создаётся и закрывается на время запроса
+        async with openlibrary.async_client(shared=isinstance(request, ASGIRequest)) as client:
+            books = await client.search_books(title)
+    except OpenLibraryError as e:
+        return JsonResponse({'error': str(e)}, status=500, json_dumps_params={'ensure_ascii': False})
+    return JsonResponse(books, safe=False, json_dumps_params={'ensure_ascii': False})
+
 # ViewSet для работы с книгами (CRUD через router)
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+class BookViewSet(CatalogConditionalMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
+    queryset = Book.objects.select_related('author', 'genre')
     serializer_class = BookSerializer
+    cache_dependencies = (Book, Author, Genre, Review)
 
 # Список книг (GET) и создание книги (POST, только для админа)
-class BookListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Book.objects.all()
+class BookListCreateAPIView(CatalogConditionalMixin, CachedResponseMixin, FastBookListMixin, SparseFieldsetViewMixin,
+                            generics.ListCreateAPIView):
+    queryset = Book.objects.select_related('author', 'genre')
     serializer_class = BookSerializer
+    cache_dependencies = (Book, Author, Genre, Review)
+    pagination_class = CatalogPagination
+    # Для каждого фильтра есть составной индекс (фильтр, title, id), см. Book.Meta.indexes
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['author', 'genre', 'publication_year', 'isbn']
 
     def get_permissions(self):
         if self.request.method == 'POST':
             return [permissions.IsAdminUser()]
         return [permissions.AllowAny()]
-    
-    def create(self, request, *args, **kwargs):
-        print("BookListCreateAPIView.create called")
-        print("Request data:", request.data)
-        print("Request FILES:", request.FILES)
-        return super().create(request, *args, **kwargs)
 
 # Получение, обновление, удаление книги по id (PUT/PATCH/DELETE только для админа)
-class BookRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Book.objects.all()
+class BookRetrieveUpdateDestroyAPIView(CatalogConditionalMixin, CachedResponseMixin, SparseFieldsetViewMixin,
+                                       generics.RetrieveUpdateDestroyAPIView):
+    queryset = Book.objects.select_related('author', 'genre')
     serializer_class = BookSerializer
+    cache_dependencies = (Book, Author, Genre, Review)
 
     def get_permissions(self):
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
             return [permissions.IsAdminUser()]
         return [permissions.AllowAny()]
-    
-    def update(self, request, *args, **kwargs):
-        print("BookRetrieveUpdateDestroyAPIView.update called")
-        print("Request data:", request.data)
-        print("Request FILES:", request.FILES)
-        return super().update(request, *args, **kwargs)
+
+# Полнотекстовый поиск по каталогу с ранжированием и подсветкой совпадений
+class BookSearchAPIView(CatalogConditionalMixin, generics.GenericAPIView):
+    serializer_class = BookSearchResultSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Не указан поисковый запрос'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Пагинируем ранжированный список id, а книги и фрагменты загружаем только для страницы
+        hits = search.search_book_ids(query)
+        page = self.paginate_queryset(hits)
+        page_hits = page if page is not None else hits
+        ranks = dict(page_hits)
+        books = Book.objects.select_related('author', 'genre').in_bulk(list(ranks))
+        snippets = search.build_snippets(query, list(ranks))
+
+        results = []
+        for book_id, rank in page_hits:
+            book = books.get(book_id)
+            if book is None:
+                continue
+            book.rank = rank
+            book.highlight = snippets.get(book_id)
+            results.append(book)
+
+        serializer = self.get_serializer(results, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+# Через сколько секунд повторить запрос страницы, если индекс страниц ещё не построен
+PAGE_INDEX_RETRY_AFTER = 30
+
+# Одна страница текста книги для читалки (по индексу смещений, без чтения всего файла)
+class BookPageAPIView(CatalogConditionalMixin, APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk, page):
+        book = Book.objects.filter(pk=pk).only('text_file', 'text_pages').first()
+        if book is None:
+            raise Http404("Книга не найдена")
+        if not book.text_file:
+            return Response({'error': 'У книги нет текста для чтения'}, status=status.HTTP_404_NOT_FOUND)
+
+        text_path = book.text_file.path
+        if not os.path.exists(page_index_path(text_path)):
+            # Индекс строит только задача нормализации текста (library.tasks): чтение ничего не записывает
+            response = Response({'error': 'Текст книги ещё обрабатывается'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = PAGE_INDEX_RETRY_AFTER
+            return response
+
+        result = read_page(text_path, page)
+        if result is None:
+            return Response({'error': 'Страница не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        text, start, end, total_pages = result
+        serializer = BookPageSerializer({
+            'book': book.pk, 'page': page, 'total_pages': total_pages,
+            'start': start, 'end': end, 'text': text,
+        })
+        return Response(serializer.data)
 
 # Регистрация нового пользователя
 class RegisterView(APIView):
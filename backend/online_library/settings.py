@@ -47,8 +47,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Метрики запроса (library/metrics.py): первым, чтобы учитывать время всех остальных
+    'library.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Сжатие ответов: выше остальных, чтобы сжимать уже окончательное содержимое
+    'library.compression.CompressionMiddleware',
+    # Выбор реплики БД для чтения: до остальных, чтобы сессия и пользователь читались по тем же правилам
+    'library.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +100,28 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения (см. library/db_router.py): для PostgreSQL - host[:port] через запятую
+# (остальные параметры как у основной БД), для SQLite - пути к файлам
+DB_REPLICAS = [replica for replica in config('DB_REPLICAS', default='').split(',') if replica]
+for number, replica in enumerate(DB_REPLICAS, 1):
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        replica_settings = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        replica_settings = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], **replica_settings, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['library.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# Без реплик - зеркало основной БД для тестов маршрутизации (library.tests.ReplicaRoutingTests):
+# в DATABASE_REPLICAS не входит, поэтому вне тестов не используется и соединений не открывает
+if not DATABASE_REPLICAS:
+    DATABASES['replica_test'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+# Приложения, безопасные запросы к представлениям которых читают с реплик
+DATABASE_REPLICA_APPS = ['api', 'library']
+# Сколько секунд после записи клиент читает с основной БД (больше задержки репликации)
+DATABASE_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -157,6 +185,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 # Django REST Framework settings
+# Браузерный API DRF (HTML-страницы для отладки); в рабочем окружении выключен вместе с DEBUG
+API_BROWSABLE = config('API_BROWSABLE', default=DEBUG, cast=bool)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -172,12 +203,13 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # JSON через orjson (library/renderers.py); браузерный API - только при API_BROWSABLE
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'library.renderers.FastJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if API_BROWSABLE else []),
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'library.renderers.FastJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FileUploadParser',
@@ -227,6 +259,47 @@ CORS_ALLOW_METHODS = [
 # CORS preflight max age
 CORS_PREFLIGHT_MAX_AGE = 86400
 
+# OpenLibrary (поиск книг во внешнем каталоге, см. library/openlibrary.py)
+OPENLIBRARY_URL = config('OPENLIBRARY_URL', default='https://openlibrary.org')
+OPENLIBRARY_TIMEOUT = config('OPENLIBRARY_TIMEOUT', default=5, cast=float)
+OPENLIBRARY_POOL_SIZE = config('OPENLIBRARY_POOL_SIZE', default=10, cast=int)
+OPENLIBRARY_CONCURRENCY = config('OPENLIBRARY_CONCURRENCY', default=20, cast=int)  # одновременных запросов (async)
+OPENLIBRARY_CACHE_SIZE = config('OPENLIBRARY_CACHE_SIZE', default=1024, cast=int)
+OPENLIBRARY_CACHE_TTL = config('OPENLIBRARY_CACHE_TTL', default=600, cast=int)  # свежий ответ, сек
+OPENLIBRARY_STALE_TTL = config('OPENLIBRARY_STALE_TTL', default=3600, cast=int)  # устаревший, но допустимый
+OPENLIBRARY_NEGATIVE_TTL = config('OPENLIBRARY_NEGATIVE_TTL', default=30, cast=int)  # кеш ошибок
+
+# Кеш (по умолчанию в памяти процесса; для нескольких процессов - filebased или внешний сервер)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='online-library'),
+    }
+}
+
+# Кеш ответов API каталога (см. library/response_cache.py)
+RESPONSE_CACHE_ENABLED = config('RESPONSE_CACHE_ENABLED', default=True, cast=bool)
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)  # сек
+RESPONSE_CACHE_LOCK_TIMEOUT = config('RESPONSE_CACHE_LOCK_TIMEOUT', default=10, cast=int)  # блокировка вычисления ответа
+RESPONSE_CACHE_WAIT = config('RESPONSE_CACHE_WAIT', default=5, cast=float)  # ожидание чужого вычисления, сек
+
+# Быстрая сериализация списка книг из .values() (см. library/fast_serializers.py)
+BOOKS_FAST_SERIALIZER = config('BOOKS_FAST_SERIALIZER', default=True, cast=bool)
+
+# Фоновые задачи (см. library/jobs.py, обработчик: python manage.py runworker)
+# По умолчанию как DEBUG: при разработке задачи выполняются сразу, в рабочем окружении нужен runworker
+JOBS_EAGER = config('JOBS_EAGER', default=DEBUG, cast=bool)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=3, cast=int)
+JOBS_RETRY_BACKOFF = config('JOBS_RETRY_BACKOFF', default=10, cast=float)  # задержка первого повтора, сек
+JOBS_RETRY_BACKOFF_MAX = config('JOBS_RETRY_BACKOFF_MAX', default=3600, cast=float)
+JOBS_TIMEOUT = config('JOBS_TIMEOUT', default=1800, cast=int)  # после этого задача считается зависшей, сек
+
+# Сжатие ответов (см. library/compression.py); br и zstd - при установленных brotli и zstandard
+COMPRESSION_ENABLED = config('COMPRESSION_ENABLED', default=True, cast=bool)
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)  # меньшие ответы не сжимаются, байт
+COMPRESSION_ENCODINGS = config('COMPRESSION_ENCODINGS', default='zstd,br,gzip').split(',')  # порядок предпочтения
+
 # JWT settings
 from datetime import timedelta
 
@@ -256,3 +329,22 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
+
+# Метрики запросов (см. library/metrics.py): Server-Timing, /metrics для Prometheus, журнал медленных запросов
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')  # общий каталог для нескольких процессов
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1, cast=float)  # сек
+METRICS_SLOW_REQUEST_MS = config('METRICS_SLOW_REQUEST_MS', default=500, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # /metrics требует Authorization: Bearer; пусто - только при DEBUG
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'library.metrics': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -19,6 +19,7 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
+from library.metrics import metrics_view
 from library.views import download_txt
 
 def home_view(request):
@@ -47,6 +48,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),  # API endpoints
     path('api/', include('library.urls')),  # подключение маршрутов из приложения
+    path('metrics', metrics_view, name='metrics'),  # метрики для Prometheus
     # Обработка txt-файлов книг через представление с корректной кодировкой UTF-8
     re_path(r'^media/books/(?P<path>.*\.txt)$', download_txt, name='download_txt_root'),
 ]
@@ -52,7 +52,7 @@ function AdminDashboardPage() {
 
         // Загружаем последнюю активность
         try {
-          const reviewsRes = await apiService.getReviews();
+          const reviewsRes = await apiService.getReviews({ expand: 'book' });
           const recentReviews = (reviewsRes.results || reviewsRes).slice(0, 5);
           
           const activityData = recentReviews.map((review, index) => ({
@@ -20,7 +20,7 @@ function AdminReviewsPage() {
   const fetchReviews = async () => {
     setLoading(true);
     try {
-      const res = await apiService.getReviews();
+      const res = await apiService.getReviews({ expand: 'book' });
       setReviews(res.results || res || []);
     } catch (e) {
       message.error('Ошибка загрузки отзывов');
@@ -21,7 +21,7 @@ const AllReviewsPage = () => {
   const fetchReviews = async () => {
     try {
       setLoading(true);
-      const response = await apiService.getReviews();
+      const response = await apiService.getReviews({ expand: 'book' });
       console.log('Все отзывы:', response);
       console.log('Структура первого отзыва:', response.results?.[0] || response?.[0]);
       setReviews(response.results || response || []);
@@ -285,9 +285,9 @@ class ApiService {
     });
   }
 
-  // Мои отзывы
+  // Мои отзывы (с данными книг)
   async getMyReviews() {
-    return await this.request('/reviews/my_reviews/');
+    return await this.request('/reviews/my_reviews/?expand=book');
   }
 
   // === OPENLIBRARY ===
@@ -420,6 +420,22 @@ class ApiService {
     });
   }
 
+  // Добавить в избранное несколько книг
+  async addFavorites(bookIds) {
+    return await this.request('/user-favorites/bulk_add/', {
+      method: 'POST',
+      body: JSON.stringify({ book_ids: bookIds }),
+    });
+  }
+
+  // Удалить из избранного несколько книг
+  async removeFavorites(bookIds) {
+    return await this.request('/user-favorites/bulk_remove/', {
+      method: 'POST',
+      body: JSON.stringify({ book_ids: bookIds }),
+    });
+  }
+
   // Удалить книгу из избранного по ID записи
   async removeFromFavorites(favoriteId) {
     return await this.request(`/user-favorites/${favoriteId}/`, {